@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+'''
+--------------------------------------------------------------------------------
+Benchmark suite for the normalizeSpectra.py pipeline
+
+Writes synthetic objects (a power-law continuum with CIV emission, a broad
+absorption trough and noise, at z~2) as ascii spectra and *.card files of
+any size, then runs every stage of a normalization on them the way
+normalize()/plotNorm() do, timing each stage:
+
+parse      : parseCard()
+load       : loadSpectrum() of the ascii files (readAscii(), no cache)
+loadCached : loadSpectrum() from the binary cache (memory-mapped)
+restFrame  : toRestFrame()
+index      : WavelengthIndex of each spectrum and its RLF pixels
+yscale     : yScale()
+smooth     : smoothSpec() of each spectrum
+SNR        : calcSNR()
+fit        : fitObject(), the continuum fit of all spectra
+normalize  : normalizeSpec(), dividing by the continuum
+write      : writeNormSpec()
+plot       : the SpectraPlot and NormPlot of each object, drawn and saved
+
+The results (seconds per stage, per object, and pixels per second) are
+printed as a table and, with --json, written as JSON along with the
+configuration, the versions (git revision, python, numpy) and the date, so
+runs of different versions can be compared.
+
+To Run:
+----------
+
+$> ./benchmark.py [--npix 4000] [--nepoch 3] [--nobj 10] [--render preview]
+                  [--json results.json] [--dir workdir]
+
+HISTORY
+--------------------------------------------------------------------------------
+2026-10-17 - created
+--------------------------------------------------------------------------------
+'''
+#Libraries used
+import numpy as np
+import argparse
+import os
+import sys
+import time
+import json
+import shutil
+import tempfile
+import datetime
+import subprocess
+import normalizeSpectra as ns
+
+stages=['parse','load','loadCached','restFrame','index','yscale','smooth',
+        'SNR','fit','normalize','write','plot']
+
+def makeSpectrum(npix,zem,rng,lamRange=[3600.,10000.]):
+    '''
+    A synthetic observed-frame spectrum of npix pixels over lamRange, as an
+    npix x 3 (lambda,flux,flux_err) array: a power-law continuum, a
+    gaussian CIV emission line and a broad CIV absorption trough at
+    random velocity, with gaussian noise (SNR~10-30).
+    '''
+    lam=np.linspace(lamRange[0],lamRange[1],npix)
+    rest=lam/(1.+zem)
+    cont=rng.uniform(5,20)*(rest/1500.)**rng.uniform(-1.8,-1.2)
+    emission=1+rng.uniform(0.5,2)*np.exp(-0.5*((rest-1549.)/rng.uniform(10,20))**2)
+    centre=rng.uniform(1450,1520)
+    trough=1-rng.uniform(0.3,0.8)*np.exp(-0.5*((rest-centre)/rng.uniform(5,15))**2)
+    err=cont/rng.uniform(10,30)*np.ones(npix)
+    flux=cont*emission*trough+err*rng.standard_normal(npix)
+    return np.column_stack((lam,flux,err))
+
+def makeCards(outDir,nobj=10,nepoch=3,npix=4000,seed=42):
+    '''
+    Writes nobj synthetic objects (J000001.card ...) with nepoch spectra of
+    npix pixels each (labelled SDSS, BOSS, GEM1, GEM2, ...) to outDir.
+    Returns the list of card files.
+    '''
+    rng=np.random.RandomState(seed)
+    labels=['SDSS','BOSS']+['GEM'+str(i) for i in range(1,max(nepoch-1,1))]
+    cards=[]
+    for n in range(1,nobj+1):
+        name='J%06d' % n
+        zem=rng.uniform(1.9,2.1)
+        card=os.path.join(outDir,name+'.card')
+        with open(card,'w') as f:
+            f.write('SDSS %s.00+000000.0\n%.4f %.4f\n%.2f\n%.6f 0.001\n' % (
+                name,rng.uniform(0,360),rng.uniform(-10,60),rng.uniform(17,20),zem))
+            for e in range(nepoch):
+                path=os.path.join(outDir,name+'_'+labels[e]+'.txt')
+                with open(path,'w') as s:
+                    s.write(ns.formatRows(makeSpectrum(npix,zem,rng)))
+                f.write('%s %d %s\n' % (labels[e],52000+300*e,path))
+        cards.append(card)
+    return cards
+
+def revision():
+    '''
+    git revision of this directory, None if it is not a git checkout
+    '''
+    here=os.path.dirname(os.path.abspath(__file__))
+    try:
+        with open(os.devnull,'w') as null:
+            return subprocess.check_output(['git','describe','--always','--dirty'],
+                                           cwd=here,stderr=null).strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+def benchmarkCard(card,outDir,cacheDir,render='preview'):
+    '''
+    Runs every stage (see stages) on one card, returns {stage:seconds} and
+    the number of pixels of the object. render=None skips the plots.
+    '''
+    t={}
+    clock=[time.time()]
+    def lap(stage):
+        now=time.time()
+        t[stage]=t.get(stage,0.)+now-clock[0]
+        clock[0]=now
+
+    objInfo,paths,normFileList=ns.parseCard(card)
+    lap('parse')
+    spectra={}
+    for spec in paths:
+        spectra[spec]=ns.loadSpectrum(paths[spec],None)
+    lap('load')
+    for spec in paths:
+        ns.loadSpectrum(paths[spec],cacheDir) #writes the cached copy
+    clock[0]=time.time()
+    for spec in paths:
+        spectra[spec]=ns.loadSpectrum(paths[spec],cacheDir)
+    lap('loadCached')
+    ns.toRestFrame(spectra,objInfo['zem'])
+    lap('restFrame')
+    RLF=ns.normDefaults['RLF']
+    SNRreg=ns.normDefaults['SNRreg']
+    view=ns.SpectraView(spectra)
+    lamIndex={}
+    for spec in view:
+        lamIndex[spec]=ns.WavelengthIndex(view.lam(spec))
+        lamIndex[spec].indices(RLF)
+    lap('index')
+    yscale=ns.yScale(view,'SDSS',lamIndex)
+    lap('yscale')
+    for spec in view:
+        view.flux(spec,smooth=True)
+    lap('smooth')
+    for spec in view:
+        ns.calcSNR(view[spec],SNRreg,lamIndex[spec])
+    lap('SNR')
+    specList=sorted(view)
+    fits=ns.fitObject(view,specList,RLF,'plaw',lamIndex,smooth=True)
+    lap('fit')
+    normalized={}
+    for spec in specList:
+        normalized[spec]=ns.normalizeSpec(view[spec],view[spec],RLF,'plaw',SNRreg,
+                                          lamIndex[spec],fits[spec])[0]
+    lap('normalize')
+    for spec in specList:
+        ns.writeNormSpec(normalized[spec],os.path.join(outDir,os.path.basename(normFileList[spec])),
+                         objInfo['zem'])
+    lap('write')
+    if render is not None:
+        colours=dict((spec,c) for spec,c in zip(specList,['k','r','c','g','orange','m','b']*len(specList)))
+        plot=ns.SpectraPlot(view,colours,yscale,render)
+        plot.update(specList,True,normalized,1,RLF,[1100,1800],[0,40])
+        plot.save(os.path.join(outDir,'spectra'+objInfo['shortObjName']+'.eps'))
+        plot.close()
+        plot=ns.NormPlot(ns.SpectraView(normalized),colours,objInfo,render)
+        plot.update(specList,True,1.0,False,RLF,True,{},[1200,1600],[0,2.5])
+        plot.save(os.path.join(outDir,'norm'+objInfo['shortObjName']+'.eps'))
+        plot.close()
+        lap('plot')
+    return t,sum(len(spectra[spec]) for spec in spectra)
+
+def runBenchmark(npix=4000,nepoch=3,nobj=10,render='preview',workDir=None,seed=42):
+    '''
+    Makes the synthetic cards (in workDir, default a temporary directory
+    that is removed afterwards) and benchmarks each. Returns the results
+    dictionary (see the module docstring).
+    '''
+    tmp=workDir is None
+    if tmp:
+        workDir=tempfile.mkdtemp(prefix='normSpectra_bench')
+    elif not os.path.isdir(workDir):
+        os.makedirs(workDir)
+    try:
+        start=time.time()
+        cards=makeCards(workDir,nobj,nepoch,npix,seed)
+        makeTime=time.time()-start
+        if render is not None:
+            ns.pyplot('agg') #no GUI, the plots are only saved
+        totals=dict((stage,0.) for stage in stages)
+        perObject=[]
+        npixTotal=0
+        for card in cards:
+            t,n=benchmarkCard(card,workDir,os.path.join(workDir,'cache'),render)
+            for stage in t:
+                totals[stage]+=t[stage]
+            perObject.append(sum(t.values()))
+            npixTotal+=n
+    finally:
+        if tmp:
+            shutil.rmtree(workDir,ignore_errors=True)
+    results={'config':{'npix':npix,'nepoch':nepoch,'nobj':nobj,'render':render,'seed':seed},
+             'version':{'git':revision(),'python':sys.version.split()[0],'numpy':np.__version__},
+             'date':datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+             'makeCards':makeTime,
+             'pixels':npixTotal,
+             'stages':{},
+             'total':sum(totals.values()),
+             'perObject':{'mean':np.mean(perObject),'max':np.max(perObject)}}
+    for stage in stages:
+        if render is None and stage=='plot':
+            continue
+        results['stages'][stage]={'seconds':totals[stage],
+                                  'perObject':totals[stage]/nobj,
+                                  'pixelsPerSecond':npixTotal/totals[stage] if totals[stage]>0 else None}
+    return results
+
+def printResults(results):
+    c=results['config']
+    print 'normalizeSpectra benchmark (%s), %d objects x %d epochs x %d pixels' % (
+        results['version']['git'] or 'no git',c['nobj'],c['nepoch'],c['npix'])
+    print '%-11s %10s %12s %14s' % ('stage','total [s]','object [ms]','Mpix/s')
+    for stage in stages:
+        if stage in results['stages']:
+            r=results['stages'][stage]
+            rate='%14.2f' % (r['pixelsPerSecond']/1e6) if r['pixelsPerSecond'] else '%14s' % '-'
+            print '%-11s %10.4f %12.2f %s' % (stage,r['seconds'],1e3*r['perObject'],rate)
+    print '%-11s %10.4f %12.2f' % ('total',results['total'],1e3*results['perObject']['mean'])
+
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description='Benchmark the normalizeSpectra.py pipeline on synthetic spectra.')
+    parser.add_argument('--npix',type=int,default=4000,help='pixels per spectrum (default: %(default)s)')
+    parser.add_argument('--nepoch',type=int,default=3,help='spectra per object (default: %(default)s)')
+    parser.add_argument('--nobj',type=int,default=10,help='number of objects (default: %(default)s)')
+    parser.add_argument('--render',choices=['preview','eps','none'],default='preview',
+                        help='plots: preview (.png), eps (LaTeX) or none (default: %(default)s)')
+    parser.add_argument('--json',default=None,metavar='FILE',help='also write the results to FILE as JSON')
+    parser.add_argument('--dir',default=None,
+                        help='keep the synthetic cards and outputs here (default: a temporary directory)')
+    parser.add_argument('--seed',type=int,default=42,help='random seed of the synthetic spectra')
+    args=parser.parse_args()
+    results=runBenchmark(args.npix,args.nepoch,args.nobj,
+                         None if args.render=='none' else args.render,args.dir,args.seed)
+    printResults(results)
+    if args.json:
+        with open(args.json,'w') as f:
+            json.dump(results,f,indent=1,sort_keys=True)
+        print 'Wrote',args.json
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+'''
+--------------------------------------------------------------------------------
+Continuum fitting engine for normalizeSpectra.py
+
+Weighted least-squares fits of a power-law (y = a*x^b, fit as a straight line
+in log10-space) or a polynomial of any order. Every function accepts MANY data
+sets at once (e.g., the RLF pixels of all spectra of an object, or of many
+objects), which may all have different lengths. The normal equations of every
+data set are accumulated with np.add.reduceat and solved as one stack with
+np.linalg.solve, so fitting 1 or 1000 spectra costs a handful of array passes.
+
+Each fit returns its parameters and their covariance matrix. A data set that
+cannot be fit (too few pixels, all pixels at one x) returns NaNs rather than
+stopping the other fits.
+
+To Run (benchmark against jarTools.powerfit and np.polyfit):
+----------
+
+$> ./continuumFit.py [npix] [nspec]
+
+HISTORY
+--------------------------------------------------------------------------------
+2026-10-17 - created, replaces jarTools.powerfit and the first order
+             np.polyfit in normalizeSpectra.py
+           - powerfitBatch(maxDrop=) leaves out data sets that lost too
+             many pixels to y<=0
+--------------------------------------------------------------------------------
+'''
+#Libraries used
+import numpy as np
+import math
+
+def linfitBatch(xs,ys,errs=None,order=1):
+    '''
+    Weighted least-squares polynomial fit of the given order to many data sets.
+
+    xs,ys,errs : lists of 1-D arrays, one entry per data set.
+                 errs=None gives an unweighted fit (the same as np.polyfit).
+    returns coeffs (nset x order+1, highest power first, like np.polyfit)
+    and cov (nset x order+1 x order+1). With errs the covariance treats errs
+    as absolute 1-sigma errors, without them it is scaled by chi^2/dof.
+    '''
+    nset=len(xs)
+    k=order+1
+    npix=np.array([len(x) for x in xs])
+    group=np.repeat(np.arange(nset),npix)
+    starts=np.cumsum(npix)-npix
+    full=npix>0
+    def groupSum(v):
+        #sum of v over each data set (0 for empty data sets)
+        out=np.zeros(nset)
+        if np.any(full):
+            out[full]=np.add.reduceat(v,starts[full])
+        return out
+    x=np.concatenate([np.asarray(x,dtype=float) for x in xs]+[np.zeros(0)])
+    y=np.concatenate([np.asarray(y,dtype=float) for y in ys]+[np.zeros(0)])
+    if errs is None:
+        wt=np.ones(len(x))
+    else:
+        wt=1./np.concatenate([np.asarray(e,dtype=float) for e in errs]+[np.zeros(0)])**2
+
+    #centre and scale x of each data set, keeps the normal equations
+    #well conditioned for high orders and x ~ 1000s of Angstroms
+    sumw=groupSum(wt)
+    bad=(npix<k)|(sumw<=0)
+    sumw[bad]=1.
+    x0=groupSum(wt*x)/sumw
+    scale=np.sqrt(groupSum(wt*(x-x0[group])**2)/sumw)
+    if order>0:
+        bad|=(scale==0)
+    scale[scale==0]=1.
+    u=(x-x0[group])/scale[group]
+
+    #normal equations: M[s,i,j]=sum(w*u^(i+j)), r[s,i]=sum(w*u^i*y)
+    upow=[np.ones(len(u))]
+    for p in range(1,2*order+1):
+        upow.append(upow[-1]*u)
+    S=[groupSum(wt*up) for up in upow]
+    M=np.empty((nset,k,k))
+    for i in range(k):
+        for j in range(k):
+            M[:,i,j]=S[i+j]
+    r=np.empty((nset,k))
+    for i in range(k):
+        r[:,i]=groupSum(wt*upow[i]*y)
+    M[bad]=np.identity(k)
+    r[bad]=0.
+    c=np.linalg.solve(M,r[:,:,np.newaxis])[:,:,0]
+    covu=np.linalg.inv(M)
+    if errs is None:
+        model=np.zeros(len(u))
+        for i in range(k):
+            model+=c[group,i]*upow[i]
+        chi2=groupSum((y-model)**2)
+        dof=np.maximum(npix-k,1)
+        covu*=(chi2/dof)[:,np.newaxis,np.newaxis]
+
+    #back to powers of x: u^j=((x-x0)/scale)^j=sum_m C(j,m) x^m (-x0)^(j-m)/scale^j
+    T=np.zeros((nset,k,k))
+    for j in range(k):
+        for m in range(j+1):
+            binom=math.factorial(j)/(math.factorial(m)*math.factorial(j-m))
+            T[:,m,j]=binom*(-x0)**(j-m)/scale**j
+    coeffs=np.einsum('smj,sj->sm',T,c)
+    cov=np.einsum('smj,sjl,snl->smn',T,covu,T)
+    coeffs[bad]=np.nan
+    cov[bad]=np.nan
+    return coeffs[:,::-1],cov[:,::-1,::-1]
+
+def powerfitBatch(xs,ys,errs=None,maxDrop=None):
+    '''
+    Power-law fit, y = a*x^b, to many data sets, done as a weighted straight
+    line fit in log10-space. Pixels with x<=0 or y<=0 have no logarithm and
+    are left out. errs are carried into log-space as errs/(y*ln(10)).
+    Leaving out the y<=0 pixels biases a fit upwards, so with maxDrop (a
+    fraction) a data set that loses more than maxDrop of its pixels is not
+    fit (NaN), e.g. a low SNR Monte-Carlo realization.
+
+    returns params (nset x 2, [b,a], the same order as jarTools.powerfit)
+    and cov (nset x 2 x 2) of [b,a].
+    '''
+    lx,ly,le=[],[],[]
+    dropped=np.zeros(len(xs),dtype=bool)
+    for i in range(len(xs)):
+        x=np.asarray(xs[i],dtype=float)
+        y=np.asarray(ys[i],dtype=float)
+        good=(x>0)&(y>0)
+        if errs is not None:
+            e=np.asarray(errs[i],dtype=float)
+            good&=(e>0)
+            le.append(e[good]/(y[good]*np.log(10.)))
+        lx.append(np.log10(x[good]))
+        ly.append(np.log10(y[good]))
+        if maxDrop is not None:
+            dropped[i]=len(x)-np.count_nonzero(good)>maxDrop*len(x)
+    if errs is None:
+        le=None
+    coeffs,cov=linfitBatch(lx,ly,le,order=1)
+    coeffs[dropped]=np.nan
+    cov[dropped]=np.nan
+    a=10**coeffs[:,1]
+    params=np.column_stack((coeffs[:,0],a))
+    #d(a)/d(log10 a)=a*ln(10)
+    J=np.zeros((len(xs),2,2))
+    J[:,0,0]=1.
+    J[:,1,1]=a*np.log(10.)
+    cov=np.einsum('sij,sjk,slk->sil',J,cov,J)
+    return params,cov
+
+def polyfit(x,y,err=None,order=1):
+    '''
+    single data set version of linfitBatch(), returns coeffs,cov
+    '''
+    coeffs,cov=linfitBatch([x],[y],None if err is None else [err],order)
+    return coeffs[0],cov[0]
+
+def powerfit(x,y,err=None):
+    '''
+    single data set version of powerfitBatch(), returns [b,a],cov
+    '''
+    params,cov=powerfitBatch([x],[y],None if err is None else [err])
+    return params[0],cov[0]
+
+def benchmark(npix=300,nspec=1000):
+    '''
+    Times powerfitBatch()/linfitBatch() against a loop over jarTools.powerfit
+    and np.polyfit on synthetic power-law spectra (npix is the number of
+    pixels in the RLF windows of each spectrum), and prints the largest
+    relative difference between the two continua.
+    '''
+    import time
+    np.random.seed(42)
+    xs,ys,es=[],[],[]
+    for s in range(nspec):
+        lam=np.linspace(1250,1800,npix)
+        a=10**np.random.uniform(0,2)
+        b=np.random.uniform(-2.5,-0.5)
+        err=0.05*a*lam**b
+        xs.append(lam)
+        ys.append(a*lam**b+err*np.random.randn(npix))
+        es.append(err)
+    print 'benchmark: %d spectra of %d pixels' % (nspec,npix)
+
+    start=time.time()
+    params,cov=powerfitBatch(xs,ys,es)
+    tBatch=time.time()-start
+    print 'powerfitBatch    : %8.4fs' % tBatch
+    try:
+        import jarTools
+    except ImportError:
+        print 'jarTools.powerfit: jarTools not found, skipped'
+    else:
+        start=time.time()
+        old=[jarTools.powerfit(xs[s],ys[s],es[s]) for s in range(nspec)]
+        tOld=time.time()-start
+        diff=max(np.max(np.abs(params[s][1]*xs[s]**params[s][0]/(old[s][1]*xs[s]**old[s][0])-1))
+                 for s in range(nspec))
+        print 'jarTools.powerfit: %8.4fs (x%.1f), max relative continuum difference %.2e' % (tOld,tOld/tBatch,diff)
+
+    for order in [1,3]:
+        start=time.time()
+        coeffs,cov=linfitBatch(xs,ys,order=order)
+        tBatch=time.time()-start
+        start=time.time()
+        old=[np.polyfit(xs[s],ys[s],order) for s in range(nspec)]
+        tOld=time.time()-start
+        diff=max(np.max(np.abs(np.polyval(coeffs[s],xs[s])/np.polyval(old[s],xs[s])-1))
+                 for s in range(nspec))
+        print 'linfitBatch (order %d): %8.4fs, np.polyfit loop: %8.4fs (x%.1f), max relative continuum difference %.2e' % (order,tBatch,tOld,tOld/tBatch,diff)
+
+if __name__=='__main__':
+    import sys
+    args=map(int,sys.argv[1:3])
+    benchmark(*args)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+'''
+--------------------------------------------------------------------------------
+Multi-epoch spectra of one object on a common wavelength grid
+
+normalizeSpectra.py holds the spectra of an object as a dictionary of
+independent (lambda,flux,flux_err) arrays of different lengths. An EpochStack
+resamples all epochs onto one shared rest-frame grid, as 2-D arrays
+(epoch x pixel) of flux, flux_err and a mask of the pixels each epoch
+actually covers, so cross-epoch work is done with array operations instead
+of loops over the spectra:
+
+>>> import epochStack
+>>> stack=epochStack.EpochStack.fromCard('J000000.card')
+>>> ratio,ratioErr=stack.ratio('BOSS','SDSS')
+>>> stats=stack.variability()
+>>> normalized,fits=stack.normalize(RLF=[[1300,1320],[1590,1620],[1700,1750]])
+
+Epochs are ordered by MJD. Masked pixels hold NaN in flux and flux_err.
+The epochs are put on the grid with the flux-conserving rebinning of
+resample.py (with error propagation), or optionally by linear interpolation.
+
+HISTORY
+--------------------------------------------------------------------------------
+2026-10-17 - created
+           - resampling is flux-conserving (resample.rebinBatch, all
+             epochs in one call) by default, method='interp' is the
+             old linear interpolation
+--------------------------------------------------------------------------------
+'''
+#Libraries used
+import numpy as np
+import resample
+
+def commonGrid(lams,dlam=None,lo=None,hi=None,log=False):
+    '''
+    A wavelength grid covering all of lams (a list of wavelength arrays),
+    or lo to hi. The pixel size dlam defaults to the coarsest median pixel
+    size of lams, so no epoch is sampled finer than it was observed. With
+    log=True the pixels are of constant dlam/lambda (i.e., velocity) instead.
+    '''
+    lams=[np.asarray(l,dtype=float) for l in lams if len(l)>1]
+    if lo is None:
+        lo=min(l.min() for l in lams)
+    if hi is None:
+        hi=max(l.max() for l in lams)
+    if log:
+        if dlam is None:
+            dlam=max(np.median(np.abs(np.diff(np.log(l)))) for l in lams)
+        else:
+            dlam=dlam/(0.5*(lo+hi))
+        n=int(np.floor(np.log(hi/lo)/dlam))+1
+        return lo*np.exp(dlam*np.arange(n))
+    if dlam is None:
+        dlam=max(np.median(np.abs(np.diff(l))) for l in lams)
+    n=int(np.floor((hi-lo)/dlam))+1
+    return lo+dlam*np.arange(n)
+
+def interpolate(lam,flux,flux_err,grid):
+    '''
+    Linear interpolation of one spectrum onto grid. Returns flux, flux_err
+    and the mask of the grid pixels inside the spectrum's coverage (with
+    finite flux and flux_err>0 on both sides), NaN outside of it.
+    flux_err is interpolated as well, i.e., the noise averaging of
+    interpolating between pixels is not propagated.
+    '''
+    order=np.argsort(lam,kind='mergesort')
+    lam,flux,flux_err=lam[order],flux[order],flux_err[order]
+    good=np.isfinite(flux)&np.isfinite(flux_err)&(flux_err>0)
+    newFlux=np.interp(grid,lam,flux)
+    newErr=np.interp(grid,lam,flux_err)
+    #a grid pixel is good if both spectrum pixels it lies between are
+    right=np.clip(np.searchsorted(lam,grid),1,len(lam)-1)
+    mask=(grid>=lam[0])&(grid<=lam[-1])&good[right]&good[right-1]
+    newFlux[~mask]=np.nan
+    newErr[~mask]=np.nan
+    return newFlux,newErr,mask
+
+class EpochStack(object):
+    '''
+    The spectra{label:(lambda,flux,flux_err) array} of one object on a
+    common grid (default commonGrid() of all of them). mjds{label:MJD}
+    orders the epochs (default: by label), zem is the redshift (only used
+    by deltaT()). method is 'rebin' (flux-conserving, see resample.py) or
+    'interp' (linear interpolation, see interpolate()).
+
+    epochs : the labels, in MJD order
+    mjd    : array of the MJDs (NaN if not given)
+    lam    : the grid (npix)
+    flux, err, mask : nepoch x npix arrays
+    '''
+    def __init__(self,spectra,mjds=None,grid=None,zem=0.,method='rebin'):
+        if mjds is None:
+            mjds={}
+        self.epochs=sorted(spectra,key=lambda spec:(mjds.get(spec,np.inf),spec))
+        self.mjd=np.array([mjds.get(spec,np.nan) for spec in self.epochs],dtype=float)
+        self.zem=zem
+        if grid is None:
+            grid=commonGrid([spectra[spec][:,0] for spec in self.epochs])
+        self.lam=np.asarray(grid,dtype=float)
+        data=[np.asarray(spectra[spec],dtype=float) for spec in self.epochs]
+        if method=='rebin':
+            self.flux,self.err,self.mask=resample.rebinBatch([d[:,0] for d in data],
+                                                             [d[:,1] for d in data],
+                                                             [d[:,2] for d in data],self.lam)
+        elif method=='interp':
+            shape=(len(self.epochs),len(self.lam))
+            self.flux=np.zeros(shape)
+            self.err=np.zeros(shape)
+            self.mask=np.zeros(shape,dtype=bool)
+            for i,d in enumerate(data):
+                self.flux[i],self.err[i],self.mask[i]=interpolate(d[:,0],d[:,1],d[:,2],self.lam)
+        else:
+            raise ValueError('Do not recognize resampling method: '+str(method))
+
+    @classmethod
+    def fromCard(cls,cardFile,grid=None,cacheDir=None,method='rebin'):
+        '''
+        The rest-frame stack of the spectra listed in a *.card file (see
+        normalizeSpectra.readCard(), cacheDir=None: no spectrum cache)
+        '''
+        import normalizeSpectra
+        objInfo,spectra,normFileList=normalizeSpectra.readCard(cardFile,cacheDir)
+        normalizeSpectra.toRestFrame(spectra,objInfo['zem'])
+        mjds=dict((spec,objInfo[spec]) for spec in spectra)
+        return cls(spectra,mjds,grid,objInfo['zem'],method)
+
+    def index(self,epoch):
+        '''
+        row of epoch (a label or a row number) in flux/err/mask
+        '''
+        if isinstance(epoch,str):
+            return self.epochs.index(epoch)
+        return epoch
+
+    def window(self,x1,x2):
+        '''
+        boolean array of the grid pixels with x1 < lambda < x2
+        '''
+        return (self.lam>x1)&(self.lam<x2)
+
+    def deltaT(self):
+        '''
+        rest-frame days between each epoch and the previous one (0 for the
+        first), as labelled in normalizeSpectra's plots
+        '''
+        dt=np.zeros(len(self.epochs))
+        dt[1:]=np.diff(self.mjd)/(1+self.zem)
+        return dt
+
+    def ratio(self,epoch1,epoch2):
+        '''
+        flux ratio epoch1/epoch2 and its error, NaN where either is masked
+        '''
+        i,j=self.index(epoch1),self.index(epoch2)
+        ratio=self.flux[i]/self.flux[j]
+        ratioErr=np.abs(ratio)*np.sqrt((self.err[i]/self.flux[i])**2+(self.err[j]/self.flux[j])**2)
+        return ratio,ratioErr
+
+    def difference(self,epoch1,epoch2):
+        '''
+        flux difference epoch1-epoch2 and its error, NaN where either is masked
+        '''
+        i,j=self.index(epoch1),self.index(epoch2)
+        return self.flux[i]-self.flux[j],np.hypot(self.err[i],self.err[j])
+
+    def variability(self):
+        '''
+        Per-pixel variability statistics over the epochs that cover each
+        pixel, as a dictionary of npix arrays:
+        n     : number of epochs
+        mean  : inverse-variance weighted mean flux
+        std   : standard deviation of the flux
+        chi2  : chi^2 of the epochs about the weighted mean (chi2/(n-1) >> 1
+                means the pixel varied more than its errors allow)
+        maxdev: largest |flux-mean|/flux_err of any epoch
+        '''
+        w=np.where(self.mask,1./np.where(self.mask,self.err,1.)**2,0.)
+        flux=np.where(self.mask,self.flux,0.)
+        n=self.mask.sum(axis=0)
+        with np.errstate(invalid='ignore',divide='ignore'):
+            mean=(w*flux).sum(axis=0)/w.sum(axis=0)
+            dev=np.where(self.mask,(flux-mean)*np.sqrt(w),0.)
+            chi2=(dev**2).sum(axis=0)
+            std=np.sqrt((np.where(self.mask,(flux-flux.sum(axis=0)/n)**2,0.)).sum(axis=0)/n)
+        return {'n':n,'mean':mean,'std':std,'chi2':chi2,
+                'maxdev':np.abs(dev).max(axis=0) if len(self.epochs) else dev}
+
+    def normalize(self,RLF,funcType='plaw'):
+        '''
+        Fits the continuum of every epoch to its RLF windows in one batched
+        call (see normalizeSpectra.fitContinua) and returns a new EpochStack
+        of the normalized spectra, plus the fit parameters of each epoch.
+        Raises ValueError naming the epoch if one can not be fit.
+        '''
+        import normalizeSpectra
+        inRLF=np.zeros(len(self.lam),dtype=bool)
+        for r in RLF:
+            inRLF|=self.window(r[0],r[1])
+        use=self.mask&inRLF
+        fits,covs=normalizeSpectra.fitContinua([self.lam[u] for u in use],
+                                               [self.flux[i][u] for i,u in enumerate(use)],
+                                               [self.err[i][u] for i,u in enumerate(use)],
+                                               funcType)
+        normalized=self.copy()
+        for i,spec in enumerate(self.epochs):
+            if not np.all(np.isfinite(fits[i])):
+                raise ValueError('Could not fit the continuum of -'+spec+'-, too few pixels in the RLF windows.')
+            yfit=normalizeSpectra.continuum(fits[i],self.lam,funcType)
+            normalized.flux[i]=self.flux[i]/yfit
+            normalized.err[i]=self.err[i]/yfit
+        return normalized,dict(zip(self.epochs,fits))
+
+    def copy(self):
+        new=object.__new__(self.__class__)
+        new.__dict__.update(self.__dict__)
+        for name in ['epochs','mjd','lam','flux','err','mask']:
+            value=getattr(self,name)
+            setattr(new,name,list(value) if isinstance(value,list) else value.copy())
+        return new
+
+    def toSpectra(self):
+        '''
+        back to a spectra{label:(lambda,flux,flux_err) array} dictionary,
+        without the masked pixels
+        '''
+        spectra={}
+        for i,spec in enumerate(self.epochs):
+            m=self.mask[i]
+            spectra[spec]=np.column_stack((self.lam[m],self.flux[i][m],self.err[i][m]))
+        return spectra
@@ -0,0 +1,459 @@
+#!/usr/bin/env python
+'''
+--------------------------------------------------------------------------------
+Parameter and results database for normalizeSpectra.py
+
+One SQLite file (default normSpectra.db, in the working directory) holds the
+normalization ('norm') and plotting ('plot') parameters and the measured
+signal-to-noise ratios of every object, replacing the normJHHMMSS.parm,
+plotJHHMMSS.parm, SNR_outfile.dat and lowSNR_outfile.dat files:
+
+parms  : every saved parameter set (object, kind, time, parameters as JSON),
+         indexed by object/kind/time, i.e., the full history.
+latest : the most recent parameter set of each object/kind, so looking up
+         the parameters to re-use is a single primary key lookup.
+snr    : the median SNR of each spectrum, one row per (object, spectrum,
+         SNR region), re-normalizing replaces the row. Indexed by SNR, so
+         e.g. all spectra with SNR<=6 is a quick query.
+jobs   : the queue of --batch --queue runs, one row per card file (by its
+         absolute path) with the working directory it was queued from
+         (the card's relative spectrum paths and the normalized spectra
+         are resolved against it), its status (pending, running, done or
+         failed), the worker (host:pid) that claimed it and when, the
+         number of attempts, times and error. Claiming a job is one
+         transaction, so no two workers get the same card.
+
+Each save is one transaction, and every call opens its own connection, so
+many processes (e.g., --batch workers) may use the same file at once.
+
+To Run:
+----------
+print the parameter history of objects:
+$> ./normDB.py [--db normSpectra.db] [J000000 ...]
+
+list the spectra with SNR<=6 (--snr alone lists all SNRs):
+$> ./normDB.py --snr --maxsnr 6 [J000000 ...]
+
+write the SNRs in the old SNR_outfile.dat format (one line per object):
+$> ./normDB.py --export SNR_outfile.dat [--maxsnr 6]
+
+print the job queue (counts, and the failed jobs with their errors):
+$> ./normDB.py --jobs
+
+HISTORY
+--------------------------------------------------------------------------------
+2026-10-17 - created, replaces the append-only *.parm files
+           - added the snr table, replaces SNR_outfile.dat and
+             lowSNR_outfile.dat
+           - NaN SNRs (SNRreg not covered) are saved as NULL and
+             read back, printed and exported as nan
+           - added the jobs table, a resumable queue of card files
+             for --batch --queue
+           - jobs keep the directory they were queued from and the
+             time they were claimed, jobs claimed longer ago than
+             requeueJobs(stale=) are re-queued whatever the host
+--------------------------------------------------------------------------------
+'''
+#Libraries used
+import sqlite3
+import json
+import datetime
+import socket
+import os
+import math
+import time
+
+defaultDB='normSpectra.db'
+
+class NormDB(object):
+    '''
+    The parameter and SNR database in the SQLite file path (created if
+    needed).
+    '''
+    timeout=60. #seconds to wait for another process' write to finish
+
+    def __init__(self,path=defaultDB):
+        self.path=path
+        conn=self.connect()
+        try:
+            with conn:
+                conn.execute('''CREATE TABLE IF NOT EXISTS parms
+                                (id INTEGER PRIMARY KEY, obj TEXT, kind TEXT,
+                                 time TEXT, parms TEXT)''')
+                conn.execute('''CREATE INDEX IF NOT EXISTS parmsObj
+                                ON parms (obj,kind,time)''')
+                conn.execute('''CREATE TABLE IF NOT EXISTS latest
+                                (obj TEXT, kind TEXT, id INTEGER,
+                                 PRIMARY KEY (obj,kind))''')
+                conn.execute('''CREATE TABLE IF NOT EXISTS snr
+                                (obj TEXT, name TEXT, spec TEXT, SNRlo REAL,
+                                 SNRhi REAL, snr REAL, mjd REAL, time TEXT,
+                                 PRIMARY KEY (obj,spec,SNRlo,SNRhi))''')
+                conn.execute('CREATE INDEX IF NOT EXISTS snrValue ON snr (snr)')
+                conn.execute('''CREATE TABLE IF NOT EXISTS jobs
+                                (card TEXT PRIMARY KEY, status TEXT,
+                                 worker TEXT, attempts INTEGER, started TEXT,
+                                 finished TEXT, seconds REAL, error TEXT,
+                                 dir TEXT, claimed REAL)''')
+                #jobs tables of older databases lack dir and claimed
+                columns=[row[1] for row in conn.execute('PRAGMA table_info(jobs)')]
+                for column,kind in [('dir','TEXT'),('claimed','REAL')]:
+                    if column not in columns:
+                        conn.execute('ALTER TABLE jobs ADD COLUMN '+column+' '+kind)
+                conn.execute('CREATE INDEX IF NOT EXISTS jobsStatus ON jobs (status)')
+        finally:
+            conn.close()
+
+    def connect(self):
+        return sqlite3.connect(self.path,timeout=self.timeout)
+
+    def saveParms(self,obj,kind,parms,time=None):
+        '''
+        Adds the parameter dictionary parms (anything JSON can hold) of object
+        obj (e.g., J000000) as the latest of its kind ('norm' or 'plot').
+        Returns the time stamp it was saved with.
+        '''
+        if time is None:
+            time=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        conn=self.connect()
+        try:
+            with conn:
+                cur=conn.execute('INSERT INTO parms (obj,kind,time,parms) VALUES (?,?,?,?)',
+                                 (obj,kind,time,json.dumps(parms,sort_keys=True)))
+                conn.execute('INSERT OR REPLACE INTO latest (obj,kind,id) VALUES (?,?,?)',
+                             (obj,kind,cur.lastrowid))
+        finally:
+            conn.close()
+        return time
+
+    def latestParms(self,obj,kind):
+        '''
+        The most recent (time,parms) of object obj and kind, None if there
+        are none.
+        '''
+        conn=self.connect()
+        try:
+            row=conn.execute('''SELECT parms.time,parms.parms FROM latest
+                                JOIN parms ON parms.id=latest.id
+                                WHERE latest.obj=? AND latest.kind=?''',
+                             (obj,kind)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return str(row[0]),loads(row[1])
+
+    def parmHistory(self,obj=None,kind=None,since=None):
+        '''
+        All saved parameter sets as a list of (obj,kind,time,parms), oldest
+        first, optionally only those of object obj, of kind, and/or saved at
+        or after the time stamp since ('YYYY-MM-DD HH:MM:SS', or the start of
+        one).
+        '''
+        query='SELECT obj,kind,time,parms FROM parms'
+        where,values=[],[]
+        for column,value,test in [('obj',obj,'=?'),('kind',kind,'=?'),('time',since,'>=?')]:
+            if value is not None:
+                where.append(column+test)
+                values.append(value)
+        if where:
+            query+=' WHERE '+' AND '.join(where)
+        conn=self.connect()
+        try:
+            rows=conn.execute(query+' ORDER BY time,id',values).fetchall()
+        finally:
+            conn.close()
+        return [(str(o),str(k),str(t),loads(p)) for o,k,t,p in rows]
+
+    def saveSNR(self,obj,name,SNRreg,SNRs,mjds={},time=None):
+        '''
+        Saves the SNRs{spectrum:SNR} measured over SNRreg=[x1,x2] of object
+        obj (e.g., J000000, full name name), replacing any earlier SNRs of
+        the same spectra and region. mjds{spectrum:MJD} is optional.
+        A NaN SNR (SNRreg not covered by the spectrum) is saved as NULL,
+        querySNR() gives it back as NaN.
+        '''
+        if time is None:
+            time=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        rows=[(obj,name,spec,float(SNRreg[0]),float(SNRreg[1]),
+               None if math.isnan(SNRs[spec]) else float(SNRs[spec]),
+               mjds.get(spec),time) for spec in SNRs]
+        conn=self.connect()
+        try:
+            with conn:
+                conn.executemany('INSERT OR REPLACE INTO snr VALUES (?,?,?,?,?,?,?,?)',rows)
+        finally:
+            conn.close()
+
+    def querySNR(self,maxSNR=None,minSNR=None,obj=None,spec=None):
+        '''
+        The saved SNRs as a list of dictionaries (obj, name, spec, SNRreg,
+        snr, mjd, time), sorted by object and spectrum, optionally only
+        those with snr<=maxSNR, snr>=minSNR, of object obj and/or spectrum
+        spec.
+        '''
+        query='SELECT obj,name,spec,SNRlo,SNRhi,snr,mjd,time FROM snr'
+        where,values=[],[]
+        for column,value,test in [('snr',maxSNR,'<=?'),('snr',minSNR,'>=?'),
+                                  ('obj',obj,'=?'),('spec',spec,'=?')]:
+            if value is not None:
+                where.append(column+test)
+                values.append(value)
+        if where:
+            query+=' WHERE '+' AND '.join(where)
+        conn=self.connect()
+        try:
+            rows=conn.execute(query+' ORDER BY obj,spec,SNRlo,SNRhi',values).fetchall()
+        finally:
+            conn.close()
+        return [{'obj':str(o),'name':str(n),'spec':str(s),'SNRreg':[lo,hi],
+                 'snr':float('nan') if snr is None else snr,'mjd':mjd,'time':str(t)}
+                for o,n,s,lo,hi,snr,mjd,t in rows]
+
+    def addJobs(self,cards,workDir=None):
+        '''
+        Queues the card files cards, skipping those already in the queue
+        whatever their status. Jobs are keyed on the absolute path of the
+        card and keep workDir (default: the working directory), what the
+        card's relative paths are relative to, so a queue can be resumed
+        from any working directory. Returns the number added.
+        '''
+        workDir=os.path.abspath(workDir or os.getcwd())
+        conn=self.connect()
+        try:
+            with conn:
+                before=conn.total_changes
+                conn.executemany('''INSERT OR IGNORE INTO jobs (card,status,attempts,dir)
+                                    VALUES (?,'pending',0,?)''',
+                                 [(os.path.abspath(card),workDir) for card in cards])
+                added=conn.total_changes-before
+        finally:
+            conn.close()
+        return added
+
+    def claimJob(self,worker=None):
+        '''
+        Marks the oldest pending job as running by worker (default: this
+        process, host:pid) and returns its card and the directory it was
+        queued from (None for jobs of older databases), None if nothing is
+        pending. The select and update are one (immediate) transaction, so
+        two workers can never claim the same card.
+        '''
+        if worker is None:
+            worker=workerName()
+        conn=self.connect()
+        conn.isolation_level=None #transactions by hand
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row=conn.execute('''SELECT card,dir FROM jobs WHERE status='pending'
+                                ORDER BY rowid LIMIT 1''').fetchone()
+            if row is not None:
+                conn.execute('''UPDATE jobs SET status='running',worker=?,started=?,
+                                claimed=?,attempts=attempts+1,finished=NULL,
+                                seconds=NULL,error='' WHERE card=?''',
+                             (worker,now(),time.time(),row[0]))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return str(row[0]),None if row[1] is None else str(row[1])
+
+    def finishJob(self,card,ok,seconds=None,error='',worker=None):
+        '''
+        Marks the job of card done (ok=True) or failed, with its run time
+        [s] and error message. Only if it is still running by worker
+        (default: this process), a stale job may have been re-queued and
+        claimed by another worker since. Returns True if the job was marked.
+        '''
+        if worker is None:
+            worker=workerName()
+        conn=self.connect()
+        try:
+            with conn:
+                changed=conn.execute('''UPDATE jobs SET status=?,finished=?,seconds=?,error=?
+                                        WHERE card=? AND status='running' AND worker=?''',
+                                     ('done' if ok else 'failed',now(),seconds,error,
+                                      card,worker)).rowcount
+        finally:
+            conn.close()
+        return changed>0
+
+    def requeueJobs(self,failed=False,stale=None):
+        '''
+        Puts the jobs left running by workers of this host that no longer
+        exist (i.e., a killed run) back in the queue, and with failed=True
+        the failed jobs as well. Whether a worker of another host is alive
+        can not be checked, so with stale [s] every job claimed more than
+        stale seconds ago (by any host) is re-queued too.
+        Returns the number of jobs re-queued.
+        '''
+        conn=self.connect()
+        try:
+            rows=conn.execute('''SELECT card,worker,claimed FROM jobs
+                                  WHERE status='running' ''').fetchall()
+            cards=[card for card,worker,claimed in rows if not workerAlive(worker)
+                   or (stale is not None and time.time()-(claimed or 0)>stale)]
+            with conn:
+                before=conn.total_changes
+                conn.executemany('''UPDATE jobs SET status='pending' WHERE card=?
+                                    AND status='running' ''',[(card,) for card in cards])
+                if failed:
+                    conn.execute("UPDATE jobs SET status='pending' WHERE status='failed'")
+                requeued=conn.total_changes-before
+        finally:
+            conn.close()
+        return requeued
+
+    def jobCounts(self):
+        '''
+        The number of jobs of each status, {status:n}
+        '''
+        conn=self.connect()
+        try:
+            rows=conn.execute('SELECT status,COUNT(*) FROM jobs GROUP BY status').fetchall()
+        finally:
+            conn.close()
+        counts=dict((status,0) for status in ['pending','running','done','failed'])
+        counts.update((str(status),n) for status,n in rows)
+        return counts
+
+    def queryJobs(self,status=None):
+        '''
+        The jobs as a list of dictionaries (card, status, worker, attempts,
+        started, finished, seconds, error, dir, claimed) in queue order,
+        optionally only those of status.
+        '''
+        query='SELECT card,status,worker,attempts,started,finished,seconds,error,dir,claimed FROM jobs'
+        values=[]
+        if status is not None:
+            query+=' WHERE status=?'
+            values.append(status)
+        conn=self.connect()
+        try:
+            rows=conn.execute(query+' ORDER BY rowid',values).fetchall()
+        finally:
+            conn.close()
+        keys=['card','status','worker','attempts','started','finished','seconds','error','dir','claimed']
+        return [dict(zip(keys,[str(v) if isinstance(v,unicode) else v for v in row]))
+                for row in rows]
+
+def now():
+    return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+def workerName():
+    '''
+    host:pid of this process, how the jobs table names workers
+    '''
+    return socket.gethostname()+':'+str(os.getpid())
+
+def workerAlive(worker):
+    '''
+    False if worker (host:pid) is a process of this host that no longer
+    exists, True otherwise (including workers of other hosts)
+    '''
+    host,sep,pid=(worker or '').rpartition(':')
+    if host!=socket.gethostname():
+        return bool(host)
+    try:
+        os.kill(int(pid),0)
+    except OSError as e:
+        return e.errno==1 #EPERM: exists, but not ours
+    except ValueError:
+        return False
+    return True
+
+def loads(text):
+    '''
+    json.loads, with str instead of unicode strings
+    '''
+    def toStr(value):
+        if isinstance(value,unicode):
+            return str(value)
+        if isinstance(value,list):
+            return [toStr(v) for v in value]
+        if isinstance(value,dict):
+            return dict((toStr(k),toStr(v)) for k,v in value.items())
+        return value
+    return toStr(json.loads(text))
+
+def printHistory(db,objs=None):
+    '''
+    Prints the parameter history of the objects objs (default: all objects)
+    '''
+    rows=[]
+    for obj in objs or [None]:
+        rows.extend(db.parmHistory(obj))
+    if not rows:
+        print 'No parameters saved in',db.path
+    for obj,kind,time,parms in rows:
+        print obj,kind,time,' '.join(k+'='+str(parms[k]) for k in sorted(parms))
+
+def printSNR(db,objs=None,maxSNR=None,minSNR=None):
+    '''
+    Prints the saved SNRs of the objects objs (default: all objects) with
+    minSNR<=snr<=maxSNR, nan where SNRreg was not covered
+    '''
+    rows=[]
+    for obj in objs or [None]:
+        rows.extend(db.querySNR(maxSNR,minSNR,obj))
+    if not rows:
+        print 'No SNRs found in',db.path
+    for r in rows:
+        print '%s %-6s %7.1f %7.1f %10.4f %s' % (r['obj'],r['spec'],r['SNRreg'][0],
+                                                 r['SNRreg'][1],r['snr'],r['time'])
+
+def printJobs(db):
+    '''
+    Prints the number of jobs of each status and the failed jobs
+    '''
+    counts=db.jobCounts()
+    print ' '.join('%s=%d' % (status,counts[status]) for status in
+                   ['pending','running','done','failed'])
+    for job in db.queryJobs('running'):
+        print 'running',job['card'],job['worker'],job['started']
+    for job in db.queryJobs('failed'):
+        print 'failed ',job['card'],'--',job['error']
+
+def exportSNR(db,outFile,maxSNR=None):
+    '''
+    Writes the saved SNRs in the old SNR_outfile.dat format, one line per
+    object and SNR region: name x1 x2 spec1 SNR1 spec2 SNR2 ...
+    With maxSNR only objects with a spectrum of snr<=maxSNR are written
+    (i.e., the old lowSNR_outfile.dat is maxSNR=6). SNRs that could not be
+    measured are written as nan, as the old files had them.
+    '''
+    lines={}
+    for r in db.querySNR():
+        key=(r['obj'],r['SNRreg'][0],r['SNRreg'][1])
+        if key not in lines:
+            lines[key]=[r['name']+' '+str(r['SNRreg'][0])+' '+str(r['SNRreg'][1]),False]
+        lines[key][0]+=' '+r['spec']+' '+repr(r['snr'])
+        if maxSNR is not None and r['snr']<=maxSNR:
+            lines[key][1]=True
+    with open(outFile,'w') as f:
+        for key in sorted(lines):
+            if maxSNR is None or lines[key][1]:
+                f.write(lines[key][0]+'\n')
+
+if __name__=='__main__':
+    import argparse
+    parser=argparse.ArgumentParser(description='Print the saved parameters and SNRs of normalizeSpectra.py.')
+    parser.add_argument('objs',nargs='*',help='object names, e.g. J000000 (default: all)')
+    parser.add_argument('--db',default=defaultDB,help='database file (default: %(default)s)')
+    parser.add_argument('--snr',action='store_true',help='print SNRs instead of parameters')
+    parser.add_argument('--maxsnr',type=float,default=None,help='only SNRs <= maxsnr')
+    parser.add_argument('--minsnr',type=float,default=None,help='only SNRs >= minsnr')
+    parser.add_argument('--export',default=None,metavar='FILE',
+                        help='write the SNRs to FILE in the SNR_outfile.dat format')
+    parser.add_argument('--jobs',action='store_true',help='print the --batch --queue job queue')
+    args=parser.parse_args()
+    db=NormDB(args.db)
+    if args.jobs:
+        printJobs(db)
+    elif args.export:
+        exportSNR(db,args.export,args.maxsnr)
+    elif args.snr or args.maxsnr is not None or args.minsnr is not None:
+        printSNR(db,args.objs,args.maxsnr,args.minsnr)
+    else:
+        printHistory(db,args.objs)
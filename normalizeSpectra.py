@@ -32,6 +32,10 @@ To Run:
 
 $> ./normalizeSpectra.py JHHMMSS.card
 
+or, to normalize many objects without any user input (see --batch below):
+
+$> ./normalizeSpectra.py --batch J*.card --nproc 4
+
 The *.card file is both the list of raw spectra and where the major Information
 of the object is held. In order for these code to run the *.card file must
 be structured in the following way:
@@ -55,6 +59,130 @@ The *.card file may have an arbitrary number of raw spectra for normalization
 but the first four lines MUST be name/RA DEC/gmag/redshift.
 The raw spectra lines MUST be label/MJD/path (space separated).
 
+Batch mode:
+----------
+With --batch every given *.card file (or glob pattern) is normalized without
+any plotting or user input. Each object uses its latest normalization
+parameters (see Parameters below) if it has any, otherwise the normalize()
+defaults.
+The cards are spread over --nproc worker processes (default: all cores), the
+wall time of each object is reported, and an object that fails (bad card,
+bad spectrum shape, etc.) is reported without stopping the rest of the run.
+
+With --batch --stream the spectra are never loaded whole: each ascii file is
+read twice, --chunk rows (default 100000) at a time, first keeping only the
+pixels of the RLF windows and SNRreg (for the fit and the SNR), then dividing
+each chunk by the continuum and writing it out. Peak memory is set by --chunk,
+not by the length of the spectra. The output is the same as without --stream.
+
+With --batch --queue the cards go through a job queue in the --db database
+instead: each worker claims the next pending card, normalizes it and marks
+it done (or failed). Running the same command again resumes a run that was
+killed, skipping the cards already done and re-queueing those that were
+left running; --retry re-queues the failed cards as well. More runs (e.g.
+in other terminals, or on other hosts sharing the --db file) can work on
+the same queue at once. A card claimed more than --stale hours ago (default
+24) is queued again, as a worker on another host can not be checked for
+being alive. The card's relative paths (its spectra, and the
+normalized spectra written) are relative to the directory the card was
+queued from, whatever directory the queue is resumed from; the --db path
+is relative to the working directory as always. ./normDB.py --jobs prints
+the state of the queue.
+Normalized spectra (and their .npy/.fits copies) are always written under a
+temporary name and renamed once complete, so an interrupted run never
+leaves partial files, and the SNRs replace those of an earlier attempt.
+
+Spectrum cache:
+----------
+Parsing large ascii spectra is slow, so the first time a raw spectrum is read
+a binary copy is saved in --cachedir (default: ~/.normSpectra_cache). The copy
+is keyed by the spectrum's path, modification time and size (and the cache
+version, bumped when the parser changes), so editing the ascii file simply
+makes a new copy and removes the old one. On later runs the binary copy is
+memory-mapped instead of re-reading the ascii file. It is stored column by
+column, so the rest-frame shift only copies the wavelength column into
+memory. --nocache turns this off. Copies of files that are gone are not
+removed automatically: --prunecache DAYS removes those not used for DAYS days.
+The ascii files of a card that are not cached are parsed in parallel (one
+process per file, or --nproc), plain three column files with one
+np.fromstring call each, and the load time of every file is printed in card
+order. Card paths ending in .fits are read as SDSS/BOSS spec-lite files
+(lambda=10^loglam, flux, flux_err=1/sqrt(ivar), pixels of ivar<=0 dropped),
+memory-mapped directly by specLite.py, so they are never cached.
+
+Library use:
+----------
+Importing normalizeSpectra runs nothing, the program itself is main(). To
+normalize objects in-process (e.g., from a pipeline worker) without plots or
+user input:
+
+>>> import normalizeSpectra as ns
+>>> normalized,SNRs=ns.normalizeCard('J000000.card')
+
+or, for spectra that are already in memory (rest-frame),
+
+>>> normalized,SNRs=ns.normalizeObject(objInfo,spectra,parms=ns.normDefaults)
+
+The pieces are also available on their own: readCard(), loadSpectrum(),
+toRestFrame(), fitObject(), normalizeSpec(), calcSNR(), writeNormSpec().
+epochStack.py holds all epochs of an object on one common wavelength grid
+(epoch x pixel arrays) for ratio spectra, variability statistics and batched
+normalization. resample.py does the flux-conserving rebinning of many spectra
+at once (with error propagation).
+
+Parameters:
+----------
+The normalization and plotting parameters are saved (on 'normalize' and
+quit) in one database for all objects, --db (default: normSpectra.db in the
+working directory), see normDB.py. The next run offers to re-use the latest
+parameters of the object, and
+
+$> ./normalizeSpectra.py --history JHHMMSS.card
+
+prints every parameter set saved for it (./normDB.py also lists the SNRs). Objects with no parameters in the
+database fall back on their old normJHHMMSS.parm/plotJHHMMSS.parm files.
+
+--autorlf (interactive or --batch, not --stream) finds the RLF windows with
+autoRLF() before normalizing and saves them as the object's latest
+parameters: the continuum of all spectra is fit to 1280-1800A, pixels more
+than 2 sigma below or 3 sigma above it are clipped and the fit repeated until
+nothing changes, and the windows are the stretches (>=10A) left unclipped in
+every spectrum. The 'autoRLF' command of normalize() does the same.
+
+Plot rendering:
+----------
+By default every change re-writes the publication quality (LaTeX) .eps plots.
+With --render preview the plots are written as quick .png previews instead
+(no LaTeX, and long spectra are reduced to the min/max flux of each screen
+pixel column). The .eps plot is then only made with the 'eps' command and
+when quitting.
+
+Profiling:
+----------
+--profile (or NORMSPECTRA_PROFILE=1 in the environment) times the stages of a
+run, per spectrum where there is one (load, index, yscale, smooth, fit,
+normalize, write, plot draw/save, stream), with the pixel counts and the
+memory high-water mark, and prints a summary table per stage at exit.
+--profile FILE (or NORMSPECTRA_PROFILE=FILE) also writes every record to FILE
+as JSON lines. --batch workers send their records back to the main process.
+Without it the instrumentation does nothing.
+
+Output files:
+----------
+Normalized spectra are written to normJHHMMSS.suffix as three space separated
+columns (observed-frame lambda, flux, flux_err) at full precision, or with
+--precision N significant digits. --binary npy (or fits, requires astropy)
+also writes the same columns to normJHHMMSS.suffix.npy (.fits).
+With --mc N a 4th column, the continuum uncertainty, is added: the RLF pixels
+are perturbed by flux_err N times, all N realizations of every spectrum are
+fit in one batched call, and the column is the standard deviation of the
+realizations' continua divided by the continuum (i.e., the 1 sigma error of
+the normalized continuum level). --seed makes it repeatable, and interactive
+runs may split the realizations over --nproc processes (--batch already runs
+one object per process).
+The median SNR of each spectrum over SNRreg is saved in the --db database
+(see normDB.py, e.g. ./normDB.py --snr --maxsnr 6 lists the low SNR spectra).
+
 HISTORY
 --------------------------------------------------------------------------------
 2014-09-16 - JAR - created
@@ -101,21 +229,104 @@ HISTORY
                  - user may now choose a location of civ abs and look for
                    absorption due to siv, nv, and lya. User can plot the rest-frame
                    frame wavelength of the expected locations of these ions
+2026-10-16 - added a non-interactive --batch mode which normalizes many
+             *.card files across a pool of processes. The card read-in,
+             the parm file read-in and the fit-and-write part of
+             normalize() are now separate functions.
+           - SNR is calculated with a single mask, calcSNR() also
+             accepts a list of SNR regions (library use only, the
+             SNRreg of normalize() and --batch is one region)
+           - added WavelengthIndex, all RLF/yscale/SNRreg window
+             look-ups are now binary searches on the wavelength column
+           - raw spectra are cached as binary .npy files (see --cachedir)
+             and memory-mapped on the next load
+           - normalized spectra are written in bulk, with an optional
+             precision (--precision) and binary copy (--binary npy/fits)
+2026-10-17 - continuum fits are done by continuumFit.py, all spectra of
+             an object are fit in one batched call. funcType may now
+             also be 'polyN' for an N-th order polynomial.
+           - added SpectraView, the spectra are no longer deep-copied
+             by normalize() and plotNorm(). Smoothing is derived from
+             the (read-only) raw spectra instead of done in place.
+           - smoothing is done by smoothSpec() (boxcar or gaussian
+             convolution, see --smoothwidth/--smoothkernel) instead of
+             jarTools.boxcarSmooth, and every smoothed spectrum is kept
+             by its SpectraView, so toggling 'smooth' is free. Away from
+             the ends the boxcar is the same as boxcarSmooth, the last
+             width/2 pixels at each end are now averaged over the pixels
+             that exist instead of the zero padding.
+           - the plots of normalize() and plotNorm() are now built once
+             (SpectraPlot/NormPlot), each command only redraws what it
+             changed and the image file is only re-written if the plot
+             changed. Ion annotations use each absorber's own CIV.
+           - added --render preview: while working the plots are fast
+             .png previews (no LaTeX, spectra decimated to the screen
+             resolution), the LaTeX .eps is made on quit or with 'eps'
+           - parameters are saved in a database (normDB.py, --db)
+             instead of appended to normJHHMMSS.parm/plotJHHMMSS.parm,
+             old *.parm files are still read if an object has no
+             parameters in the database yet.
+           - SNRs are saved in the database too (one row per object,
+             spectrum and SNRreg, safe for parallel runs) instead of
+             appended to SNR_outfile.dat/lowSNR_outfile.dat.
+           - the command line program is now main(), importing
+             normalizeSpectra runs nothing. normalize() no longer
+             uses the global normFileList, added normalizeObject()
+             and normalizeCard() for in-process (library) use.
+           - matplotlib is only imported when a plot is made (see
+             pyplot()) and multiprocessing only for --batch, the
+             unused scipy.optimize/math/argv imports are gone.
+             --startup measures the start-up time (import and
+             reading a card) in fresh processes.
+           - added --stream for --batch: spectra are streamed through
+             in --chunk row chunks (the RLF/SNRreg pixels are kept for
+             the fit, then divide-and-write), so memory use does not
+             grow with the length of the spectra.
+           - added epochStack.py, the epochs of an object on a common
+             grid as 2-D arrays
+           - added autoRLF(), continuum windows found by iterative
+             fitting and sigma-clipping of all spectra at once, used
+             by the 'autoRLF' command and --autorlf
+           - added --mc, a Monte-Carlo continuum uncertainty column
+             (fitContinuaMC(), all realizations fit at once)
+           - added troughs.py (automatic CIV trough finding, BI/AI),
+             the 'troughs' command in plotNorm(), ionLocations()
+             takes arrays
+           - moved the y-scaling of normalize() to yScale(), added
+             benchmark.py (all stages timed on synthetic spectra)
+           - added --profile/NORMSPECTRA_PROFILE, per-stage timings,
+             pixel counts and memory high-water marks (StageTimer)
+           - the spectra of a card are loaded in parallel
+             (loadSpectra()), with a fast three column parser
+             (readAscii()), paths{} keep the card order
+           - SDSS/BOSS spec-lite .fits files are read natively,
+             memory-mapped (specLite.py, no astropy)
+           - added --queue, a resumable job queue for --batch runs
+             (the jobs table of normDB), normalized spectra are
+             written to temporary files and renamed when complete
+           - --queue jobs are run in the directory they were queued
+             from (parseCard(workDir=)), and re-queued if claimed more
+             than --stale hours ago
+           - normalize() no longer stops on an empty normList or on
+             SNRs that could not be measured (SNRreg not covered)
 --------------------------------------------------------------------------------
 '''
 #Libraries used
-import scipy.optimize as spot
+#(matplotlib is slow to import and only needed for plots, see pyplot())
 import numpy as np
-from sys import argv
 import sys
-import math
-import matplotlib.pyplot as plt
-from matplotlib.ticker import MultipleLocator, FormatStrFormatter
 import copy as cp
 import os.path
 import argparse
-import jarTools
-import datetime
+import continuumFit
+import normDB
+import specLite
+import glob
+import time
+import functools
+import hashlib
+import itertools
+import collections
 
 civ_0a=1550.774 #CIV
 civ_0b=1548.202 #CIV
@@ -125,7 +336,457 @@ nv_0a=1242.804 #NV
 nv_0b=1238.821 #NV
 lya_0=1215.6701 #Lya
 
+#default normalization parameters, used by --batch when no parm file exists
+normDefaults={'smooth':True,
+              'funcType':'plaw',
+              'RLF':[[1300,1320],[1590,1620],[1700,1750]],
+              'xlimits':[1100,1800],
+              'ylimits':[0,40],
+              'SNRreg':[1600,1700]}
+
+#where binary copies of the raw ascii spectra are kept, see loadSpectrum()
+defaultCacheDir=os.path.join(os.path.expanduser('~'),'.normSpectra_cache')
+#part of the cache key, bump it whenever readAscii() or the cache layout
+#changes so copies made by older versions are not used
+cacheVersion=2
+
 ####declare methods() and functions()
+def ionLocations(loc_civ):
+    '''
+    Expected locations of CIV, SiIV, NV and Lya absorption for a CIV
+    absorber at loc_civ (taken to be the civ_0b line of the doublet).
+    Returns a dictionary of: civa, civb, siva, sivb, nva, nvb, lya
+    loc_civ may also be an array of many absorbers (e.g., the troughs found
+    by troughs.py), every entry of the dictionary is then an array.
+    '''
+    bshift=(loc_civ-civ_0b)/civ_0b
+    loc={}
+    #civ_a is at loc_civ-2.572
+    loc['civa']=loc_civ-2.572
+    loc['civb']=loc_civ
+    loc['siva']=siv_0a+(bshift*siv_0a)
+    loc['sivb']=siv_0b+(bshift*siv_0b)
+    loc['nva']=nv_0a+(bshift*nv_0a)
+    loc['nvb']=nv_0b+(bshift*nv_0b)
+    loc['lya']=lya_0+(bshift*lya_0)
+    return loc
+
+plt=None #matplotlib.pyplot, once imported by pyplot()
+
+def pyplot(backend=None):
+    '''
+    Imports matplotlib.pyplot (as the global plt) the first time it is
+    needed and returns it, optionally switching to backend (e.g. 'agg').
+    '''
+    global plt
+    if plt is None:
+        if backend is not None:
+            import matplotlib
+            matplotlib.use(backend)
+        import matplotlib.pyplot
+        plt=matplotlib.pyplot
+    elif backend is not None:
+        plt.switch_backend(backend)
+    return plt
+
+class StageTimer(object):
+    '''
+    Optional per-stage instrumentation. Code wraps its hot spots in
+
+        with timer.stage('fit',spec,npix):
+
+    and, once enable()d, every stage records its wall time, pixel count,
+    the spectrum it worked on and the memory high-water mark (max RSS) at
+    its end. report() prints a summary table per stage (and writes every
+    record to logFile as JSON lines), enable() arranges for it to run at
+    exit. Stages may nest, each time includes that of the stages inside it.
+    While disabled stage() returns one shared do-nothing context, so the
+    instrumentation costs a function call per stage.
+    '''
+    def __init__(self):
+        self.enabled=False
+        self.records=[]
+        self.logFile=None
+
+    def enable(self,logFile=None):
+        if not self.enabled:
+            import atexit
+            atexit.register(self.report)
+        self.enabled=True
+        self.logFile=logFile
+
+    def stage(self,name,spec=None,npix=0):
+        if not self.enabled:
+            return nullStage
+        return TimedStage(self,name,spec,npix)
+
+    def add(self,name,spec,npix,seconds):
+        '''
+        records a stage timed elsewhere (e.g., in a pool process)
+        '''
+        if self.enabled:
+            self.records.append({'stage':name,'spec':spec,'npix':int(npix),
+                                 'seconds':seconds,'maxRSS':maxRSS()})
+
+    def report(self):
+        '''
+        prints the per-stage summary, writes the records to logFile
+        '''
+        if not self.records:
+            return
+        if self.logFile:
+            import json
+            with open(self.logFile,'w') as f:
+                for r in self.records:
+                    f.write(json.dumps(r,sort_keys=True)+'\n')
+        names=[]
+        for r in self.records:
+            if r['stage'] not in names:
+                names.append(r['stage'])
+        print '------------------------------------------------------------'
+        print '*** Stage timings (%d records%s)' % (len(self.records),
+                                                   ', written to '+self.logFile if self.logFile else '')
+        print '%-10s %6s %10s %10s %11s %8s %9s' % ('stage','calls','total [s]','mean [ms]',
+                                                   'pixels','Mpix/s','maxRSS MB')
+        for name in names:
+            rs=[r for r in self.records if r['stage']==name]
+            total=sum(r['seconds'] for r in rs)
+            npix=sum(r['npix'] for r in rs)
+            rss=max(r['maxRSS'] for r in rs)
+            print '%-10s %6d %10.4f %10.2f %11d %8s %9s' % (
+                name,len(rs),total,1e3*total/len(rs),npix,
+                '%.2f' % (npix/total/1e6) if npix and total>0 else '-',
+                '%.1f' % rss if rss is not None else '-')
+        print '------------------------------------------------------------'
+
+def maxRSS():
+    '''
+    memory high-water mark of this process in MB, None if unknown
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #kilobytes on linux, bytes on mac
+    return rss/1024.**2 if sys.platform=='darwin' else rss/1024.
+
+class TimedStage(object):
+    '''
+    one timed stage of a StageTimer, npix may be set inside the with block
+    '''
+    def __init__(self,timer,name,spec,npix):
+        self.timer=timer
+        self.name=name
+        self.spec=spec
+        self.npix=npix
+
+    def __enter__(self):
+        self.start=time.time()
+        return self
+
+    def __exit__(self,*exc):
+        self.timer.add(self.name,self.spec,self.npix,time.time()-self.start)
+        return False
+
+class NullStage(object):
+    npix=0
+    def __setattr__(self,name,value):
+        pass #npix counted into a disabled stage is dropped
+    def __enter__(self):
+        return self
+    def __exit__(self,*exc):
+        return False
+
+nullStage=NullStage()
+
+#the instrumentation of this process, enabled by --profile or by the
+#NORMSPECTRA_PROFILE environment variable (1, or the file to log to)
+timer=StageTimer()
+if os.environ.get('NORMSPECTRA_PROFILE'):
+    timer.enable(None if os.environ['NORMSPECTRA_PROFILE']=='1' else os.environ['NORMSPECTRA_PROFILE'])
+
+def decimate(lam,flux,xlimits,ncol):
+    '''
+    Reduces a spectrum to the min and max flux of each of ncol columns
+    across xlimits (pixels outside xlimits are dropped), which looks the same
+    as the full spectrum when plotted ncol pixels wide. Spectra with fewer
+    than 2*ncol pixels in xlimits, or a non-monotonic lam, are not reduced.
+    '''
+    if len(lam)<2*ncol or np.any(np.diff(lam)<0):
+        return lam,flux
+    lo=max(np.searchsorted(lam,xlimits[0])-1,0)
+    hi=np.searchsorted(lam,xlimits[1])+1
+    lam=lam[lo:hi]
+    flux=flux[lo:hi]
+    if len(lam)<2*ncol:
+        return lam,flux
+    col=((lam-xlimits[0])*(ncol/float(xlimits[1]-xlimits[0]))).astype(int)
+    starts=np.flatnonzero(np.concatenate(([True],col[1:]!=col[:-1])))
+    lows=np.minimum.reduceat(flux,starts)
+    highs=np.maximum.reduceat(flux,starts)
+    return np.repeat(lam[starts],2),np.column_stack((lows,highs)).ravel()
+
+class LivePlot(object):
+    '''
+    A figure that is built once and kept for a whole command loop.
+    update() of the subclasses compares the plot settings to those of the
+    last update and only redraws the artists whose settings changed,
+    save() only re-writes the image file if the plot changed since the last
+    save (or the filename changed/the file is gone).
+
+    render='eps' is the publication plot (LaTeX text, every pixel plotted).
+    render='preview' saves a .png instead (same name, no LaTeX) with the
+    spectra decimated to the figure's pixel columns, publish() then writes
+    the full .eps plot.
+    '''
+    saveKwargs={}
+
+    def __init__(self,render='eps'):
+        if render not in ['eps','preview']:
+            raise ValueError('Do not recognize render mode: '+str(render))
+        self.render=render
+        self.rc={'text.usetex':render=='eps','font.family':'sans-serif'}
+        pyplot()
+        plt.rc('text',usetex=self.rc['text.usetex'])
+        plt.rc('font',family='sans-serif')
+        self.fig=plt.figure()
+        self.ncol=int(self.fig.get_figwidth()*self.fig.dpi)
+        self.state={}
+        self.dirty=True
+        self.savedAs=None
+
+    def lineData(self,lam,flux,xlimits):
+        '''
+        what to plot for a spectrum, decimated in preview mode
+        '''
+        if self.render=='preview':
+            return decimate(lam,flux,xlimits,self.ncol)
+        return lam,flux
+
+    def target(self,filename):
+        '''
+        the file save(filename) writes to
+        '''
+        if self.render=='preview':
+            return os.path.splitext(filename)[0]+'.png'
+        return filename
+
+    def publish(self,filename):
+        '''
+        writes the full (LaTeX) .eps plot to filename, in preview mode by
+        building it from the arguments of the last update()
+        '''
+        if self.render=='eps':
+            self.save(filename)
+            return
+        full=self.__class__(*self.initArgs,render='eps')
+        full.update(*self.updateArgs)
+        full.save(filename)
+        full.close()
+
+    def changes(self,state):
+        '''
+        the keys of state whose values differ from the last update
+        '''
+        changed=set(k for k in state if k not in self.state or self.state[k]!=state[k])
+        if changed:
+            self.dirty=True
+        self.state=state
+        return changed
+
+    def save(self,filename):
+        filename=self.target(filename)
+        if self.dirty or filename!=self.savedAs or not os.path.exists(filename):
+            with plt.rc_context(self.rc):
+                self.fig.savefig(filename,**self.saveKwargs)
+            self.dirty=False
+            self.savedAs=filename
+
+    def close(self):
+        plt.close(self.fig)
+
+class SpectraPlot(LivePlot):
+    '''
+    The plot of the (y-scaled) raw spectra, their continua and the RLF
+    windows made by normalize().
+    '''
+    saveKwargs={'transparent':False}
+
+    def __init__(self,spectra,colourDict,yscale,render='eps'):
+        LivePlot.__init__(self,render)
+        self.initArgs=(spectra,colourDict,yscale)
+        self.spectra=spectra
+        self.colourDict=colourDict
+        self.yscale=yscale
+        self.ax=self.fig.add_subplot(111)
+        self.ax.set_autoscale_on(False)
+        self.ax.set_xlabel('Rest-frame Wavelength (\AA)')
+        self.ax.set_ylabel('Flux Density (10$^{-17}$ erg s$^{-1}$ cm$^{-2}$ \AA$^{-1}$)')
+        self.lines={}
+        self.contLines={}
+        self.spans=[]
+
+    def update(self,normList,smooth,spectraNormalized,normCount,RLF,xlimits,ylimits):
+        self.updateArgs=(normList,smooth,spectraNormalized,normCount,RLF,xlimits,ylimits)
+        smoothing=(smooth,self.spectra.smoothing)
+        if self.render=='preview':
+            #the decimated lines depend on the xlimits
+            smoothing=smoothing+(tuple(xlimits),)
+        changed=self.changes({'spectra':(tuple(normList),smoothing),
+                              'continua':(tuple(normList),smoothing,normCount),
+                              'windows':tuple(tuple(w) for w in RLF),
+                              'limits':(tuple(xlimits),tuple(ylimits))})
+        if 'spectra' in changed:
+            for spec in self.lines:
+                self.lines[spec].set_visible(spec in normList)
+            for spec in normList:
+                flux=self.spectra.flux(spec,smooth)*self.yscale[spec]
+                lam,flux=self.lineData(self.spectra.lam(spec),flux,xlimits)
+                if spec in self.lines:
+                    self.lines[spec].set_data(lam,flux)
+                else:
+                    self.lines[spec],=self.ax.plot(lam,flux,color=self.colourDict[spec])
+        if 'continua' in changed:
+            for line in self.contLines.values():
+                line.remove()
+            self.contLines={}
+            for spec in normList:
+                if spec not in spectraNormalized:
+                    continue
+                cont=self.yscale[spec]*(self.spectra.flux(spec,smooth)/spectraNormalized[spec][:,1])
+                lam,cont=self.lineData(self.spectra.lam(spec),cont,xlimits)
+                self.contLines[spec],=self.ax.plot(lam,cont,color=self.colourDict[spec],linestyle='--')
+        if 'windows' in changed:
+            for span in self.spans:
+                span.remove()
+            self.spans=[self.ax.axvspan(w[0],w[1],facecolor='0.9',linewidth=0) for w in RLF]
+        if 'limits' in changed:
+            self.ax.set_xlim(xlimits[0],xlimits[1])
+            self.ax.set_ylim(ylimits[0],ylimits[1])
+
+class NormPlot(LivePlot):
+    '''
+    The normalized spectra plot made by plotNorm().
+    '''
+    def __init__(self,spectra,colourDict,objInfo,render='eps'):
+        LivePlot.__init__(self,render)
+        self.initArgs=(spectra,colourDict,objInfo)
+        self.spectra=spectra
+        self.colourDict=colourDict
+        self.objInfo=objInfo
+        ax1=self.fig.add_subplot(111)
+        ax1.set_autoscale_on(False)
+        ax1.plot([100,10000],[1.0,1.0],'--',color='k')
+        ax1.plot([100,10000],[0.9,0.9],':',color='k')
+        #Setting labels, ticks on y-axis and bottom x-axis
+        ax1.set_xlabel('Rest-frame Wavelength (\AA)')
+        ax1.set_ylabel('Normalized Flux Density (10$^{-17}$ erg s$^{-1}$ cm$^{-2}$ \AA$^{-1}$)')
+        from matplotlib.ticker import MultipleLocator
+        ax1.xaxis.set_minor_locator(MultipleLocator(25))
+        #The 2nd axis (which is really just the top x-axis
+        ax2=ax1.twiny() #copies everything from the y
+        ax2.set_autoscale_on(False)
+        ax2.set_xlabel('Observed-frame Wavelength (\AA)')
+        ax2.xaxis.set_minor_locator(MultipleLocator(100))
+        ax1.yaxis.set_minor_locator(MultipleLocator(0.1))
+        self.ax1=ax1
+        self.ax2=ax2
+        self.lines={}
+        self.spans=[]
+        self.notes=[]
+        self.legend=None
+
+    def update(self,plotList,smooth,lw,windows,RLF,annotations,absDict,xlimits,ylimits):
+        self.updateArgs=(plotList,smooth,lw,windows,RLF,annotations,absDict,xlimits,ylimits)
+        smoothing=(smooth,self.spectra.smoothing)
+        if self.render=='preview':
+            #the decimated lines depend on the xlimits
+            smoothing=smoothing+(tuple(xlimits),)
+        changed=self.changes({'spectra':(tuple(plotList),smoothing),
+                              'lw':lw,
+                              'windows':(windows,tuple(tuple(w) for w in RLF)),
+                              'limits':(tuple(xlimits),tuple(ylimits)),
+                              'annotations':(annotations,tuple(sorted(absDict.items())),
+                                             tuple(ylimits),tuple(plotList))})
+        if 'spectra' in changed:
+            self.drawSpectra(plotList,smooth,xlimits)
+        if 'spectra' in changed or 'lw' in changed:
+            for line in self.lines.values():
+                line.set_linewidth(lw)
+        #turns on/off the RLF gray'd out regions
+        if 'windows' in changed:
+            for span in self.spans:
+                span.remove()
+            self.spans=[]
+            if windows==True:
+                self.spans=[self.ax1.axvspan(w[0],w[1],facecolor='0.8',linewidth=0) for w in RLF]
+        if 'limits' in changed:
+            zem=self.objInfo['zem']
+            self.ax1.set_xlim(xlimits[0],xlimits[1])
+            self.ax1.set_ylim(ylimits[0],ylimits[1])
+            self.ax2.set_xbound(xlimits[0]*(1+zem),xlimits[1]*(1+zem)) #set the observed frame
+        if 'annotations' in changed:
+            self.drawAnnotations(plotList,annotations,absDict,ylimits)
+
+    def drawSpectra(self,plotList,smooth,xlimits):
+        '''
+        plot all normalized spectra in plotlist
+        calculate rest-frame time between observations on the fly
+        '''
+        objInfo=self.objInfo
+        for spec in self.lines:
+            self.lines[spec].set_visible(spec in plotList)
+        for i,spec in enumerate(plotList):
+            if i==0:
+                deltaT=0
+            else:
+                deltaT=round((objInfo[plotList[i]]-objInfo[plotList[i-1]])/(1+objInfo['zem']),2)
+            label=str(round(objInfo[spec],2))+' '+spec+' '+str(deltaT)
+            lam,flux=self.lineData(self.spectra.lam(spec),self.spectra.flux(spec,smooth),xlimits)
+            if spec in self.lines:
+                self.lines[spec].set_data(lam,flux)
+                self.lines[spec].set_label(label)
+            else:
+                self.lines[spec],=self.ax1.plot(lam,flux,self.colourDict[spec],label=label)
+
+    def drawAnnotations(self,plotList,annotations,absDict,ylimits):
+        '''
+        object name, redshift, ion locations and the legend
+        '''
+        for artist in self.notes:
+            artist.remove()
+        self.notes=[]
+        if self.legend is not None:
+            self.legend.remove()
+            self.legend=None
+        if annotations!=True:
+            return
+        ax1=self.ax1
+        self.notes.append(ax1.annotate(self.objInfo['objName'],xy=(1275,(ylimits[1]*0.95))))
+        self.notes.append(ax1.annotate('z='+str(self.objInfo['zem']),xy=(1450,(ylimits[1]*0.95))))
+        for key in absDict:
+            loc=ionLocations(absDict[key])
+            for ion,name in [('civ','CIV'),('siv','SiIV'),('nv','NV'),('lya','Lya')]:
+                if ion=='lya':
+                    lines=[loc['lya']]
+                    x=loc['lya']
+                else:
+                    lines=[loc[ion+'a'],loc[ion+'b']]
+                    x=loc[ion+'b'] if ion=='civ' else loc[ion+'a']
+                self.notes.append(ax1.annotate(str(key)+name,xy=(x,(ylimits[1]*0.90))))
+                for l in lines:
+                    self.notes.extend(ax1.plot([l,l],[-10,10],':',color='k'))
+        #Adding the legend
+        handles=[self.lines[spec] for spec in plotList]
+        labels=[h.get_label() for h in handles]
+        if len(plotList)>=4:
+            self.legend=ax1.legend(handles,labels,loc='lower left',prop={'size':12},ncol=2)
+        else:
+            self.legend=ax1.legend(handles,labels,loc='lower left',prop={'size':12})
+        for legobj in self.legend.legendHandles:
+            legobj.set_linewidth(2.5)
+
 def plotNorm(spectra,
              normList,
              RLF,
@@ -135,42 +796,40 @@ def plotNorm(spectra,
              xlimits=[1200,1600],
              ylimits=[0,2.5],
              lw=1.0,
-             annotations=False):
+             annotations=False,
+             smoothWidth=3,
+             smoothKernel='boxcar',
+             render='eps',
+             db=None):
     '''
     Plotting Program, build a normalized spectra plot from the plotlist
+    (spectra may be a SpectraView, so its smoothed spectra are reused,
+    render is 'eps' or 'preview', see LivePlot, parameters are saved in the
+    normDB.NormDB db, default normDB.defaultDB)
     '''
     yes=set(['yes','y','YES','Y',True,1])
     no=set(['no','n','NO','N',False,0])
 
-    normOrig=cp.deepcopy(spectra)
-    #Search for normJHHMMSS.parm file?
-    parmFile='plot'+objInfo['shortObjName']+'.parm'
-    if os.path.exists(parmFile):
+    if not isinstance(spectra,SpectraView):
+        spectra=SpectraView(spectra)
+    spectra.setSmoothing(smoothWidth,smoothKernel)
+    if db is None:
+        db=normDB.NormDB()
+    #Search for previous plotting parameters?
+    previous=previousParms(db,objInfo['shortObjName'],'plot')
+    if previous is not None:
         print '############################################################'
-        print '*** Detected a plotting parameter file:',parmFile
-        user_input=raw_input('*** Would you like to use it? [y/n]:')
+        print '*** Detected plotting parameters in:',previous[0]
+        user_input=raw_input('*** Would you like to use them? [y/n]:')
         if user_input in yes:
-            parmDict={}
             print '*** Reading in previously used parameters'
             print '***'
-            with open(parmFile,'r') as f:
-                s=f.readlines()
-                for line in s[-6:-1]:
-                    listedline=line.strip().split('=')
-                    parmDict[listedline[0]]=listedline[1]
-            f.close()
-            #pulling out the parm values
-            if parmDict['annotations']=='True':
-                annotations=True
-            else:
-                annotations=False
-            lw=float(parmDict['lw'])
-            xlimits=map(float,parmDict['xlimits'].split(','))
-            ylimits=map(float,parmDict['ylimits'].split(','))
-            temp=map(float,parmDict['RLF'].split(','))
-            RLF=[[temp[0],temp[1]]]
-            for t in range(2,len(temp)-1,2):
-                RLF.insert(0,[temp[t],temp[t+1]])
+            parms=previous[1]
+            annotations=parms['annotations']
+            lw=parms['lw']
+            xlimits=parms['xlimits']
+            ylimits=parms['ylimits']
+            RLF=parms['RLF']
             print '*** xlimits'+'='+str(xlimits)
             print '*** ylimits'+'='+str(ylimits)
             print '*** RLF'+'='+str(RLF)
@@ -184,15 +843,15 @@ def plotNorm(spectra,
     print '#######----------------------------------------------#######'
     print '#######---------Normalized Spectra Plotter-----------#######'
     print '#######----------------------------------------------#######'
-    print '### I made a plot for you. See-->',filename
+    plot=NormPlot(spectra,colourDict,objInfo,render)
+    print '### I made a plot for you. See-->',plot.target(filename)
     print '### be sure to refresh to see your changes take effect.'
     #plotList=cp.deepcopy(spectra.keys()) #the list that will be plotted
     if smooth==True:
         print '*** smoothing spectrum'
-        for spec in spectra:
-            spectra[spec][:,1]=np.array(jarTools.boxcarSmooth(spectra[spec][:,1]))
     absDict={}
     absCount=0
+    troughKeys=[] #the absDict keys added by the last 'troughs' command
     escape=False
     first=False
     windows=False
@@ -200,89 +859,13 @@ def plotNorm(spectra,
     plotIon=False
     user_input='commands'
     while escape==False:
-        #build a plot to play with
-        fig = plt.figure()
-        ax1=fig.add_subplot(111)
-        ax1.set_autoscale_on(False)
-        plt.rc('text',usetex=True)
-        plt.rc('font',family='sans-serif')
-        ax1.plot([100,10000],[1.0,1.0],'--',color='k')
-        ax1.plot([100,10000],[0.9,0.9],':',color='k')
-        #plt.xlim(xlimits[0],xlimits[1])
-        #plt.ylim(ylimits[0],ylimits[1])
-
         #sort plotList by smallest to largest MJD
         plotList=sorted(normList, key=objInfo.get)
-
-        #plot all normalized spectra in plotlist
-        #calculate rest-frame time between observations on the fly
-        for i,spec in enumerate(plotList):
-            if i==0:
-                deltaT=0
-            else:
-                deltaT=round((objInfo[plotList[i]]-objInfo[plotList[i-1]])/(1+objInfo['zem']),2)
-            ax1.plot(spectra[spec][:,0],(spectra[spec][:,1]),colourDict[spec],linewidth=lw,label=str(round(objInfo[spec],2))+' '+spec+' '+str(deltaT))
-
-        #turns on/off the RLF gray'd out regions
-        if windows==True:
-            for w in RLF:
-                ax1.axvspan(w[0],w[1],facecolor='0.8',linewidth=0)
-        if annotations==True:
-            #Adding Annotations
-            ax1.annotate(objInfo['objName'],xy=(1275,(ylimits[1]*0.95)))
-            ax1.annotate('z='+str(objInfo['zem']),xy=(1450,(ylimits[1]*0.95)))
-            #ax1.annotate('CIV',xy=(1542,1.73))
-            #ax1.annotate('SIV',xy=(1392,1.73))
-            #ax1.plot([1550,1550],[1.6,1.7],'k',linewidth=1)
-            #ax1.plot([1400,1400],[1.6,1.7],'k',linewidth=1)
-            if bool(absDict)==True:
-                for key in absDict:
-                    bshift=(absDict[key]-civ_0b)/civ_0b
-                    loc_siva=siv_0a+(bshift*siv_0a)
-                    loc_sivb=siv_0b+(bshift*siv_0b)
-                    loc_nva=nv_0a+(bshift*nv_0a)
-                    loc_nvb=nv_0b+(bshift*nv_0b)
-                    loc_lya=lya_0+(bshift*lya_0)
-                    #CIV
-                    ax1.annotate(str(key)+'CIV',xy=(absDict[key],(ylimits[1]*0.90)))
-                    ax1.plot([loc_civa,loc_civa],[-10,10],':',color='k')
-                    ax1.plot([loc_civb,loc_civb],[-10,10],':',color='k')
-                    #SiIV
-                    ax1.annotate(str(key)+'SiIV',xy=(loc_siva,(ylimits[1]*0.90)))
-                    ax1.plot([loc_siva,loc_siva],[-10,10],':',color='k')
-                    ax1.plot([loc_sivb,loc_sivb],[-10,10],':',color='k')
-                    #NV
-                    ax1.annotate(str(key)+'NV',xy=(loc_nva,(ylimits[1]*0.90)))
-                    ax1.plot([loc_nva,loc_nva],[-10,10],':',color='k')
-                    ax1.plot([loc_nvb,loc_nvb],[-10,10],':',color='k')
-                    #Lya
-                    ax1.annotate(str(key)+'Lya',xy=(loc_lya,(ylimits[1]*0.90)))
-                    ax1.plot([loc_lya,loc_lya],[-10,10],':',color='k')
-            #Adding the legend
-            if len(plotList)>=4:
-                leg=ax1.legend(loc='lower left',prop={'size':12},ncol=2)
-            else:
-                leg=ax1.legend(loc='lower left',prop={'size':12})
-            for legobj in leg.legendHandles:
-                legobj.set_linewidth(2.5)
-
-        #Setting labels, ticks, limits on y-axis and bottom x-axis
-        ax1.set_xlabel('Rest-frame Wavelength (\AA)')
-        ax1.set_ylabel('Normalized Flux Density (10$^{-17}$ erg s$^{-1}$ cm$^{-2}$ \AA$^{-1}$)')
-        ax1.set_xlim(xlimits[0],xlimits[1])
-        #ax1.set_xticks([1250,1350,1450,1550,1650])
-        ax1.set_ylim(ylimits[0],ylimits[1])
-        ax1.xaxis.set_minor_locator(MultipleLocator(25))
-
-        #The 2nd axis (which is really just the top x-axis
-        ax2=ax1.twiny() #copies everything from the y
-        ax2.set_autoscale_on(False)
-        ax2.set_xbound(xlimits[0]*(1+objInfo['zem']),xlimits[1]*(1+objInfo['zem'])) #set the observed frame
-        #ax2.set_xticks([4000,4500,5000,5500,6000,6500,7000,7500]) #the ticks I want
-        ax2.set_xlabel('Observed-frame Wavelength (\AA)')
-        ax2.xaxis.set_minor_locator(MultipleLocator(100))
-        ax1.yaxis.set_minor_locator(MultipleLocator(0.1))
-        plt.savefig(filename)
+        #only the parts of the plot that changed are redrawn/re-written
+        with timer.stage('normDraw'):
+            plot.update(plotList,smooth,lw,windows,RLF,annotations,absDict,xlimits,ylimits)
+        with timer.stage('normSave',plot.target(filename)):
+            plot.save(filename)
 
         #let it play the first 'options' command first
         if first==True:
@@ -304,6 +887,8 @@ def plotNorm(spectra,
             print 'lw             : change linewidth for plotted spectra'
             print 'smooth         : smooth the spectra.'
             print 'ion            : put locations of expected siv, nv, etc.'
+            print 'troughs        : find the CIV troughs (and BI/AI) automatically'
+            print 'eps            : write the publication (LaTeX) .eps plot now'
             print '############################################################'
         elif user_input=='ion':
             print '############################################################'
@@ -330,32 +915,48 @@ def plotNorm(spectra,
                 #civ_0b=1548.202 #CIV
                 #that means civ_a is at ans-2.572
                 absDict[absCount]=ans
-                bshift=(loc_civ-civ_0b)/civ_0b
-                loc_civa=ans-2.572
-                loc_civb=ans
-                loc_siva=siv_0a+(bshift*siv_0a)
-                loc_sivb=siv_0b+(bshift*siv_0b)
-                loc_nva=nv_0a+(bshift*nv_0a)
-                loc_nvb=nv_0b+(bshift*nv_0b)
-                loc_lya=lya_0+(bshift*lya_0)
+                loc=ionLocations(loc_civ)
                 print 'Found locations of other ions: SiIV, NV, Lya'
-                print 'Location of  CIV absorption:',loc_civa,loc_civb
-                print 'Location of SiIV absorption:',loc_siva,loc_sivb
-                print 'Location of   NV absorption:',loc_nva,loc_nvb
-                print 'Location of  Lya absorption:',loc_lya
+                print 'Location of  CIV absorption:',loc['civa'],loc['civb']
+                print 'Location of SiIV absorption:',loc['siva'],loc['sivb']
+                print 'Location of   NV absorption:',loc['nva'],loc['nvb']
+                print 'Location of  Lya absorption:',loc['lya']
                 print 'Turn on annotations to see them plotted.'
                 plotIon=True
             print '############################################################'
+        elif user_input=='troughs':
+            print '############################################################'
+            import troughs
+            width,kernel=spectra.smoothing
+            summary,found=troughs.measureSpectra(spectra,plotList,width if smooth else 0,kernel)
+            for spec in plotList:
+                print '%-6s BI=%.1f AI=%.1f troughs=%d' % (spec,summary[spec]['BI'],
+                                                         summary[spec]['AI'],summary[spec]['ntrough'])
+            #replace the absorbers of an earlier 'troughs', not add them again
+            for key in troughKeys:
+                if key in absDict:
+                    del absDict[key]
+            troughKeys=[]
+            for i in range(len(found['spec'])):
+                absCount+=1
+                absDict[absCount]=round(found['lam'][i],1)
+                troughKeys.append(absCount)
+                print '%-6s %7.1f-%7.1f (%6.0f-%6.0f km/s) depth %.2f, CIV absorber at %.1f' % (
+                    found['spec'][i],found['lam1'][i],found['lam2'][i],found['vmin'][i],
+                    found['vmax'][i],found['depth'][i],found['lam'][i])
+            if len(found['spec']):
+                print 'Added the troughs to the CIV absorbers (replacing those of an earlier',
+                print '\'troughs\'), turn on annotations to see them plotted.'
+                plotIon=True
+            print '############################################################'
         elif user_input=='smooth':
             print '############################################################'
             user_input=raw_input('Turn on smoothing? [y,n]:')
             if user_input in yes:
                 smooth=True
-                for spec in spectra:
-                    spectra[spec][:,1]=np.array(jarTools.boxcarSmooth(spectra[spec][:,1]))
+                askSmoothing(spectra)
             elif user_input in no:
                 smooth=False
-                spectra=cp.deepcopy(normOrig)
             else:
                 print user_input+': Not a valid entry. Back to command page.'
             print 'Smoothing:'+str(smooth)
@@ -405,26 +1006,23 @@ def plotNorm(spectra,
             escape=True
             print 'Quitting'
             print ''
-            print 'Writing current plotting parameters to:',parmFile
+            if render=='preview':
+                print 'Writing the publication plot to:',filename
+                plot.publish(filename)
+            print 'Writing current plotting parameters to:',db.path
             print 'xlimits'+'='+str(xlimits)
             print 'ylimits'+'='+str(ylimits)
             print 'RLF'+'='+str(RLF)
             print 'annotations'+'='+str(annotations)
             print 'lw'+'='+str(lw)
-            now = datetime.datetime.now()
-            outfile=open(parmFile,'a')
-            outfile.write('-------------------------'+now.strftime("%Y-%m-%d %H:%M")+'------------------------\n')
-            outfile.write('annotations'+'='+str(annotations)+'\n')
-            outfile.write('lw'+'='+str(lw)+'\n')
-            outfile.write('xlimits'+'='+str(xlimits[0])+','+str(xlimits[1])+'\n')
-            outfile.write('ylimits'+'='+str(ylimits[0])+','+str(ylimits[1])+'\n')
-            outfile.write('RLF'+'=')
-            for r in RLF[:-1]:
-                outfile.write(str(r[0])+','+str(r[1])+',')
-            else:
-                outfile.write(str(RLF[-1][0])+','+str(RLF[-1][1])+'\n')
-            outfile.write('----------------------------------------------------------------------------\n')
-            outfile.close()
+            db.saveParms(objInfo['shortObjName'],'plot',
+                             {'annotations':annotations,'lw':lw,'xlimits':xlimits,
+                              'ylimits':ylimits,'RLF':RLF})
+            print '############################################################'
+        elif user_input=='eps':
+            print '############################################################'
+            plot.publish(filename)
+            print 'Wrote the publication plot to:',filename
             print '############################################################'
         elif user_input=='filename':
             print '############################################################'
@@ -459,7 +1057,8 @@ def plotNorm(spectra,
             print '############################################################'
             print 'What chu talkin bout Willis'
             print '############################################################'
-    print 'Plotted normalized spectra in:','norm'+objInfo['shortObjName']+'.eps'
+    plot.close()
+    print 'Plotted normalized spectra in:',filename
     print '#######------------------EXITING---------------------#######'
     print '#######---------Normalized Spectra Plotter-----------#######'
     print '#######----------------------------------------------#######'
@@ -471,43 +1070,49 @@ def normalize(spectra,
               RLF=[[1300,1320],[1590,1620],[1700,1750]],
               xlimits=[1100,1800],
               ylimits=[0,40],
-              SNRreg=[1600,1700]):
+              SNRreg=[1600,1700],
+              precision=None,
+              binary=None,
+              smoothWidth=3,
+              smoothKernel='boxcar',
+              render='eps',
+              db=None,
+              normFileList=None,
+              nreal=0,
+              seed=None,
+              nproc=None):
     '''
     Normalization Routine
+    (precision/binary are passed on to writeNormSpec, smoothWidth and
+    smoothKernel to smoothSpec, render is 'eps' or 'preview', see LivePlot,
+    parameters are saved in the normDB.NormDB db, default normDB.defaultDB,
+    normFileList{} are the output files, default normFileName(), nreal>0
+    adds the Monte-Carlo continuum uncertainty column, see fitContinuaMC())
     '''
     #For validation of responses coming up
     yes=set(['yes','y','YES','Y',True,1])
     no=set(['no','n','NO','N',False,0])
 
-    #Search for spectraJHHMMSS.parm file?
-    parmFile='norm'+objInfo['shortObjName']+'.parm'
-    if os.path.exists(parmFile):
+    if db is None:
+        db=normDB.NormDB()
+    if normFileList is None:
+        normFileList=dict((spec,normFileName(objInfo,spec)) for spec in spectra)
+    #Search for previous normalization parameters?
+    previous=previousParms(db,objInfo['shortObjName'],'norm')
+    if previous is not None:
         print '------------------------------------------------------------'
-        print '*** Detected a normalization parameter file:',parmFile
-        user_input=raw_input('*** Would you like to use it? [y/n]:')
+        print '*** Detected normalization parameters in:',previous[0]
+        user_input=raw_input('*** Would you like to use them? [y/n]:')
         if user_input in yes:
             print '*** Reading in previously used parameters...'
             print '*'
-            parmDict={}
-            with open(parmFile,'r') as f:
-                s=f.readlines()
-                for line in s[-7:-1]:
-                    listedline=line.strip().split('=')
-                    parmDict[listedline[0]]=listedline[1]
-            f.close()
-            #pulling out the parm values
-            if parmDict['smooth']=='True':
-                smooth=True
-            else:
-                smooth=False
-            funcType=str(parmDict['funcType'])
-            SNRreg=map(float,parmDict['SNRreg'].split(','))
-            xlimits=map(float,parmDict['xlimits'].split(','))
-            ylimits=map(float,parmDict['ylimits'].split(','))
-            temp=map(float,parmDict['RLF'].split(','))
-            RLF=[[temp[0],temp[1]]]
-            for t in range(2,len(temp)-1,2):
-                RLF.insert(0,[temp[t],temp[t+1]])
+            parms=previous[1]
+            smooth=parms['smooth']
+            funcType=parms['funcType']
+            SNRreg=parms['SNRreg']
+            xlimits=parms['xlimits']
+            ylimits=parms['ylimits']
+            RLF=parms['RLF']
             print '*** SNRreg'+'='+str(SNRreg)
             print '*** smooth'+'='+str(smooth)
             print '*** funcType'+'='+str(funcType)
@@ -522,11 +1127,13 @@ def normalize(spectra,
     civ_0=1548.202 #Ang
 
     filename='spectra'+objInfo['shortObjName']+'.eps'
-    #Pull out keys of the incoming dictionaries
-    spectraOriginal=cp.deepcopy(spectra) #keeping a real copy of the original
+    #the raw spectra are held once, read-only, smoothing is derived from them
+    if not isinstance(spectra,SpectraView):
+        spectra=SpectraView(spectra)
+    spectra.setSmoothing(smoothWidth,smoothKernel)
     spectraNormalized={} #will be populated by the normalized data arrays
     keyList=spectra.keys() #just to have a keylist, cause why not
-    normList=cp.deepcopy(keyList) #the list that will be normalized/plotted
+    normList=list(keyList) #the list that will be normalized/plotted
     colourDict={'SDSS':'k','SDSS1':'k','SDSS2':'0.70',
     'BOSS':'r','BOSS1':'r','BOSS2':'b',
     'GEM':'c','GEM1':'c','GEM2':'g','GEM3':'orange'}
@@ -561,20 +1168,13 @@ def normalize(spectra,
             else:
                 print '*** scaling raw spectra to match '+scaleToName
                 validate=True
-    yscale={}
+    #one wavelength index per spectrum, used for every window look-up
+    lamIndex={}
     for spec in spectra:
-        #find the region specified by 1270->1350
-        w=[index for index,value in enumerate(spectra[spec][:,0]) if value > 1590 and value < 1650]
-        #find the mean flux value in that region
-        yscale[spec]=np.mean(spectra[spec][w,1])
-    for spec in yscale:
-        #calculate the ratio between the flux of any given spectrum
-        #and the scaleToName spectrum, this ratio will be the
-        #value you we scale the unnormalized spectra by for easy plotting
-        if spec==scaleToName:
-            continue
-        yscale[spec]=yscale[scaleToName]/yscale[spec]
-    yscale[scaleToName]=1.0
+        with timer.stage('index',spec,len(spectra[spec])):
+            lamIndex[spec]=WavelengthIndex(spectra.lam(spec))
+    with timer.stage('yscale'):
+        yscale=yScale(spectra,scaleToName,lamIndex)
     #while loop only escapes when asked
     #'first' is designed to make the useability easier the while loop first
     #        plots a spectrum, THEN ask the user for input. But 'first' allows
@@ -582,11 +1182,11 @@ def normalize(spectra,
     #        user_input='commands' so the user knows
     if smooth==True:
         print '*** smoothing spectrum'
-        for spec in spectra:
-            spectra[spec][:,1]=np.array(jarTools.boxcarSmooth(spectra[spec][:,1]))
     escape=False
     first=False
     user_input='commands'
+    plot=SpectraPlot(spectra,colourDict,yscale,render)
+    normCount=0 #number of times 'normalize' was run, redraws the continua
     while escape==False:
         if first==False:
             print '------------------------------------------------------------'
@@ -594,27 +1194,16 @@ def normalize(spectra,
             print '------------------------------------------------------------'
             print 'The following spectra have been detected...'
             print 'labels:'+str(keyList)
-            print '*** Plot built, see '+filename
-        plt.clf()
-        plt.rc('text',usetex=True)
-        plt.rc('font',family='sans-serif')
-        plt.xlim(xlimits[0],xlimits[1])
-        plt.ylim(ylimits[0],ylimits[1])
-        for spec in normList:
-            plt.plot(spectra[spec][:,0],(spectra[spec][:,1]*yscale[spec]),color=colourDict[spec])
-        for spec in normList:
-            if spec not in spectraNormalized:
-                continue
-            plt.plot(spectra[spec][:,0],yscale[spec]*(spectra[spec][:,1]/spectraNormalized[spec][:,1]),color=colourDict[spec],linestyle='--')
-        for w in RLF:
-            plt.axvspan(w[0],w[1],facecolor='0.9',linewidth=0)
-        plt.xlabel('Rest-frame Wavelength (\AA)')
-        plt.ylabel('Flux Density (10$^{-17}$ erg s$^{-1}$ cm$^{-2}$ \AA$^{-1}$)')
-        plt.savefig(filename,transparent=False)
+            print '*** Plot built, see '+plot.target(filename)
+        #only the parts of the plot that changed are redrawn/re-written
+        with timer.stage('specDraw'):
+            plot.update(normList,smooth,spectraNormalized,normCount,RLF,xlimits,ylimits)
+        with timer.stage('specSave',plot.target(filename)):
+            plot.save(filename)
 
         #SNRregion validation - do all spectra have coverage for this SNRreg?
         for spec in normList:
-            if max(spectra[spec][:,0])<SNRreg[1]:
+            if np.max(spectra.lam(spec))<SNRreg[1]:
                 print '*** WARNING The SNR region youve selected doesnt'
                 print '    is not fully covered by'+spec
 
@@ -629,11 +1218,9 @@ def normalize(spectra,
             user_input=raw_input('Turn on smoothing? [y,n]:')
             if user_input in yes:
                 smooth=True
-                for spec in spectra:
-                    spectra[spec][:,1]=np.array(jarTools.boxcarSmooth(spectra[spec][:,1]))
+                askSmoothing(spectra)
             elif user_input in no:
                 smooth=False
-                spectra=cp.deepcopy(spectraOriginal)
             else:
                 print user_input+': Not a valid entry. Back to command page.'
             print 'Smoothing:'+str(smooth)
@@ -669,35 +1256,26 @@ def normalize(spectra,
         elif user_input=='q' or user_input=='Q':
             escape=True
             print '------------------------------------------------------------'
-            print 'Writing current normalization parameters to:',parmFile
+            if render=='preview':
+                print 'Writing the publication plot to:',filename
+                plot.publish(filename)
+            print 'Writing current normalization parameters to:',db.path
             print 'SNRreg'+'='+str(SNRreg)
             print 'smooth'+'='+str(smooth)
             print 'funcType'+'='+str(funcType)
             print 'xlimits'+'='+str(xlimits)
             print 'ylimits'+'='+str(ylimits)
             print 'RLF'+'='+str(RLF)
-            now = datetime.datetime.now()
-            outfile=open(parmFile,'a')
-            outfile.write('-------------------------'+now.strftime("%Y-%m-%d %H:%M")+'-------------------------\n')
-            outfile.write('SNRreg'+'='+str(SNRreg[0])+','+str(SNRreg[1])+'\n')
-            outfile.write('smooth'+'='+str(smooth)+'\n')
-            outfile.write('funcType'+'='+str(funcType)+'\n')
-            outfile.write('xlimits'+'='+str(xlimits[0])+','+str(xlimits[1])+'\n')
-            outfile.write('ylimits'+'='+str(ylimits[0])+','+str(ylimits[1])+'\n')
-            outfile.write('RLF=')
-            for r in RLF[:-1]:
-                outfile.write(str(r[0])+','+str(r[1])+',')
-            else:
-                outfile.write(str(RLF[-1][0])+','+str(RLF[-1][1])+'\n')
-            outfile.write('----------------------------------------------------------------------------\n')
-            outfile.close()
+            db.saveParms(objInfo['shortObjName'],'norm',
+                             {'SNRreg':SNRreg,'smooth':smooth,'funcType':funcType,
+                              'xlimits':xlimits,'ylimits':ylimits,'RLF':RLF})
             print '------------------------------------------------------------'
         elif user_input=='commands':
             print '------------------------------------------------------------'
             print 'You can change the parameters which your spectra'
             print 'are normalized by here.'
             print 'Choose one of the commands below, and be sure to refresh'
-            print 'the plot '+filename+' to see the changes.'
+            print 'the plot '+plot.target(filename)+' to see the changes.'
             print ''
             print 'commands       : displays list of all command options'
             print 'q,Q            : to quit the EW measurement'
@@ -706,10 +1284,17 @@ def normalize(spectra,
             print 'xlimits        : create a new xrange by entering [x1,x2]'
             print 'ylimits        : create a new yrange by entering [y1,y2]'
             print 'RLF            : add/remove RLF windows[x1,x2]'
+            print 'autoRLF        : find the RLF windows automatically'
             print 'SNRreg         : change the region SNR is calculated over'
             print 'filename       : change name of image file'
             print 'normalize      : execute normalization.'
             print 'normlist       : add or remove spectra from final plot.'
+            print 'eps            : write the publication (LaTeX) .eps plot now'
+            print '------------------------------------------------------------'
+        elif user_input=='eps':
+            print '------------------------------------------------------------'
+            plot.publish(filename)
+            print 'Wrote the publication plot to:',filename
             print '------------------------------------------------------------'
         elif user_input=='filename':
             print '------------------------------------------------------------'
@@ -761,185 +1346,1539 @@ def normalize(spectra,
             except ValueError:
                 print 'That didnt make any sense, back to command page.'
             print '------------------------------------------------------------'
+        elif user_input=='autoRLF':
+            print '------------------------------------------------------------'
+            print 'Current RLF windows:',RLF
+            try:
+                RLF=autoRLF(spectra,normList,funcType)
+                print 'New RLF windows:',RLF
+            except ValueError as e:
+                print str(e)+', keeping the current windows.'
+            print '------------------------------------------------------------'
+        elif user_input=='normalize' and not normList:
+            print '------------------------------------------------------------'
+            print 'The normList is empty, add spectra with the normlist command first.'
+            print '------------------------------------------------------------'
         elif user_input=='normalize':
             print '------------------------------------------------------------'
-            print 'Writing current normalization parameters to:',parmFile
+            print 'Writing current normalization parameters to:',db.path
             print 'SNRreg'+'='+str(SNRreg)
             print 'smooth'+'='+str(smooth)
             print 'funcType'+'='+str(funcType)
             print 'xlimits'+'='+str(xlimits)
             print 'ylimits'+'='+str(ylimits)
             print 'RLF'+'='+str(RLF)
-            now = datetime.datetime.now()
-            outfile=open(parmFile,'a')
-            outfile.write('-------------------------'+now.strftime("%Y-%m-%d %H:%M")+'-------------------------\n')
-            outfile.write('SNRreg'+'='+str(SNRreg[0])+','+str(SNRreg[1])+'\n')
-            outfile.write('smooth'+'='+str(smooth)+'\n')
-            outfile.write('funcType'+'='+str(funcType)+'\n')
-            outfile.write('xlimits'+'='+str(xlimits[0])+','+str(xlimits[1])+'\n')
-            outfile.write('ylimits'+'='+str(ylimits[0])+','+str(ylimits[1])+'\n')
-            outfile.write('RLF=')
-            for r in RLF[:-1]:
-                outfile.write(str(r[0])+','+str(r[1])+',')
-            else:
-                outfile.write(str(RLF[-1][0])+','+str(RLF[-1][1])+'\n')
-            outfile.write('----------------------------------------------------------------------------\n')
-            outfile.close()
+            db.saveParms(objInfo['shortObjName'],'norm',
+                             {'SNRreg':SNRreg,'smooth':smooth,'funcType':funcType,
+                              'xlimits':xlimits,'ylimits':ylimits,'RLF':RLF})
             print '------------------------------------------------------------'
             print '***Normalizing the following spectra:'
             print normList
             print '(If all the spectra are not in the list above, it is because'
             print 'you took some out of the normlist)'
-            SNRoutput=objInfo['objName'][6:]+' '+str(SNRreg[0])+' '+str(SNRreg[1])
-            lowSNR=False
+            SNRs={}
+            #validate: make sure the datacubes are shape 3 and can be fit
+            #fit the continuum of every spectrum in one go
+            try:
+                with timer.stage('fit'):
+                    fits=fitObject(spectra,normList,RLF,funcType,lamIndex,smooth)
+                fitsMC={}
+                if nreal>0:
+                    print '***Fitting',nreal,'Monte-Carlo realizations of each continuum'
+                    with timer.stage('fitMC'):
+                        fitsMC=fitObjectMC(spectra,normList,RLF,funcType,lamIndex,smooth,
+                                           nreal,seed,nproc)
+            except ValueError as e:
+                print '-----ASIDE:'
+                print '-----'+str(e)
+                print '-----...Exiting entire program'
+                sys.exit()
             for spec in normList:
-                data,normalized,lam,flux,flux_err=[],[],0,0,0
-                #validate: make sure the datacube is shape 3
-                #must move to next one if not
-                if np.shape(spectra[spec])[1]!=3:
-                    print '-----ASIDE:'
-                    print '-----Data Array associated with label -'+spec+'- is INCORRECT shape.'
-                    print '-----Requires 3 columns: lambda,flux,flux_err.'
-                    print '-----...Exiting entire program'
-                    sys.exit()
-                #starting analysis
-                data=spectra[spec]
-                normalized=np.zeros(np.shape(data)) #numpy return array
-                lam=data[:,0]
-                flux=data[:,1]
-                flux_err=data[:,2]
                 print '----------------------------------------------------'
                 print '***Normalizing spectrum: '+spec
-                SNR=0
-                SNR=np.array([])
-                for i in range(len(spectraOriginal[spec][:,0])):
-                    if spectraOriginal[spec][i,0] >= SNRreg[0] and spectraOriginal[spec][i,0] <= SNRreg[1]:
-                        SNR=np.concatenate((SNR,([spectraOriginal[spec][i,1]/spectraOriginal[spec][i,2]])))
-                print '*** SNR in range '+str(SNRreg)+'is '+str(np.median(SNR))
-                #prepping for SNR writeout
-                SNRoutput=SNRoutput+' '+spec+' '+str(np.median(SNR))
-                if np.median(SNR)<=6:
-                    lowSNR=True
-                #identify the indicies that reflect the given RLF windows
-                w=0
-                w=np.array([],dtype=int)
-                for bounds in RLF:
-                    temp_w=[index for index,value in enumerate(lam) if value > bounds[0] and value < bounds[1]]
-                    w=np.concatenate((w,temp_w))
-                    temp_w=[]
+                with timer.stage('normalize',spec,len(spectra[spec])):
+                    normalized,fit,SNR=normalizeSpec(spectra[spec],
+                                                     spectra[spec],
+                                                     RLF,funcType,SNRreg,
+                                                     lamIndex[spec],fits[spec],
+                                                     fitsMC.get(spec))
+                print '*** SNR in range '+str(SNRreg)+'is '+str(SNR)
+                if nreal>0:
+                    print '*** Median continuum uncertainty: '+str(np.median(normalized[:,3]))
+                SNRs[spec]=SNR
                 print '*** Windows used for function fitting:'
                 print RLF
-                #Choose Continuum fitting function
                 if funcType=='poly':
-                    #NOTE: There is a BUILT-IN polyfit function in numpy
                     print '*** Normalizing using a Polynomial Fit'
-                    print '*** Fitting Function to data: y = mx + b'
-                    fit=np.polyfit(lam[w],flux[w],1)
-                    yfit=fit[1]+(fit[0]*lam)
                     print '*** Solution Found: y = ('+str(fit[0])+')x + ('+str(fit[1])+')'
+                elif funcType[:4]=='poly':
+                    print '*** Normalizing using a Polynomial Fit'
+                    print '*** Solution Found (highest power first): '+str(list(fit))
                 elif funcType=='plaw':
-                    #NOTE: was required to BUILD MY OWN power-law function
-                    #it is defined in 'jarTools.powerlaw()'
                     print '*** Normalizing using a Power-law Fit'
-                    print '*** Fitting function to data: y = a*x^b'
-                    fit=jarTools.powerfit(lam[w],flux[w],flux_err[w])
-                    yfit=fit[1]*lam**fit[0]
                     print '*** Solution Found: y = ('+str(fit[1])+')x^('+str(fit[0])+')'
-                else:
-                    print '*** Do not recognize specified fitting function'
-                normalized[:,0]=lam
-                normalized[:,1]=cp.deepcopy(spectraOriginal[spec][:,1])/yfit
-                normalized[:,2]=cp.deepcopy(spectraOriginal[spec][:,2])/yfit
                 spectraNormalized[spec]=normalized
-                outfile=open(normFileList[spec],'w')
-                for i in range(len(normalized)):
-                    outfile.write(str(normalized[i,0]*(1+objInfo['zem']))+' '+
-                                  str(normalized[i,1])+' '+
-                                  str(normalized[i,2])+'\n')
-                outfile.close()
+                with timer.stage('write',spec,len(normalized)):
+                    writeNormSpec(normalized,normFileList[spec],objInfo['zem'],
+                                  precision,binary)
                 print '*** Spectrum Normalized: '+spec
                 print '*** Written to file:',normFileList[spec]
                 print '*** NOTE: normalized the UNsmoothed spectrum'
                 print '*** Finished with: '+spec
             print '------------------------------------------------------------'
             print '*** All spectra are normalized'
-            print '*** writing Signal-to-Noise ratios to file...'
-            outfile=open('SNR_outfile.dat','a')
-            outfile.write(SNRoutput+'\n')
-            outfile.close
+            print '*** writing Signal-to-Noise ratios to:',db.path
+            db.saveSNR(objInfo['shortObjName'],objInfo['objName'][6:],SNRreg,SNRs,
+                       dict((spec,objInfo[spec]) for spec in SNRs))
+            lowSNR=[spec for spec in normList if spec in SNRs and SNRs[spec]<=6]
             if lowSNR:
-                outfile=open('lowSNR_outfile.dat','a')
-                outfile.write(SNRoutput+'\n')
-                outfile.close
+                print '*** NOTE: low SNR (<=6) spectra:',lowSNR
+            noSNR=[spec for spec in normList if spec in SNRs and np.isnan(SNRs[spec])]
+            if noSNR:
+                print '*** NOTE: no SNR (SNRreg not covered) for:',noSNR
+            normCount+=1
             print '*** calling plotting program'
-            plotNorm(spectraNormalized,normList,RLF,colourDict,objInfo)
+            width,kernel=spectra.smoothing
+            plotNorm(SpectraView(spectraNormalized),normList,RLF,colourDict,objInfo,
+                     smoothWidth=width,smoothKernel=kernel,render=render,
+                     db=db)
             user_input='commands'
             first=False
+    plot.close()
     print '-------------------------EXITING----------------------------'
     print '------------------------Normalizer--------------------------'
     print '------------------------------------------------------------'
     print '-----------------------..EXITING..--------------------------'
     print '-------------------------Program----------------------------'
     return spectraNormalized
+
+def previousParms(db,shortObjName,kind):
+    '''
+    The latest normalization (kind='norm') or plotting (kind='plot')
+    parameters of an object as (where from,parms{}): from the normDB.NormDB
+    db, or else from an old normJHHMMSS.parm/plotJHHMMSS.parm file.
+    None if there are neither.
+    '''
+    latest=db.latestParms(shortObjName,kind)
+    if latest is not None:
+        return db.path+' ('+latest[0]+')',latest[1]
+    parmFile=kind+shortObjName+'.parm'
+    if os.path.exists(parmFile):
+        if kind=='norm':
+            return parmFile,readNormParm(parmFile)
+        return parmFile,readPlotParm(parmFile)
+    return None
+
+def readPlotParm(parmFile):
+    '''
+    Reads the most recent block of an old plotJHHMMSS.parm file and returns a
+    dictionary of: annotations, lw, xlimits, ylimits, RLF
+    '''
+    parmDict={}
+    with open(parmFile,'r') as f:
+        s=f.readlines()
+        for line in s[-6:-1]:
+            listedline=line.strip().split('=')
+            parmDict[listedline[0]]=listedline[1]
+    parms={}
+    parms['annotations']=(parmDict['annotations']=='True')
+    parms['lw']=float(parmDict['lw'])
+    parms['xlimits']=map(float,parmDict['xlimits'].split(','))
+    parms['ylimits']=map(float,parmDict['ylimits'].split(','))
+    temp=map(float,parmDict['RLF'].split(','))
+    RLF=[[temp[0],temp[1]]]
+    for t in range(2,len(temp)-1,2):
+        RLF.insert(0,[temp[t],temp[t+1]])
+    parms['RLF']=RLF
+    return parms
+
+def readNormParm(parmFile):
+    '''
+    Reads the most recent block of an old normJHHMMSS.parm file and returns a
+    dictionary of: SNRreg, smooth, funcType, xlimits, ylimits, RLF
+    '''
+    parmDict={}
+    with open(parmFile,'r') as f:
+        s=f.readlines()
+        for line in s[-7:-1]:
+            listedline=line.strip().split('=')
+            parmDict[listedline[0]]=listedline[1]
+    parms={}
+    parms['smooth']=(parmDict['smooth']=='True')
+    parms['funcType']=str(parmDict['funcType'])
+    parms['SNRreg']=map(float,parmDict['SNRreg'].split(','))
+    parms['xlimits']=map(float,parmDict['xlimits'].split(','))
+    parms['ylimits']=map(float,parmDict['ylimits'].split(','))
+    temp=map(float,parmDict['RLF'].split(','))
+    RLF=[[temp[0],temp[1]]]
+    for t in range(2,len(temp)-1,2):
+        RLF.insert(0,[temp[t],temp[t+1]])
+    parms['RLF']=RLF
+    return parms
+
+def polyOrder(funcType):
+    '''
+    Order of the polynomial for funcType 'poly' (first order) or 'polyN'
+    (N-th order), None for a power-law (funcType 'plaw').
+    '''
+    if funcType=='plaw':
+        return None
+    if funcType=='poly':
+        return 1
+    if funcType[:4]=='poly' and funcType[4:].isdigit():
+        return int(funcType[4:])
+    raise ValueError('Do not recognize specified fitting function: '+str(funcType))
+
+def fitContinua(lams,fluxes,flux_errs,funcType='plaw',maxDrop=None):
+    '''
+    Fits the continuum of many spectra in one batched call to continuumFit.
+    lams,fluxes,flux_errs are lists holding the pixels (i.e., the RLF
+    windows) of each spectrum to fit. funcType is 'plaw' (y = a*x^b,
+    weighted by flux_err) or 'poly'/'polyN' (unweighted polynomial, like
+    np.polyfit). Returns arrays of the fit parameters and their covariances,
+    a spectrum that could not be fit has NaN parameters. The power-law is
+    fit in log space, without the flux<=0 pixels, maxDrop see
+    continuumFit.powerfitBatch().
+    '''
+    order=polyOrder(funcType)
+    if order is None:
+        return continuumFit.powerfitBatch(lams,fluxes,flux_errs,maxDrop)
+    return continuumFit.linfitBatch(lams,fluxes,order=order)
+
+def continuum(fit,lam,funcType='plaw'):
+    '''
+    The continuum (yfit) given by the fit parameters, evaluated over lam
+    '''
+    if polyOrder(funcType) is None:
+        return fit[1]*lam**fit[0]
+    return np.polyval(fit,lam)
+
+def fitContinuum(lam,flux,flux_err,w,funcType='plaw'):
+    '''
+    Fits the continuum to the pixels w (i.e., the RLF windows) of a single
+    spectrum. Returns the fit parameters and the continuum (yfit) evaluated
+    over all of lam.
+    '''
+    fits,covs=fitContinua([lam[w]],[flux[w]],[flux_err[w]],funcType)
+    if not np.all(np.isfinite(fits[0])):
+        raise ValueError('Could not fit the continuum, too few pixels in the RLF windows.')
+    return fits[0],continuum(fits[0],lam,funcType)
+
+def rlfPixels(spectra,specList,RLF,lamIndex=None,smooth=False):
+    '''
+    The lambda,flux,flux_err pixels in the RLF windows of every spectrum in
+    specList (the smoothed flux if smooth=True), as three lists, see
+    fitObject(). Raises ValueError naming a spectrum of the wrong shape.
+    '''
+    if not isinstance(spectra,SpectraView):
+        spectra=SpectraView(spectra)
+    lams,fluxes,flux_errs=[],[],[]
+    for spec in specList:
+        data=spectra[spec]
+        if np.ndim(data)!=2 or np.shape(data)[1]!=3:
+            raise ValueError('Data Array associated with label -'+spec+'- is INCORRECT shape. Requires 3 columns: lambda,flux,flux_err.')
+        if lamIndex is None:
+            w=WavelengthIndex(spectra.lam(spec)).indices(RLF)
+        else:
+            w=lamIndex[spec].indices(RLF)
+        lams.append(spectra.lam(spec)[w])
+        fluxes.append(spectra.flux(spec,smooth)[w])
+        flux_errs.append(spectra.err(spec)[w])
+    return lams,fluxes,flux_errs
+
+def yScale(spectra,scaleToName,lamIndex=None,window=[1590,1650]):
+    '''
+    The factors that scale the flux of each spectrum to the mean flux of
+    spectrum scaleToName over window, so the raw spectra plot near each
+    other. lamIndex{} holds the WavelengthIndex of each spectrum (built
+    here if not given).
+    '''
+    if not isinstance(spectra,SpectraView):
+        spectra=SpectraView(spectra)
+    yscale={}
+    for spec in spectra:
+        if lamIndex is None:
+            w=WavelengthIndex(spectra.lam(spec)).window(window[0],window[1])
+        else:
+            w=lamIndex[spec].window(window[0],window[1])
+        #find the mean flux value in that region
+        yscale[spec]=np.mean(spectra.flux(spec)[w])
+    for spec in yscale:
+        #calculate the ratio between the flux of any given spectrum
+        #and the scaleToName spectrum, this ratio will be the
+        #value you we scale the unnormalized spectra by for easy plotting
+        if spec==scaleToName:
+            continue
+        yscale[spec]=yscale[scaleToName]/yscale[spec]
+    yscale[scaleToName]=1.0
+    return yscale
+
+def fitObject(spectra,specList,RLF,funcType='plaw',lamIndex=None,smooth=False):
+    '''
+    Fits the continuum to the RLF windows of every spectrum in specList
+    with one batched call (to the smoothed spectra if smooth=True).
+    spectra is a SpectraView (or a spectra{} dictionary), lamIndex{} holds
+    the WavelengthIndex of each spectrum (built here if not given).
+    Returns a dictionary of the fit parameters of each spectrum, raises
+    ValueError naming the spectrum if one has the wrong shape or cannot be fit.
+    '''
+    lams,fluxes,flux_errs=rlfPixels(spectra,specList,RLF,lamIndex,smooth)
+    fits,covs=fitContinua(lams,fluxes,flux_errs,funcType)
+    fitDict={}
+    for i,spec in enumerate(specList):
+        if not np.all(np.isfinite(fits[i])):
+            raise ValueError('Could not fit the continuum of -'+spec+'-, too few pixels in the RLF windows.')
+        fitDict[spec]=fits[i]
+    return fitDict
+
+def fitObjectMC(spectra,specList,RLF,funcType='plaw',lamIndex=None,smooth=False,
+                nreal=1000,seed=None,nproc=None):
+    '''
+    Monte-Carlo version of fitObject(): nreal realizations of the fit of
+    every spectrum, see fitContinuaMC() (each spectrum's realizations are
+    keyed on its index in sorted(spectra), whatever specList holds).
+    Returns a dictionary of the nreal x nparam fit parameters of each
+    spectrum.
+    '''
+    lams,fluxes,flux_errs=rlfPixels(spectra,specList,RLF,lamIndex,smooth)
+    keys=[sorted(spectra).index(spec) for spec in specList]
+    fits=fitContinuaMC(lams,fluxes,flux_errs,funcType,nreal,seed,nproc,keys)
+    for i,spec in enumerate(specList):
+        mcWarning(fits[i],spec)
+    return dict((spec,fits[i]) for i,spec in enumerate(specList))
+
+def fitContinuaMC(lams,fluxes,flux_errs,funcType='plaw',nreal=1000,seed=None,
+                  nproc=None,keys=None,maxDrop=0.05):
+    '''
+    Monte-Carlo continuum fits: each data set (e.g., the RLF pixels of a
+    spectrum) is perturbed nreal times by gaussian noise of flux_err, and
+    all realizations of all data sets are fit in one batched fitContinua()
+    call. With nproc>1 the realizations are split over a pool of nproc
+    processes. seed makes the realizations repeatable (for a given nproc):
+    data set i draws from its own RandomState([seed,keys[i]]) (keys default
+    to 0,1,2,..., the index in the object's sorted spectra), so a spectrum
+    gets the same realizations whether it is fit with the others or alone
+    (see streamNormalize()). Returns an nset x nreal x nparam array, NaN for
+    realizations that could not be fit. A power-law realization with more
+    than maxDrop of its pixels perturbed to flux<=0 is not fit either (see
+    continuumFit.powerfitBatch()), see mcWarning().
+    '''
+    if keys is None:
+        keys=range(len(lams))
+    if nproc is not None and nproc>1 and nreal>1:
+        import multiprocessing
+        nproc=min(nproc,nreal)
+        seeds=np.random.RandomState(seed).randint(2**31-1,size=nproc)
+        parts=[(lams,fluxes,flux_errs,funcType,nreal//nproc+(i<nreal%nproc),seeds[i],
+                None,keys,maxDrop) for i in range(nproc)]
+        pool=multiprocessing.Pool(nproc)
+        try:
+            fits=pool.map(fitContinuaMCPart,parts)
+        finally:
+            pool.close()
+            pool.join()
+        return np.concatenate(fits,axis=1)
+    xs,ys,errs=[],[],[]
+    for lam,flux,flux_err,key in zip(lams,fluxes,flux_errs,keys):
+        rng=np.random.RandomState(None if seed is None else [seed,key])
+        flux=np.asarray(flux,dtype=float)
+        flux_err=np.asarray(flux_err,dtype=float)
+        realizations=flux+flux_err*rng.standard_normal((nreal,len(flux)))
+        xs.extend([lam]*nreal)
+        ys.extend(realizations)
+        errs.extend([flux_err]*nreal)
+    fits,covs=fitContinua(xs,ys,errs,funcType,maxDrop)
+    return fits.reshape(len(lams),nreal,-1)
+
+def mcWarning(fits,name):
+    '''
+    Prints a warning if some of the Monte-Carlo realizations (nreal x
+    nparam, see fitContinuaMC()) of spectrum name could not be fit: at low
+    SNR those are the ones with many flux<=0 pixels, so the continuum
+    uncertainty of the rest is underestimated.
+    '''
+    lost=np.count_nonzero(~np.all(np.isfinite(fits),axis=1))
+    if lost>0:
+        print '*** Warning: %d of %d Monte-Carlo realizations of %s could not be fit' % (
+            lost,len(fits),name),
+        print '(too many flux<=0 pixels?), its continuum uncertainty is underestimated.'
+
+def fitContinuaMCPart(part):
+    '''
+    one pool process' share of fitContinuaMC(),
+    part=(lams,fluxes,flux_errs,funcType,nreal,seed,nproc,keys,maxDrop)
+    '''
+    return fitContinuaMC(*part)
+
+def continuumScatter(fits,lam,funcType='plaw',chunk=2000):
+    '''
+    Standard deviation over many fits (nfit x nparam, e.g. one spectrum's
+    realizations from fitContinuaMC()) of their continua, pixel by pixel
+    over lam. Fits with NaN parameters are left out. The continua are
+    evaluated chunk pixels at a time, so memory stays at nfit x chunk.
+    '''
+    fits=np.asarray(fits,dtype=float)
+    fits=fits[np.all(np.isfinite(fits),axis=1)]
+    lam=np.asarray(lam,dtype=float)
+    sigma=np.zeros(len(lam))
+    for i in range(0,len(lam),chunk):
+        l=lam[np.newaxis,i:i+chunk]
+        if polyOrder(funcType) is None:
+            y=fits[:,1:2]*l**fits[:,0:1]
+        else:
+            #Horner's rule, highest power first like np.polyval
+            y=np.zeros((len(fits),l.shape[1]))
+            for c in fits.T:
+                y=y*l+c[:,np.newaxis]
+        sigma[i:i+chunk]=y.std(axis=0)
+    return sigma
+
+def kernelArray(width=3,kernel='boxcar'):
+    '''
+    The (unnormalized) smoothing kernel of smoothSpec()
+    '''
+    if kernel=='boxcar':
+        return np.ones(max(int(width),1))
+    if kernel=='gaussian':
+        sigma=width/(2.*np.sqrt(2.*np.log(2.)))
+        half=max(int(np.ceil(3*sigma)),1)
+        x=np.arange(-half,half+1)
+        return np.exp(-0.5*(x/sigma)**2)
+    raise ValueError('Do not recognize smoothing kernel: '+str(kernel))
+
+def autoRLF(spectra,specList,funcType='plaw',region=[1280,1800],nsigma=[2.,3.],
+            binWidth=5,minWidth=10,minFrac=0.8,maxIter=10):
+    '''
+    Finds the RLF windows automatically. The continuum of every spectrum in
+    specList is fit (one batched fitContinua() call per iteration) to its
+    unclipped pixels over region, pixels more than nsigma=[below,above]
+    sigma from the median residual (absorption/emission) are clipped, where
+    sigma is the robust scatter of the residuals (at least flux_err), and
+    this repeats
+    until no pixel changes (or maxIter). Then region is cut into binWidth
+    Angstrom bins, a bin is continuum if at least minFrac of its pixels
+    survived in every spectrum covering it, and each run of continuum bins
+    at least minWidth Angstroms long is a window.
+    Returns RLF=[[x1,x2],...], raises ValueError if no window is found.
+    '''
+    if not isinstance(spectra,SpectraView):
+        spectra=SpectraView(spectra)
+    lams,fluxes,errs,keep=[],[],[],[]
+    for spec in specList:
+        w=WavelengthIndex(spectra.lam(spec)).indices([region])
+        lams.append(spectra.lam(spec)[w])
+        fluxes.append(spectra.flux(spec)[w])
+        errs.append(spectra.err(spec)[w])
+        keep.append(np.isfinite(fluxes[-1])&(errs[-1]>0))
+    for iteration in range(maxIter):
+        fits,covs=fitContinua([l[k] for l,k in zip(lams,keep)],
+                              [f[k] for f,k in zip(fluxes,keep)],
+                              [e[k] for e,k in zip(errs,keep)],funcType)
+        changed=False
+        for i in range(len(specList)):
+            if not np.all(np.isfinite(fits[i])):
+                raise ValueError('Could not fit the continuum of -'+specList[i]+'- while finding the RLF windows.')
+            with np.errstate(invalid='ignore',divide='ignore'):
+                resid=(fluxes[i]-continuum(fits[i],lams[i],funcType))/errs[i]
+            #clip about the median of the kept residuals, by their robust
+            #scatter (in units of flux_err, at least 1): while the fit is
+            #still poor both are large, so the continuum is not thrown away
+            centre=np.median(resid[keep[i]])
+            sigma=max(1.4826*np.median(np.abs(resid[keep[i]]-centre)),1.)
+            new=(resid>centre-nsigma[0]*sigma)&(resid<centre+nsigma[1]*sigma)
+            changed|=np.any(new!=keep[i])
+            keep[i]=new
+        if not changed:
+            break
+    edges=np.arange(region[0],region[1]+binWidth,binWidth,dtype=float)
+    good=np.ones(len(edges)-1,dtype=bool)
+    covered=np.zeros(len(edges)-1,dtype=bool)
+    for i in range(len(specList)):
+        total=np.histogram(lams[i],edges)[0]
+        kept=np.histogram(lams[i][keep[i]],edges)[0]
+        good&=(total==0)|(kept>=minFrac*total)
+        covered|=total>0
+    good&=covered
+    #runs of good bins
+    change=np.diff(np.concatenate(([0],good.astype(int),[0])))
+    starts=np.flatnonzero(change==1)
+    ends=np.flatnonzero(change==-1)
+    RLF=[[float(edges[a]),float(edges[b])] for a,b in zip(starts,ends) if edges[b]-edges[a]>=minWidth]
+    if not RLF:
+        raise ValueError('No continuum windows found in '+str(region))
+    return RLF
+
+def smoothSpec(flux,width=3,kernel='boxcar'):
+    '''
+    Smooths flux by convolving it with a boxcar (width pixels wide) or a
+    gaussian (FWHM of width pixels, cut at 3 sigma) kernel. Near the ends
+    of the spectrum the kernel is renormalized over the pixels that exist,
+    so the edges are not pulled towards zero.
+    '''
+    flux=np.asarray(flux,dtype=float)
+    k=kernelArray(width,kernel)
+    if len(k)==1 or len(flux)==0:
+        return flux.copy()
+    #'full' convolution, cut down to the pixels of flux (centred kernel)
+    start=(len(k)-1)//2
+    smoothed=np.convolve(flux,k)[start:start+len(flux)]
+    norm=np.convolve(np.ones(len(flux)),k)[start:start+len(flux)]
+    return smoothed/norm
+
+def askSmoothing(spectra):
+    '''
+    Asks the user for the smoothing width/kernel of a SpectraView
+    '''
+    width,kernel=spectra.smoothing
+    print 'Current smoothing: width='+str(width)+' kernel='+kernel
+    user_input=raw_input('Enter new width,kernel (boxcar/gaussian) or press enter to keep:')
+    if user_input.strip()=='':
+        return
+    try:
+        temp=user_input.split(',')
+        width=float(temp[0])
+        if len(temp)>1:
+            kernel=temp[1].strip()
+        if kernel not in ['boxcar','gaussian']:
+            raise ValueError(kernel)
+        spectra.setSmoothing(width,kernel)
+    except ValueError:
+        print 'Not a valid smoothing, keeping width='+str(spectra.smoothing[0])+' kernel='+spectra.smoothing[1]
+
+class SpectraView(object):
+    '''
+    Holds the spectra{} of an object once, read-only, and derives the
+    smoothed spectra from them lazily. Nothing is copied: view[spec] is a
+    read-only view of the raw N x 3 array (the caller's arrays stay
+    writeable) and lam()/flux()/err() are views of its columns.
+    The only new arrays are the smoothed fluxes, calculated by smoothSpec()
+    the first time they are asked for and kept, keyed by
+    (spectrum, width, kernel), so switching smoothing on/off or back to an
+    earlier width/kernel never smooths a spectrum twice.
+    '''
+    def __init__(self,spectra,smoothWidth=3,smoothKernel='boxcar'):
+        self.raw=collections.OrderedDict()
+        self.smoothed={}
+        self.smoothing=(smoothWidth,smoothKernel)
+        for spec in spectra:
+            self.raw[spec]=spectra[spec]
+            if isinstance(spectra[spec],np.ndarray):
+                self.raw[spec]=spectra[spec].view()
+                self.raw[spec].flags.writeable=False
+
+    def __getitem__(self,spec):
+        return self.raw[spec]
+
+    def __iter__(self):
+        return iter(self.raw)
+
+    def __contains__(self,spec):
+        return spec in self.raw
+
+    def __len__(self):
+        return len(self.raw)
+
+    def keys(self):
+        return self.raw.keys()
+
+    def lam(self,spec):
+        return self.raw[spec][:,0]
+
+    def err(self,spec):
+        return self.raw[spec][:,2]
+
+    def setSmoothing(self,width,kernel='boxcar'):
+        '''
+        width/kernel used by flux(spec,smooth=True) from now on
+        '''
+        self.smoothing=(width,kernel)
+
+    def flux(self,spec,smooth=False):
+        '''
+        the raw flux of spec, or its smoothed flux if smooth=True
+        '''
+        if not smooth:
+            return self.raw[spec][:,1]
+        key=(spec,)+self.smoothing
+        if key not in self.smoothed:
+            with timer.stage('smooth',spec,len(self.raw[spec])):
+                self.smoothed[key]=smoothSpec(self.raw[spec][:,1],*self.smoothing)
+        return self.smoothed[key]
+
+class WavelengthIndex(object):
+    '''
+    Built once per spectrum from its wavelength column, answers
+    window -> pixel look-ups with a binary search instead of a scan over
+    every pixel. The wavelength column is expected to be monotonic, if it
+    is not it is argsorted once and index arrays are returned instead of
+    slices.
+    '''
+    def __init__(self,lam):
+        self.lam=np.asarray(lam)
+        self.order=None
+        self.sortedLam=self.lam
+        if np.any(np.diff(self.lam)<0):
+            self.order=np.argsort(self.lam,kind='mergesort')
+            self.sortedLam=self.lam[self.order]
+
+    def window(self,x1,x2,closed=False):
+        '''
+        pixels with x1 < lambda < x2 (x1 <= lambda <= x2 if closed=True),
+        as a slice (or a sorted index array if lambda isn't monotonic)
+        '''
+        if closed:
+            lo=np.searchsorted(self.sortedLam,x1,side='left')
+            hi=np.searchsorted(self.sortedLam,x2,side='right')
+        else:
+            lo=np.searchsorted(self.sortedLam,x1,side='right')
+            hi=np.searchsorted(self.sortedLam,x2,side='left')
+        hi=max(lo,hi)
+        if self.order is None:
+            return slice(lo,hi)
+        return np.sort(self.order[lo:hi])
+
+    def indices(self,windows,closed=False):
+        '''
+        concatenated pixel indices of a list of windows [[x1,x2],...],
+        in the order the windows are given
+        '''
+        w=[np.array([],dtype=int)]
+        for bounds in windows:
+            pix=self.window(bounds[0],bounds[1],closed)
+            if isinstance(pix,slice):
+                pix=np.arange(pix.start,pix.stop)
+            w.append(pix)
+        return np.concatenate(w)
+
+def normalizeSpec(data,original,RLF,funcType='plaw',SNRreg=[1600,1700],
+                  index=None,fit=None,fitMC=None):
+    '''
+    The fit-and-divide part of normalize() for a single spectrum, no
+    user input required.
+
+    data     : (possibly smoothed) spectrum the continuum is fit to
+    original : the unsmoothed spectrum, which is what gets normalized
+    index    : WavelengthIndex of the spectrum (built here if not given)
+    fit      : continuum fit parameters, e.g. from fitObject() (fit here
+               if not given)
+    fitMC    : Monte-Carlo realizations of the fit, e.g. from fitObjectMC(),
+               if given a 4th column is added, the continuum uncertainty
+               (standard deviation of the realizations / yfit)
+    returns the normalized array, the fit parameters and the median SNR
+    over SNRreg (calculated from the unsmoothed spectrum)
+    '''
+    if np.ndim(data)!=2 or np.shape(data)[1]!=3:
+        raise ValueError('INCORRECT shape. Requires 3 columns: lambda,flux,flux_err.')
+    lam=data[:,0]
+    flux=data[:,1]
+    flux_err=data[:,2]
+    if index is None:
+        index=WavelengthIndex(lam)
+    if fit is None:
+        #identify the indicies that reflect the given RLF windows
+        w=index.indices(RLF)
+        fit,yfit=fitContinuum(lam,flux,flux_err,w,funcType)
+    else:
+        yfit=continuum(fit,lam,funcType)
+    normalized=np.zeros((len(lam),3 if fitMC is None else 4)) #numpy return array
+    normalized[:,0]=lam
+    normalized[:,1]=original[:,1]/yfit
+    normalized[:,2]=original[:,2]/yfit
+    if fitMC is not None:
+        normalized[:,3]=continuumScatter(fitMC,lam,funcType)/yfit
+    return normalized,fit,calcSNR(original,SNRreg,index)
+
+def calcSNR(spectrum,SNRreg,index=None):
+    '''
+    Median signal-to-noise (flux/flux_err) of spectrum over SNRreg=[x1,x2],
+    x1 <= lambda <= x2. SNRreg may also be a list of regions
+    [[x1,x2],[x3,x4],...], in which case an array holding the median SNR of
+    each region is returned. Regions are found with the spectrum's
+    WavelengthIndex (built here if not given).
+    '''
+    if index is None:
+        index=WavelengthIndex(spectrum[:,0])
+    regions=np.atleast_2d(np.asarray(SNRreg,dtype=float))
+    SNR=np.zeros(len(regions))
+    for i,r in enumerate(regions):
+        w=index.window(r[0],r[1],closed=True)
+        SNR[i]=np.median(spectrum[w,1]/spectrum[w,2])
+    if np.ndim(SNRreg[0])==0:
+        return SNR[0]
+    return SNR
+
+def writeNormSpec(normalized,outFile,zem,precision=None,binary=None,
+                  chunk=100000):
+    '''
+    Writes a normalized spectrum to outFile, shifted back to the observed frame.
+
+    The ascii file is formatted in bulk, chunk rows per write. precision is
+    the number of significant digits written (default: full precision, the
+    same as str() gives). binary='npy' or 'fits' also writes the columns
+    to outFile+'.npy' or outFile+'.fits' (the latter requires astropy).
+    A 4th column (the continuum uncertainty, see normalizeSpec()) is
+    written as well. The files are written under temporary names and
+    renamed when complete (see renameOutputs()), so a run killed half way
+    never leaves a partial file behind.
+    '''
+    if binary not in [None,'npy','fits']:
+        raise ValueError('Do not recognize binary output format: '+str(binary))
+    out=np.column_stack((normalized[:,0]*(1+zem),normalized[:,1:]))
+    outputs=outputNames(outFile,binary)
+    try:
+        with open(outputs[outFile],'w') as outfile:
+            for i in range(0,len(out),chunk):
+                outfile.write(formatRows(out[i:i+chunk],precision))
+        if binary=='npy':
+            with open(outputs[outFile+'.npy'],'wb') as f:
+                np.save(f,out)
+        elif binary=='fits':
+            from astropy.io import fits
+            cols=[fits.Column(name=name,format='D',array=out[:,i]) for i,name in
+                  enumerate(['lambda','flux','flux_err','cont_err'][:out.shape[1]])]
+            fits.BinTableHDU.from_columns(cols).writeto(outputs[outFile+'.fits'],overwrite=True)
+    except:
+        removeOutputs(outputs)
+        raise
+    renameOutputs(outputs)
+
+def outputNames(outFile,binary=None):
+    '''
+    {final name:temporary name} of the files writeNormSpec() or
+    streamNormalize() write for outFile (and outFile+'.npy'/'.fits')
+    '''
+    names=[outFile]
+    if binary is not None:
+        names.append(outFile+'.'+binary)
+    return dict((name,name+'.'+str(os.getpid())+'.tmp') for name in names)
+
+def renameOutputs(outputs):
+    '''
+    Renames the complete temporary files of outputNames() to their final
+    names (an atomic replace of any old file)
+    '''
+    for name in outputs:
+        os.rename(outputs[name],name)
+
+def removeOutputs(outputs):
+    '''
+    Removes whatever temporary files of outputNames() were written
+    '''
+    for name in outputs:
+        if os.path.exists(outputs[name]):
+            os.remove(outputs[name])
+
+def formatRows(block,precision=None):
+    '''
+    The rows of block as space separated ascii lines, at full precision (the
+    same as str() gives) or with precision significant digits.
+    '''
+    if precision is None:
+        fmt='%r'
+    else:
+        fmt='%.'+str(int(precision))+'g'
+    rowFmt=' '.join([fmt]*block.shape[1])+'\n'
+    return (rowFmt*len(block)) % tuple(block.ravel().tolist())
+
+def spectrumChunks(path,chunk=100000):
+    '''
+    Reads the lambda,flux,flux_err columns of a raw ascii spectrum chunk
+    lines at a time, a generator of (at most) chunk x 3 arrays, parsed by
+    parseRows() like readAscii() does. spec-lite .fits files are read chunk table rows
+    at a time (see specLite.specLiteChunks()).
+    '''
+    if specLite.isFits(path):
+        for block in specLite.specLiteChunks(path,chunk):
+            yield block
+        return
+    with open(path,'r') as f:
+        while True:
+            lines=list(itertools.islice(f,chunk))
+            if not lines:
+                break
+            block=parseRows(lines,path)
+            if len(block):
+                yield block
+
+def streamNormalize(path,outFile,zem,RLF,funcType='plaw',SNRreg=[1600,1700],
+                    smooth=False,smoothWidth=3,smoothKernel='boxcar',
+                    precision=None,binary=None,chunk=100000,nreal=0,seed=None,
+                    mcKey=0,stage=nullStage):
+    '''
+    normalizeSpec()+writeNormSpec() for a raw (observed-frame) ascii
+    spectrum that is never held in memory as a whole.
+
+    Pass 1 reads path chunk rows at a time and keeps only the pixels of the
+    RLF windows and SNRreg (with smooth=True also the neighbouring pixels
+    the smoothing kernel reaches), the continuum is fit to those. Pass 2
+    reads path again, divides each chunk by the continuum and writes it to
+    outFile. binary='npy' is written chunk by chunk as well, 'fits' is not
+    supported. With nreal>0 the continuum uncertainty column is added from
+    nreal Monte-Carlo realizations of the fit (see fitContinuaMC(), mcKey
+    is the spectrum's index in the object's sorted spectra, so seed gives
+    the same realizations as normalizeObject()). The pixels written are
+    counted into stage (a StageTimer stage) chunk by chunk.
+    Returns the fit parameters and the median SNR over SNRreg, the same as
+    normalizeSpec() gives for the whole spectrum.
+    '''
+    if binary not in [None,'npy']:
+        raise ValueError('Streaming can not write binary output format: '+str(binary))
+    SNRreg=np.asarray(SNRreg,dtype=float)
+    pad=len(kernelArray(smoothWidth,smoothKernel)) if smooth else 0
+    pad=max(pad,1)
+    #pass 1: keep the pixels of the windows (+pad pixels either side),
+    #the last pad pixels of a chunk are held back until the next chunk
+    #shows whether they are needed
+    keptIdx,keptRows=[],[]
+    heldIdx,heldRows,heldKeep=np.zeros(0,dtype=int),np.zeros((0,3)),np.zeros(0,dtype=bool)
+    npix=0
+    for block in spectrumChunks(path,chunk):
+        rows=np.concatenate((heldRows,block))
+        idx=np.concatenate((heldIdx,np.arange(npix,npix+len(block))))
+        keep=np.concatenate((heldKeep,np.zeros(len(block),dtype=bool)))
+        npix+=len(block)
+        lam=rows[:,0]/(1.+zem)
+        w=(lam>=SNRreg[0])&(lam<=SNRreg[1])
+        for r in RLF:
+            w|=(lam>r[0])&(lam<r[1])
+        keep|=np.convolve(w,np.ones(2*pad+1))[pad:pad+len(w)]>0
+        last=max(len(rows)-pad,0)
+        keptIdx.append(idx[:last][keep[:last]])
+        keptRows.append(rows[:last][keep[:last]])
+        heldIdx,heldRows,heldKeep=idx[last:],rows[last:],keep[last:]
+    keptIdx.append(heldIdx[heldKeep])
+    keptRows.append(heldRows[heldKeep])
+    idx=np.concatenate(keptIdx)
+    rows=np.concatenate(keptRows)
+    if len(rows)==0:
+        raise ValueError('No pixels in the RLF windows or SNRreg of '+path)
+    rows[:,0]=rows[:,0]/(1.+zem)
+    lam,flux,flux_err=rows[:,0],rows[:,1],rows[:,2]
+    if smooth:
+        #smooth each run of consecutive pixels on its own, every window
+        #pixel is pad pixels from the end of its run (or at the spectrum's end)
+        smoothed=np.zeros(len(flux))
+        runs=np.flatnonzero(np.diff(idx)!=1)+1
+        for a,b in zip(np.concatenate(([0],runs)),np.concatenate((runs,[len(idx)]))):
+            smoothed[a:b]=smoothSpec(flux[a:b],smoothWidth,smoothKernel)
+    else:
+        smoothed=flux
+    w=np.zeros(len(lam),dtype=bool)
+    for r in RLF:
+        w|=(lam>r[0])&(lam<r[1])
+    fits,covs=fitContinua([lam[w]],[smoothed[w]],[flux_err[w]],funcType)
+    fit=fits[0]
+    if not np.all(np.isfinite(fit)):
+        raise ValueError('Could not fit the continuum of '+path+', too few pixels in the RLF windows.')
+    if nreal>0:
+        fitMC=fitContinuaMC([lam[w]],[smoothed[w]],[flux_err[w]],funcType,nreal,seed,
+                            keys=[mcKey])[0]
+        mcWarning(fitMC,path)
+    s=(lam>=SNRreg[0])&(lam<=SNRreg[1])
+    SNR=np.median(flux[s]/flux_err[s])
+
+    #pass 2: divide and write, chunk by chunk (to temporary files, renamed
+    #when complete as in writeNormSpec())
+    outputs=outputNames(outFile,binary)
+    try:
+        if binary=='npy':
+            npy=np.lib.format.open_memmap(outputs[outFile+'.npy'],mode='w+',
+                                          shape=(npix,3 if nreal<=0 else 4))
+        outfile=open(outputs[outFile],'w')
+        row=0
+        for block in spectrumChunks(path,chunk):
+            lam=block[:,0]/(1.+zem)
+            yfit=continuum(fit,lam,funcType)
+            out=np.column_stack((lam*(1+zem),block[:,1]/yfit,block[:,2]/yfit))
+            if nreal>0:
+                out=np.column_stack((out,continuumScatter(fitMC,lam,funcType)/yfit))
+            outfile.write(formatRows(out,precision))
+            if binary=='npy':
+                npy[row:row+len(out)]=out
+            row+=len(out)
+            stage.npix+=len(out)
+        outfile.close()
+        if binary=='npy':
+            del npy #flushes it to disk
+    except:
+        removeOutputs(outputs)
+        raise
+    renameOutputs(outputs)
+    return fit,SNR
+
+def readAscii(path):
+    '''
+    Reads the lambda,flux,flux_err columns of an ascii spectrum. Plain
+    three column files (no header, comments or blank lines) are parsed in
+    one np.fromstring call, anything else by parseRows().
+    '''
+    with open(path,'r') as f:
+        text=f.read()
+    nrows=text.count('\n')+(0 if text.endswith('\n') else 1)
+    if len(text.split('\n',1)[0].split())==3:
+        values=np.fromstring(text,sep=' ')
+        if len(values)==3*nrows:
+            return values.reshape(nrows,3)
+    return parseRows(text.splitlines(),path)
+
+def parseRows(lines,path):
+    '''
+    The lambda,flux,flux_err columns of lines of the ascii spectrum path,
+    as an N x 3 array. Blank and '#' lines are skipped, any other line that
+    is not numbers (e.g. a header without '#') raises a ValueError naming
+    path, for readAscii() and spectrumChunks() alike.
+    '''
+    lines=[l for l in lines if l.strip() and l.lstrip()[0]!='#']
+    if not lines:
+        return np.zeros((0,3))
+    #fast path for plain 3 column lines, loadtxt for anything else
+    block=np.fromstring(' '.join(lines),sep=' ')
+    if len(block)==3*len(lines):
+        return block.reshape(-1,3)
+    try:
+        return np.loadtxt(lines,usecols=(0,1,2),ndmin=2)
+    except (ValueError,IndexError) as e:
+        raise ValueError('Could not read the spectrum '+path+': '+str(e))
+
+def cacheFileName(path,cacheDir):
+    '''
+    the binary copy of the ascii spectrum path in cacheDir, see loadSpectrum().
+    The name is a hash of the absolute path, then a hash of the path, the
+    modification time, size and cacheVersion.
+    '''
+    stat=os.stat(path)
+    absPath=os.path.abspath(path)
+    key='%s %r %d %d' % (absPath,stat.st_mtime,stat.st_size,cacheVersion)
+    return os.path.join(cacheDir,hashlib.md5(absPath).hexdigest()[:16]+'_'+
+                        hashlib.md5(key).hexdigest()+'.npy')
+
+def pruneCache(cacheDir=defaultCacheDir,maxAge=30.):
+    '''
+    Removes the copies in cacheDir not used for maxAge days (loadSpectrum()
+    touches a copy each time it is used), and temporary files of writes
+    that never finished. Returns the number of files and bytes removed.
+    '''
+    if not os.path.isdir(cacheDir):
+        return 0,0
+    now=time.time()
+    nfile,nbyte=0,0
+    for name in os.listdir(cacheDir):
+        path=os.path.join(cacheDir,name)
+        try:
+            stat=os.stat(path)
+            age=(now-stat.st_mtime)/86400.
+            if (name.endswith('.npy') and age>maxAge) or (name.endswith('.tmp') and age>1):
+                os.remove(path)
+                nfile+=1
+                nbyte+=stat.st_size
+        except OSError:
+            pass #e.g. removed by another process
+    return nfile,nbyte
+
+def loadSpectrum(path,cacheDir=defaultCacheDir):
+    '''
+    Loads the lambda,flux,flux_err columns of a raw ascii spectrum (with
+    readAscii()) or spec-lite FITS file.
+
+    A binary (.npy) copy of the spectrum is kept in cacheDir, keyed by the
+    absolute path, modification time and size of the ascii file (and
+    cacheVersion). If the copy exists it is memory-mapped (copy-on-write,
+    so the spectrum can still be modified in memory) instead of parsing the
+    ascii file again. The copy is stored column by column (Fortran order),
+    so toRestFrame() only copies the pages of the wavelength column, flux
+    and flux_err stay mapped. Writing a copy removes the older copies of
+    the same path, see pruneCache() for the rest.
+    cacheDir=None turns the cache off. Problems with the cache are never
+    fatal, the ascii file is read instead.
+    SDSS/BOSS spec-lite files (paths ending in .fits) are read directly,
+    memory-mapped, by specLite.readSpecLite() (no cache needed).
+    '''
+    if specLite.isFits(path):
+        return specLite.readSpecLite(path)
+    if cacheDir is None:
+        return readAscii(path)
+    cacheFile=cacheFileName(path,cacheDir)
+    if os.path.exists(cacheFile):
+        try:
+            data=np.load(cacheFile,mmap_mode='c')
+            try:
+                os.utime(cacheFile,None) #last used, for pruneCache()
+            except OSError:
+                pass
+            return data
+        except (IOError,ValueError):
+            pass #unreadable copy, it is re-written below
+    data=readAscii(path)
+    try:
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+        #write then rename, so other processes never see half a file
+        tmpFile=cacheFile+'.'+str(os.getpid())+'.tmp'
+        with open(tmpFile,'wb') as f:
+            np.save(f,np.asfortranarray(data))
+        os.rename(tmpFile,cacheFile)
+        #copies of older versions of the file (or of the cache)
+        prefix=os.path.basename(cacheFile).split('_')[0]
+        for old in glob.glob(os.path.join(cacheDir,prefix+'_*.npy')):
+            if old!=cacheFile:
+                os.remove(old)
+    except (IOError,OSError):
+        pass
+    return data
+
+def loadTimed(args):
+    '''
+    loadSpectrum(*args) and the seconds it took, for the loadSpectra() pool
+    '''
+    start=time.time()
+    data=loadSpectrum(*args)
+    return data,time.time()-start
+
+def loadSpectra(paths,cacheDir=defaultCacheDir,nproc=None):
+    '''
+    loadSpectrum() of every spectrum in paths{}. Spectra with a cached
+    copy and spec-lite files are memory-mapped here, the ascii files are parsed in a pool of
+    nproc processes (default: one per file, up to the number of cores,
+    nproc=1 parses them in this process, e.g. in a --batch worker). Returns
+    spectra{} and the load time{} [s] of each, both in the order of paths
+    (e.g. card order, see parseCard()).
+    '''
+    times={}
+    loaded={}
+    parse=[]
+    for key in paths:
+        if specLite.isFits(paths[key]) or (cacheDir is not None and
+                                           os.path.exists(cacheFileName(paths[key],cacheDir))):
+            loaded[key],times[key]=loadTimed((paths[key],cacheDir))
+        else:
+            parse.append(key)
+    if len(parse)>1 and nproc!=1:
+        import multiprocessing
+        pool=multiprocessing.Pool(min(nproc or multiprocessing.cpu_count(),len(parse)))
+        try:
+            results=pool.map(loadTimed,[(paths[key],cacheDir) for key in parse])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results=[loadTimed((paths[key],cacheDir)) for key in parse]
+    for key,(data,seconds) in zip(parse,results):
+        loaded[key],times[key]=data,seconds
+    spectra=collections.OrderedDict()
+    loadTimes=collections.OrderedDict()
+    for key in paths:
+        spectra[key]=loaded[key]
+        loadTimes[key]=times[key]
+        timer.add('load',key,len(loaded[key]),times[key])
+    return spectra,loadTimes
+
+def readCard(filename,cacheDir=defaultCacheDir,nproc=1,verbose=False,workDir=None):
+    '''
+    Reads in a JHHMMSS.card file (see the docstring at the top) and the raw
+    spectra it lists (via loadSpectra(), cacheDir=None turns the cache
+    off, nproc processes parse the ascii files). verbose=True prints the
+    load time of each file, workDir see parseCard(). Returns objInfo{},
+    spectra{} and normFileList{}.
+    '''
+    objInfo,paths,normFileList=parseCard(filename,workDir)
+    spectra,loadTimes=loadSpectra(paths,cacheDir,nproc)
+    if verbose:
+        for key in loadTimes:
+            print 'Loaded %-6s %8d pixels in %.3fs: %s' % (key,len(spectra[key]),
+                                                          loadTimes[key],paths[key])
+    return objInfo,spectra,normFileList
+
+def parseCard(filename,workDir=None):
+    '''
+    Reads in a JHHMMSS.card file without loading the spectra. Returns
+    objInfo{}, the paths{} of the raw spectra and normFileList{}, the
+    latter two in card order (OrderedDict). The relative paths of the raw
+    spectra and the normalized spectra are relative to the working
+    directory, or to workDir if given (e.g. a --queue job).
+    '''
+    if filename[-4:] !='card':
+        raise ValueError(filename+' is not a *.card file')
+    f=open(filename,'r')
+    lines=[line.rstrip('\n') for line in f]
+    f.close()
+
+    objInfo={}
+    objInfo['objName']=lines[0]
+    objInfo['shortObjName']=filename[-12:-5]
+    coords=lines[1].split()
+    objInfo['RA']=float(coords[0])
+    objInfo['Dec']=float(coords[1])
+    objInfo['gmag']=float(lines[2])
+    redshift=lines[3].split()
+    objInfo['zem']=float(redshift[0])
+    objInfo['zerr']=float(redshift[1])
+
+    paths=collections.OrderedDict()
+    normFileList=collections.OrderedDict()
+    #run a loop from 4th line to end of lines
+    for l in lines[4:]:
+        if l.strip()=='' or l[0]=='#':
+            continue
+        temp=l.split()
+        key=temp[0] ### spectrum name must be FIRST!
+        paths[key]=temp[2]
+        normFileList[key]=normFileName(objInfo,key)
+        if workDir is not None:
+            paths[key]=os.path.join(workDir,paths[key])
+            normFileList[key]=os.path.join(workDir,normFileList[key])
+        objInfo[key]=float(temp[1])
+    return objInfo,paths,normFileList
+
+def normFileName(objInfo,spec):
+    '''
+    The normalized spectrum file of spectrum spec, normJHHMMSS.spec
+    '''
+    return 'norm'+objInfo['shortObjName']+'.'+spec.lower()
+
+def toRestFrame(spectra,zem):
+    '''
+    Shifts the wavelength column of every spectrum to the rest-frame (in
+    place, for a cached copy only the wavelength column's pages are copied,
+    see loadSpectrum())
+    '''
+    for spec in spectra:
+        spectra[spec][:,0]=spectra[spec][:,0]/(1.+zem)
+
+def objectParms(db,shortObjName):
+    '''
+    The normalization parameters for a non-interactive run: the object's
+    latest (see previousParms()), otherwise normDefaults
+    '''
+    previous=previousParms(db,shortObjName,'norm')
+    if previous is not None:
+        return previous[1]
+    return cp.deepcopy(normDefaults)
+
+def saveAutoRLF(db,objInfo,spectra):
+    '''
+    Finds the RLF windows of the (rest-frame) spectra{} of an object with
+    autoRLF() and saves them in the normDB.NormDB db as its latest 'norm'
+    parameters (the others as in objectParms()), which normalize() and
+    --batch then use. Returns the parameters.
+    '''
+    parms=objectParms(db,objInfo['shortObjName'])
+    parms['RLF']=autoRLF(spectra,sorted(spectra),parms['funcType'])
+    db.saveParms(objInfo['shortObjName'],'norm',parms)
+    return parms
+
+def normalizeObject(objInfo,spectra,normFileList=None,parms=None,db=None,
+                    precision=None,binary=None,smoothWidth=3,smoothKernel='boxcar',
+                    nreal=0,seed=None,nproc=None):
+    '''
+    Non-interactive normalization of the (rest-frame) spectra{} of an object.
+    parms{} are the normalization parameters (see normDefaults), by default
+    the object's latest parameters in the normDB.NormDB db (or its old
+    normJHHMMSS.parm file), otherwise normDefaults. Writes the normalized
+    spectra to normFileList{} (default normFileName()) and saves the SNRs in
+    db (default normDB.defaultDB). nreal>0 adds the continuum uncertainty
+    column from nreal Monte-Carlo realizations of each fit (split over nproc
+    processes, see fitContinuaMC()). Returns the normalized spectra{} and
+    SNRs{}, raises ValueError if a spectrum can not be normalized.
+    '''
+    if db is None:
+        db=normDB.NormDB()
+    if parms is None:
+        parms=objectParms(db,objInfo['shortObjName'])
+    if normFileList is None:
+        normFileList=dict((spec,normFileName(objInfo,spec)) for spec in spectra)
+    SNRreg=parms['SNRreg']
+    if not isinstance(spectra,SpectraView):
+        spectra=SpectraView(spectra,smoothWidth,smoothKernel)
+    specList=sorted(spectra)
+    with timer.stage('fit',objInfo['shortObjName']):
+        fits=fitObject(spectra,specList,parms['RLF'],parms['funcType'],
+                       smooth=parms['smooth'])
+    fitsMC={}
+    if nreal>0:
+        with timer.stage('fitMC',objInfo['shortObjName']):
+            fitsMC=fitObjectMC(spectra,specList,parms['RLF'],parms['funcType'],
+                               smooth=parms['smooth'],nreal=nreal,seed=seed,nproc=nproc)
+    spectraNormalized={}
+    SNRs={}
+    for spec in specList:
+        with timer.stage('normalize',spec,len(spectra[spec])):
+            normalized,fit,SNR=normalizeSpec(spectra[spec],spectra[spec],parms['RLF'],
+                                             parms['funcType'],SNRreg,fit=fits[spec],
+                                             fitMC=fitsMC.get(spec))
+        with timer.stage('write',spec,len(normalized)):
+            writeNormSpec(normalized,normFileList[spec],objInfo['zem'],
+                          precision,binary)
+        spectraNormalized[spec]=normalized
+        SNRs[spec]=SNR
+    #one transaction, safe with many processes writing to db
+    db.saveSNR(objInfo['shortObjName'],objInfo['objName'][6:],SNRreg,SNRs,
+               dict((spec,objInfo[spec]) for spec in specList))
+    return spectraNormalized,SNRs
+
+def normalizeCard(cardFile,cacheDir=defaultCacheDir,precision=None,binary=None,
+                  smoothWidth=3,smoothKernel='boxcar',dbPath=normDB.defaultDB,
+                  stream=False,chunk=100000,findRLF=False,nreal=0,seed=None,
+                  workDir=None):
+    '''
+    Reads a *.card file and normalizes its object with normalizeObject(),
+    returns the normalized spectra{} and SNRs{}. With stream=True the
+    spectra are streamed through streamNormalize() instead of loaded (the
+    cache is not used), and the normalized spectra{} returned is empty.
+    With findRLF=True the RLF windows are found (and saved) by saveAutoRLF()
+    first, this needs the spectra loaded so it can not be streamed.
+    nreal>0 adds the Monte-Carlo continuum uncertainty column. workDir is
+    what the card's relative paths are relative to, see parseCard().
+    '''
+    if stream and findRLF:
+        raise ValueError('The RLF windows can not be found automatically while streaming.')
+    if stream:
+        db=normDB.NormDB(dbPath)
+        objInfo,paths,normFileList=parseCard(cardFile,workDir)
+        parms=objectParms(db,objInfo['shortObjName'])
+        SNRs={}
+        for i,spec in enumerate(sorted(paths)):
+            with timer.stage('stream',spec) as stage:
+                fit,SNRs[spec]=streamNormalize(paths[spec],normFileList[spec],objInfo['zem'],
+                                               parms['RLF'],parms['funcType'],parms['SNRreg'],
+                                               parms['smooth'],smoothWidth,smoothKernel,
+                                               precision,binary,chunk,nreal,seed,i,stage)
+        db.saveSNR(objInfo['shortObjName'],objInfo['objName'][6:],parms['SNRreg'],SNRs,
+                   dict((spec,objInfo[spec]) for spec in SNRs))
+        return {},SNRs
+    objInfo,spectra,normFileList=readCard(cardFile,cacheDir,workDir=workDir)
+    toRestFrame(spectra,objInfo['zem'])
+    db=normDB.NormDB(dbPath)
+    parms=saveAutoRLF(db,objInfo,spectra) if findRLF else None
+    return normalizeObject(objInfo,spectra,normFileList,parms,db,
+                           precision=precision,binary=binary,
+                           smoothWidth=smoothWidth,smoothKernel=smoothKernel,
+                           nreal=nreal,seed=seed)
+
+def batchNormalize(cardFile,cacheDir=defaultCacheDir,precision=None,binary=None,
+                   smoothWidth=3,smoothKernel='boxcar',dbPath=normDB.defaultDB,
+                   stream=False,chunk=100000,findRLF=False,nreal=0,seed=None,
+                   workDir=None):
+    '''
+    normalizeCard() for --batch. Never raises, a failure is reported in the
+    returned dictionary so one bad card cannot stop a batch run.
+    '''
+    start=time.time()
+    result={'card':cardFile,'ok':False,'error':'','SNRs':{}}
+    try:
+        normalized,result['SNRs']=normalizeCard(cardFile,cacheDir,precision,binary,
+                                               smoothWidth,smoothKernel,dbPath,
+                                               stream,chunk,findRLF,nreal,seed,workDir)
+        result['ok']=True
+    except Exception as e:
+        result['error']=e.__class__.__name__+': '+str(e)
+    result['time']=time.time()-start
+    if timer.enabled:
+        #the worker's stage records go back to the main process
+        result['profile']=timer.records
+        timer.records=[]
+    return result
+
+def runBatch(cards,nproc=None,cacheDir=defaultCacheDir,precision=None,binary=None,
+             smoothWidth=3,smoothKernel='boxcar',dbPath=normDB.defaultDB,
+             stream=False,chunk=100000,findRLF=False,nreal=0,seed=None):
+    '''
+    Normalizes every *.card file in cards (glob patterns are expanded) across
+    nproc worker processes (default: all cores). Prints the wall time and
+    status of each object as it finishes, returns the number of failures.
+    '''
+    cardList=expandCards(cards)
+    print '----------------------------------------------------'
+    print '***Batch normalizing',len(cardList),'card files'
+    import multiprocessing
+    start=time.time()
+    failed=[]
+    pool=multiprocessing.Pool(nproc)
+    try:
+        worker=functools.partial(batchNormalize,cacheDir=cacheDir,
+                                 precision=precision,binary=binary,
+                                 smoothWidth=smoothWidth,smoothKernel=smoothKernel,
+                                 dbPath=dbPath,stream=stream,chunk=chunk,
+                                 findRLF=findRLF,nreal=nreal,seed=seed)
+        for result in pool.imap_unordered(worker,cardList):
+            timer.records.extend(result.get('profile',[]))
+            if result['ok']:
+                print '*** done   %8.2fs %s' % (result['time'],result['card'])
+            else:
+                failed.append(result)
+                print '*** FAILED %8.2fs %s -- %s' % (result['time'],result['card'],result['error'])
+    finally:
+        pool.close()
+        pool.join()
+    print '----------------------------------------------------'
+    print '***Normalized',len(cardList)-len(failed),'of',len(cardList),'objects in %.2fs' % (time.time()-start)
+    for result in failed:
+        print '*** FAILED:',result['card'],'--',result['error']
+    return len(failed)
+
+def expandCards(cards):
+    '''
+    The list of card files cards, with glob patterns expanded (in sorted
+    order), patterns that match nothing are kept as they are
+    '''
+    cardList=[]
+    for c in cards:
+        matches=sorted(glob.glob(c))
+        if matches:
+            cardList.extend(matches)
+        else:
+            cardList.append(c)
+    return cardList
+
+def queueWorker(dbPath=normDB.defaultDB,**options):
+    '''
+    A --queue worker: claims the next pending card of the jobs table of the
+    normDB.NormDB at dbPath, normalizes it with batchNormalize(**options)
+    (its relative paths relative to the directory it was queued from),
+    marks it done or failed, and so on until nothing is pending. Prints
+    each object as it finishes. Returns the number of objects done, the
+    failed results and the profile records (see StageTimer).
+    '''
+    db=normDB.NormDB(dbPath)
+    done,failed,profile=0,[],[]
+    while True:
+        job=db.claimJob()
+        if job is None:
+            break
+        card,workDir=job
+        result=batchNormalize(card,dbPath=dbPath,workDir=workDir,**options)
+        db.finishJob(card,result['ok'],result['time'],result['error'])
+        profile.extend(result.get('profile',[]))
+        if result['ok']:
+            done+=1
+            print '*** done   %8.2fs %s' % (result['time'],card)
+        else:
+            failed.append(result)
+            print '*** FAILED %8.2fs %s -- %s' % (result['time'],card,result['error'])
+        sys.stdout.flush()
+    return done,failed,profile
+
+def runQueue(cards,nproc=None,dbPath=normDB.defaultDB,retry=False,stale=24.,**options):
+    '''
+    runBatch() through the resumable job queue in the normDB.NormDB at
+    dbPath: the cards (glob patterns are expanded) not queued yet are added
+    (with the working directory, see queueWorker()), jobs left running by
+    a killed run or claimed more than stale hours ago (any host, None:
+    never), and with retry=True the failed jobs, are queued again, then
+    nproc workers (default: all cores) run
+    queueWorker() until the queue is empty. Cards already done are skipped,
+    so running the same command again resumes an interrupted run. options
+    are passed on to batchNormalize(). Returns the number of failed jobs
+    in the queue (of this run or earlier ones).
+    '''
+    dbPath=os.path.abspath(dbPath)
+    db=normDB.NormDB(dbPath)
+    cardList=expandCards(cards)
+    added=db.addJobs(cardList)
+    requeued=db.requeueJobs(retry,None if stale is None else stale*3600.)
+    counts=db.jobCounts()
+    print '----------------------------------------------------'
+    print '***Queue %s: %d cards added, %d re-queued, %d pending, %d done, %d failed' % (
+        dbPath,added,requeued,counts['pending'],counts['done'],counts['failed'])
+    import multiprocessing
+    nproc=min(nproc or multiprocessing.cpu_count(),max(counts['pending'],1))
+    start=time.time()
+    if nproc==1:
+        results=[queueWorker(dbPath,**options)]
+    else:
+        pool=multiprocessing.Pool(nproc)
+        try:
+            jobs=[pool.apply_async(queueWorker,(dbPath,),options) for i in range(nproc)]
+            results=[job.get() for job in jobs]
+        finally:
+            pool.close()
+            pool.join()
+    done=sum(r[0] for r in results)
+    failed=[result for r in results for result in r[1]]
+    for r in results:
+        timer.records.extend(r[2])
+    counts=db.jobCounts()
+    print '----------------------------------------------------'
+    print '***Normalized',done,'of',done+len(failed),'objects in %.2fs' % (time.time()-start)
+    print '***Queue: %d done, %d failed, %d pending' % (counts['done'],counts['failed'],counts['pending'])
+    for result in failed:
+        print '*** FAILED:',result['card'],'--',result['error']
+    return counts['failed']
+
+def startupTime(cardFile,repeat=5,cacheDir=defaultCacheDir):
+    '''
+    Start-up time of a non-plotting run: importing normalizeSpectra and
+    reading cardFile (i.e., up to the spectra being loaded), each measured
+    in repeat fresh python processes so nothing is already imported.
+    Prints the best and median times and the heavy modules that got
+    imported, returns the best (import,read) times [s].
+    '''
+    import subprocess
+    code=('import time,sys;start=time.time();import normalizeSpectra as ns;'
+          'mid=time.time();ns.readCard(%r,%r);end=time.time();'
+          'print mid-start,end-mid,'
+          '" ".join(m for m in ["matplotlib","scipy","multiprocessing"] if m in sys.modules)'
+          % (cardFile,cacheDir))
+    env=dict(os.environ)
+    here=os.path.dirname(os.path.abspath(__file__))
+    env['PYTHONPATH']=here+os.pathsep+env.get('PYTHONPATH','')
+    times=[]
+    for r in range(repeat):
+        out=subprocess.check_output([sys.executable,'-c',code],env=env).split()
+        times.append(map(float,out[:2]))
+    times=np.array(times)
+    print 'start-up of %d fresh processes, best (median) [s]:' % repeat
+    print 'import normalizeSpectra : %.3f (%.3f)' % (times[:,0].min(),np.median(times[:,0]))
+    print 'reading the card        : %.3f (%.3f)' % (times[:,1].min(),np.median(times[:,1]))
+    print 'total                   : %.3f (%.3f)' % (times.sum(axis=1).min(),np.median(times.sum(axis=1)))
+    print 'heavy modules imported  :',' '.join(out[2:]) or 'none'
+    return times[:,0].min(),times[:,1].min()
 #
 #--------------------------------------------------------------------------#
 #
-#Main program begins here, calls the above functions
-
-#arguments from the command line
-script,filename=argv
-print '----------------------------------------------------'
-print '***Working on:',filename
-if filename[-4:] !='card':
-    print 'File must be a *.card file containing:'
-    print 'SDSS Jhhmmss.ss+/-ddmmss'
-    print 'RA Dec'
-    print 'redshift'
-    print 'name & MJD & location of SDSS spectrum'
-    print 'name & MJD & location of BOSS spectrum'
-    print 'name & MJD & location of GEM spectrum'
-    print '***EXITING'
-    sys.exit()
-
-#read in contents of filename
-f=open(filename,'r')
-lines=[line.rstrip('\n') for line in f]
-f.close()
-
-objInfo={}
-objInfo['objName']=lines[0]
-objInfo['shortObjName']=filename[-12:-5]
-coords=lines[1].split()
-objInfo['RA']=float(coords[0])
-objInfo['Dec']=float(coords[1])
-objInfo['gmag']=float(lines[2])
-redshift=lines[3].split()
-objInfo['zem']=float(redshift[0])
-objInfo['zerr']=float(redshift[1])
-
-spectra={}
-normFileList={}
-#run a loop from 4th line to end of lines
-for l in lines[4:]:
-    if l[0]=='#':
-        continue
-    temp=l.split()
-    key=temp[0] ### spectrum name must be FIRST!
-    spectra[key]=np.genfromtxt(temp[2],usecols=(0,1,2))
-    normFileList[key]='norm'+objInfo['shortObjName']+'.'+key.lower()
-    objInfo[key]=float(temp[1])
-
-print 'Information in card file:'
-print 'objName:',objInfo['objName']
-print 'redshift:',objInfo['zem']
-print 'g_mag:',objInfo['gmag']
-print 'RA:',objInfo['RA'],'Dec:',objInfo['Dec']
-print 'Spectra:',spectra.keys()
-print 'HK: scaling to rest-frame.'
-
-for spec in spectra:
-    spectra[spec][:,0]=spectra[spec][:,0]/(1.+objInfo['zem'])
-print '*** heading into normalization routine, follow commands to normalize.'
-print '----------'
-
-normspec=normalize(spectra,objInfo)
+#Main program, the command line interface to the above functions
+
+def main(argv=None):
+    '''
+    The command line program, argv defaults to sys.argv[1:]. Returns the
+    exit status.
+    '''
+    #arguments from the command line
+    parser=argparse.ArgumentParser(description='Normalize the raw spectra listed in a JHHMMSS.card file.')
+    parser.add_argument('cards',nargs='*',
+                        help='JHHMMSS.card file (or many files/glob patterns with --batch)')
+    parser.add_argument('--batch',action='store_true',
+                        help='normalize all cards without plotting or user input')
+    parser.add_argument('--nproc',type=int,default=None,
+                        help='number of worker processes for --batch (default: all cores), '
+                             'or, in an interactive run, for reading the spectra (default: one per '
+                             'file) and the --mc realizations (default: 1)')
+    parser.add_argument('--cachedir',default=defaultCacheDir,
+                        help='where binary copies of raw spectra are kept (default: %(default)s)')
+    parser.add_argument('--nocache',action='store_true',
+                        help='always read the raw ascii spectra, no binary cache')
+    parser.add_argument('--prunecache',type=float,default=None,metavar='DAYS',
+                        help='remove the cached copies not used for DAYS days from --cachedir and exit')
+    parser.add_argument('--precision',type=int,default=None,
+                        help='significant digits in the normalized ascii spectra (default: full)')
+    parser.add_argument('--binary',choices=['npy','fits'],default=None,
+                        help='also write the normalized spectra as .npy or .fits files')
+    parser.add_argument('--smoothwidth',type=float,default=3,
+                        help='smoothing width in pixels (FWHM for gaussian, default: 3)')
+    parser.add_argument('--smoothkernel',choices=['boxcar','gaussian'],default='boxcar',
+                        help='smoothing kernel (default: boxcar)')
+    parser.add_argument('--render',choices=['eps','preview'],default='eps',
+                        help='eps: LaTeX .eps plots on every change (default), preview: '
+                             'quick .png plots, the .eps is written on quit or with the eps command')
+    parser.add_argument('--db',default=normDB.defaultDB,
+                        help='parameter and SNR database (default: %(default)s)')
+    parser.add_argument('--history',action='store_true',
+                        help='print the saved parameters of the cards\' objects and exit')
+    parser.add_argument('--queue',action='store_true',
+                        help='with --batch, run the cards through the resumable job queue in --db '
+                             '(cards already done are skipped)')
+    parser.add_argument('--retry',action='store_true',
+                        help='with --queue, also run the cards that failed before again')
+    parser.add_argument('--stale',type=float,default=24.,metavar='HOURS',
+                        help='with --queue, run the cards claimed more than HOURS ago (e.g. by a '
+                             'worker on another host that died) again (default: %(default)s)')
+    parser.add_argument('--stream',action='store_true',
+                        help='with --batch, stream the spectra in chunks instead of loading them')
+    parser.add_argument('--chunk',type=int,default=100000,
+                        help='rows per chunk for --stream (default: %(default)s)')
+    parser.add_argument('--autorlf',action='store_true',
+                        help='find the RLF windows automatically (saved as the object\'s latest parameters)')
+    parser.add_argument('--mc',type=int,default=0,metavar='N',
+                        help='add a continuum uncertainty column from N Monte-Carlo realizations of each fit '
+                             '(power-law fits are done in log space: at low SNR realizations with more than 5%% '
+                             'of their RLF pixels perturbed to flux<=0 are left out, with a warning, and the '
+                             'uncertainty is underestimated)')
+    parser.add_argument('--seed',type=int,default=None,
+                        help='random seed for --mc (default: different every run)')
+    parser.add_argument('--profile',nargs='?',const='',default=None,metavar='FILE',
+                        help='print per-stage timings at exit (and log every stage to FILE as JSON lines)')
+    parser.add_argument('--startup',action='store_true',
+                        help='measure the start-up time (import, reading the card) and exit')
+    args=parser.parse_args(argv)
+    if args.profile is not None:
+        timer.enable(args.profile or None)
+    if args.nocache:
+        args.cachedir=None
+    if args.prunecache is not None:
+        nfile,nbyte=pruneCache(args.cachedir or defaultCacheDir,args.prunecache)
+        print 'Removed %d files (%.1f MB) from %s' % (nfile,nbyte/1e6,args.cachedir or defaultCacheDir)
+        return 0
+    if not args.cards:
+        parser.error('too few arguments')
+    if args.history:
+        normDB.printHistory(normDB.NormDB(args.db),[card[-12:-5] for card in args.cards])
+        return 0
+    if args.startup:
+        startupTime(args.cards[0],cacheDir=args.cachedir)
+        return 0
+    if args.stream and args.autorlf:
+        parser.error('--autorlf needs the whole spectra, it can not be used with --stream')
+    if args.retry and not args.queue:
+        parser.error('--retry needs --queue')
+    if args.queue:
+        if not args.batch:
+            parser.error('--queue needs --batch')
+        nfail=runQueue(args.cards,args.nproc,args.db,args.retry,args.stale,cacheDir=args.cachedir,
+                       precision=args.precision,binary=args.binary,
+                       smoothWidth=args.smoothwidth,smoothKernel=args.smoothkernel,
+                       stream=args.stream,chunk=args.chunk,findRLF=args.autorlf,
+                       nreal=args.mc,seed=args.seed)
+        return 1 if nfail>0 else 0
+    if args.batch:
+        nfail=runBatch(args.cards,args.nproc,args.cachedir,args.precision,args.binary,
+                       args.smoothwidth,args.smoothkernel,args.db,
+                       args.stream,args.chunk,args.autorlf,args.mc,args.seed)
+        return 1 if nfail>0 else 0
+    if args.stream:
+        parser.error('--stream needs --batch, the interactive plots need the whole spectra')
+    if len(args.cards)!=1:
+        parser.error('only one *.card file can be normalized interactively, use --batch')
+    filename=args.cards[0]
+    print '----------------------------------------------------'
+    print '***Working on:',filename
+    if filename[-4:] !='card':
+        print 'File must be a *.card file containing:'
+        print 'SDSS Jhhmmss.ss+/-ddmmss'
+        print 'RA Dec'
+        print 'redshift'
+        print 'name & MJD & location of SDSS spectrum'
+        print 'name & MJD & location of BOSS spectrum'
+        print 'name & MJD & location of GEM spectrum'
+        print '***EXITING'
+        return 0
+
+    #read in contents of filename
+    objInfo,spectra,normFileList=readCard(filename,args.cachedir,args.nproc,verbose=True)
+
+    print 'Information in card file:'
+    print 'objName:',objInfo['objName']
+    print 'redshift:',objInfo['zem']
+    print 'g_mag:',objInfo['gmag']
+    print 'RA:',objInfo['RA'],'Dec:',objInfo['Dec']
+    print 'Spectra:',spectra.keys()
+    print 'HK: scaling to rest-frame.'
+
+    toRestFrame(spectra,objInfo['zem'])
+    db=normDB.NormDB(args.db)
+    if args.autorlf:
+        try:
+            print '*** automatic RLF windows:',saveAutoRLF(db,objInfo,spectra)['RLF']
+        except ValueError as e:
+            print '*** automatic RLF windows failed:',e
+    print '*** heading into normalization routine, follow commands to normalize.'
+    print '----------'
+
+    if args.render=='preview':
+        pyplot('agg') #no LaTeX/GUI needed for the previews
+    normalize(spectra,objInfo,precision=args.precision,binary=args.binary,
+              smoothWidth=args.smoothwidth,smoothKernel=args.smoothkernel,
+              render=args.render,db=db,normFileList=normFileList,
+              nreal=args.mc,seed=args.seed,nproc=args.nproc)
+    return 0
+
+if __name__=='__main__':
+    sys.exit(main())
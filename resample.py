@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+'''
+--------------------------------------------------------------------------------
+Flux-conserving resampling of spectra
+
+Rebins (lambda,flux,flux_err) spectra onto a new wavelength grid so that the
+integrated flux over any range of whole output pixels is unchanged. Each
+output pixel is the overlap-weighted mean of the input pixels it covers, and
+the errors are propagated assuming independent input pixels:
+
+F_j = sum_i f_i o_ij / dE_j        err_j = sqrt(sum_i (e_i o_ij)^2) / dE_j
+
+where o_ij is the overlap of input pixel i with output pixel j (of width
+dE_j). Pixel edges are half way between the pixel centres.
+
+rebinBatch() does MANY spectra (of different lengths) in one call: all
+spectra are concatenated, the output pixel edges are located in all of them
+with one searchsorted, and the sums come from cumulative sums, so the cost
+is a handful of array passes however many spectra there are.
+
+To Run (benchmark):
+----------
+
+$> ./resample.py [npix] [nspec]
+
+HISTORY
+--------------------------------------------------------------------------------
+2026-10-17 - created
+           - the checks against rebinLoop() moved from benchmark() to
+             tests/test_resample.py
+--------------------------------------------------------------------------------
+'''
+#Libraries used
+import numpy as np
+
+def pixelEdges(lam):
+    '''
+    The n+1 edges of the pixels centred on lam (sorted, n>=2): half way
+    between the centres, the outer edges half a pixel beyond the end pixels.
+    '''
+    lam=np.asarray(lam,dtype=float)
+    edges=np.empty(len(lam)+1)
+    edges[1:-1]=0.5*(lam[:-1]+lam[1:])
+    edges[0]=lam[0]-0.5*(lam[1]-lam[0])
+    edges[-1]=lam[-1]+0.5*(lam[-1]-lam[-2])
+    return edges
+
+def rebinBatch(lams,fluxes,errs,grid):
+    '''
+    Flux-conserving rebinning of many spectra onto one grid.
+
+    lams,fluxes,errs : lists of 1-D arrays, one entry per spectrum (each at
+                       least 2 pixels), errs may be None
+    grid             : centres of the output pixels (sorted)
+    returns flux, err (None if errs is None) and mask, nspec x len(grid)
+    arrays. mask is True for the output pixels that lie entirely within a
+    spectrum and overlap no bad input pixels (non-finite flux, or flux_err
+    not finite or <=0), the others hold NaN.
+    '''
+    nspec=len(lams)
+    grid=np.asarray(grid,dtype=float)
+    E=pixelEdges(grid)
+    dE=np.diff(E)
+    npix=np.array([len(l) for l in lams])
+    if np.any(npix<2):
+        raise ValueError('Every spectrum needs at least 2 pixels to be rebinned.')
+    group=np.repeat(np.arange(nspec),npix)
+    starts=np.cumsum(npix)-npix
+    c=np.concatenate([np.asarray(l,dtype=float) for l in lams])
+    f=np.concatenate([np.asarray(x,dtype=float) for x in fluxes])
+    if errs is None:
+        e=np.zeros(len(f))
+    else:
+        e=np.concatenate([np.asarray(x,dtype=float) for x in errs])
+    #sort within each spectrum, if needed
+    step=np.diff(c)
+    step[starts[1:]-1]=1.
+    if np.any(step<=0):
+        order=np.lexsort((c,group))
+        c,f,e=c[order],f[order],e[order]
+    bad=~np.isfinite(f)
+    if errs is not None:
+        bad|=~np.isfinite(e)|~(e>0)
+    f=np.where(bad,0.,f)
+    e=np.where(bad,0.,e)
+
+    #pixel edges of all spectra, spectrum g's edges start at starts[g]+g
+    last=starts+npix-1
+    edges=np.empty(len(c)+nspec)
+    interior=np.ones(len(c),dtype=bool)
+    interior[last]=False
+    p=np.flatnonzero(interior)
+    edges[p+group[p]+1]=0.5*(c[p]+c[p+1])
+    g=np.arange(nspec)
+    edges[starts+g]=c[starts]-0.5*(c[starts+1]-c[starts])
+    edges[last+g+1]=c[last]+0.5*(c[last]-c[last-1])
+    width=edges[np.arange(len(c))+group+1]-edges[np.arange(len(c))+group]
+
+    #cumulative sums (with a leading 0) of the integrated flux, variance
+    #and number of bad pixels, a range of whole pixels is a difference
+    def cumulative(v):
+        return np.concatenate(([0.],np.cumsum(v)))
+    cumFlux=cumulative(f*width)
+    cumVar=cumulative((e*width)**2)
+    cumBad=cumulative(bad)
+
+    #locate the output edges E in every spectrum with one searchsorted:
+    #spectrum g is shifted by g*span, so all edges are one sorted array
+    lo=min(edges.min(),E[0])
+    span=max(edges.max(),E[-1])-lo+1.
+    keys=edges-lo+span*np.repeat(g,npix+1)
+    queries=(E-lo)[np.newaxis,:]+span*g[:,np.newaxis]
+    k=np.searchsorted(keys,queries.ravel(),side='right').reshape(nspec,len(E))-1
+    edgeStart=(starts+g)[:,np.newaxis]
+    covered=(k>=edgeStart)&(k<edgeStart+npix[:,np.newaxis])
+    #pixel (global index) holding each output edge, clipped to the spectrum
+    pix=np.clip(k,edgeStart,edgeStart+npix[:,np.newaxis]-1)-g[:,np.newaxis]
+    #an output edge on the spectrum's last edge still counts as covered
+    atEnd=(k==edgeStart+npix[:,np.newaxis])&(E[np.newaxis,:]==edges[(last+g+1)][:,np.newaxis])
+    covered|=atEnd
+
+    plo,phi=pix[:,:-1],pix[:,1:]
+    E0,E1=E[np.newaxis,:-1],E[np.newaxis,1:]
+    highEdge=edges[plo+g[:,np.newaxis]+1] #upper edge of pixel plo
+    phiEdge=edges[phi+g[:,np.newaxis]] #lower edge of pixel phi
+    same=(plo==phi)
+    first=np.where(same,E1,highEdge)-E0 #overlap with pixel plo
+    lastOver=np.where(same,0.,E1-phiEdge) #overlap with pixel phi
+    middle=np.where(same,0,1)
+    fluxSum=(f[plo]*first+f[phi]*lastOver
+             +middle*(cumFlux[np.maximum(phi,plo+1)]-cumFlux[plo+1]))
+    varSum=((e[plo]*first)**2+(e[phi]*lastOver)**2
+            +middle*(cumVar[np.maximum(phi,plo+1)]-cumVar[plo+1]))
+    #bad pixels overlapping the output pixel (phi only if it overlaps)
+    nbad=cumBad[phi+1]-cumBad[plo]-np.where(lastOver>0,0,bad[phi])*(~same)
+    mask=covered[:,:-1]&covered[:,1:]&(nbad==0)
+    newFlux=np.where(mask,fluxSum/dE,np.nan)
+    if errs is None:
+        return newFlux,None,mask
+    newErr=np.where(mask,np.sqrt(np.abs(varSum))/dE,np.nan)
+    return newFlux,newErr,mask
+
+def rebin(lam,flux,err,grid):
+    '''
+    single spectrum version of rebinBatch(), returns flux,err,mask
+    '''
+    newFlux,newErr,mask=rebinBatch([lam],[flux],None if err is None else [err],grid)
+    return newFlux[0],None if newErr is None else newErr[0],mask[0]
+
+def rebinLoop(lam,flux,err,grid):
+    '''
+    Slow, obviously correct rebinning (loops over the output pixels), the
+    reference for the tests of rebinBatch()
+    '''
+    edges=pixelEdges(lam)
+    E=pixelEdges(grid)
+    newFlux=np.zeros(len(grid))*np.nan
+    newErr=np.zeros(len(grid))*np.nan
+    for j in range(len(grid)):
+        if E[j]<edges[0] or E[j+1]>edges[-1]:
+            continue
+        o=np.clip(np.minimum(edges[1:],E[j+1])-np.maximum(edges[:-1],E[j]),0,None)
+        newFlux[j]=np.sum(flux*o)/(E[j+1]-E[j])
+        newErr[j]=np.sqrt(np.sum((err*o)**2))/(E[j+1]-E[j])
+    return newFlux,newErr
+
+def benchmark(npix=None,nspec=None):
+    '''
+    Times rebinBatch() on synthetic spectra of 10^4 and 10^5 pixels (or
+    npix), resampled onto a grid of half as many pixels, in pixels per
+    second. (Its correctness is checked by tests/test_resample.py.)
+    '''
+    import time
+    np.random.seed(42)
+    for n in ([npix] if npix else [10**4,10**5]):
+        ns=nspec or max(10**6/n,1)
+        lams,fluxes,errs=[],[],[]
+        for s in range(ns):
+            lam=np.linspace(1100,2000,n)*(1+np.random.uniform(-0.01,0.01))
+            lams.append(lam)
+            fluxes.append(10*(lam/1500.)**-1.5+np.random.randn(n))
+            errs.append(np.ones(n))
+        grid=np.linspace(1150,1950,n//2)
+        start=time.time()
+        f,e,m=rebinBatch(lams,fluxes,errs,grid)
+        t=time.time()-start
+        print 'rebinBatch: %d spectra of %d pixels onto %d pixels: %.3fs, %.1f Mpix/s' % (
+            ns,n,len(grid),t,ns*n/t/1e6)
+        start=time.time()
+        for s in range(ns):
+            np.interp(grid,lams[s],fluxes[s])
+        t=time.time()-start
+        print '  (np.interp loop, not flux conserving, no errors: %.3fs)' % t
+
+if __name__=='__main__':
+    import sys
+    args=map(int,sys.argv[1:3])
+    benchmark(*args)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+'''
+--------------------------------------------------------------------------------
+Reader for SDSS/BOSS spec-lite FITS files
+
+The spectrum of a spec-lite (spec-PLATE-MJD-FIBER.fits) file is the binary
+table of its first extension (COADD), with one row per pixel and the
+columns loglam (log10 of the vacuum wavelength), flux (10^-17 erg/s/cm^2/A)
+and ivar (inverse variance of flux), among others. Only those three columns
+are needed, as lambda=10^loglam, flux and flux_err=1/sqrt(ivar).
+
+The table is memory-mapped with numpy (no astropy needed): the header is
+parsed for the table's column layout, the data become a record array on
+the file, and only the three columns are read and converted, with array
+operations, a chunk of rows at a time if wanted. Pixels with ivar<=0 (no
+data, masked by the pipeline) are left out.
+
+normalizeSpectra.py reads any card path ending in .fits (or .fit) this way.
+
+To Run (prints the columns of the table and the converted spectrum):
+----------
+
+$> ./specLite.py spec-PLATE-MJD-FIBER.fits
+
+HISTORY
+--------------------------------------------------------------------------------
+2026-10-17 - created
+--------------------------------------------------------------------------------
+'''
+#Libraries used
+import numpy as np
+import re
+
+block=2880 #bytes, FITS headers and data come in blocks of this size
+
+#binary table TFORM codes and their (big-endian) numpy types
+tformTypes={'L':'S1','X':'u1','B':'u1','I':'>i2','J':'>i4','K':'>i8',
+            'A':'S1','E':'>f4','D':'>f8','C':'>c8','M':'>c16'}
+
+def isFits(path):
+    '''
+    True if path looks like a FITS file (by its extension)
+    '''
+    return path.lower().endswith(('.fits','.fit'))
+
+def readHeader(f):
+    '''
+    Reads the header at the current position of the open file f, returns
+    a dictionary of its keywords (values as str, int, float or bool) and
+    leaves f at the start of the data. Raises ValueError if there is no
+    header there.
+    '''
+    header={}
+    while True:
+        data=f.read(block)
+        if len(data)<block:
+            raise ValueError('No FITS header found in '+f.name)
+        for i in range(0,block,80):
+            card=data[i:i+80]
+            key=card[:8].strip()
+            if key=='END':
+                return header
+            if card[8:10]!='= ':
+                continue
+            value=card[10:].strip()
+            if value.startswith("'"):
+                header[key]=value[1:].split("'")[0].rstrip()
+                continue
+            value=value.split('/')[0].strip()
+            if value in ['T','F']:
+                header[key]=(value=='T')
+            else:
+                try:
+                    header[key]=int(value)
+                except ValueError:
+                    try:
+                        header[key]=float(value.replace('D','E'))
+                    except ValueError:
+                        header[key]=value
+
+def dataSize(header):
+    '''
+    bytes of data (padded to whole blocks) following header
+    '''
+    naxis=header.get('NAXIS',0)
+    if naxis==0:
+        return 0
+    n=1
+    for i in range(1,naxis+1):
+        n*=header['NAXIS'+str(i)]
+    n=abs(header['BITPIX'])//8*header.get('GCOUNT',1)*(header.get('PCOUNT',0)+n)
+    return -(-n//block)*block
+
+def tableDtype(header):
+    '''
+    numpy dtype of the rows of a binary table header, the column names are
+    lower case
+    '''
+    names,formats,offsets=[],[],[]
+    offset=0
+    for i in range(1,header['TFIELDS']+1):
+        tform=str(header['TFORM'+str(i)]).strip()
+        m=re.match(r'^(\d*)([LXBIJKAEDCMPQ])',tform)
+        if m is None or m.group(2) in 'PQ':
+            raise ValueError('Unsupported binary table column format: '+tform)
+        repeat=int(m.group(1) or 1)
+        code=m.group(2)
+        if code=='X':
+            repeat=-(-repeat//8)
+        dtype=np.dtype(tformTypes[code])
+        if code=='A':
+            dtype,size=np.dtype('S'+str(repeat)),repeat
+        elif repeat!=1:
+            dtype,size=np.dtype((dtype,repeat)),dtype.itemsize*repeat
+        else:
+            size=dtype.itemsize
+        names.append(str(header.get('TTYPE'+str(i),'col'+str(i))).strip().lower())
+        formats.append(dtype)
+        offsets.append(offset)
+        offset+=size
+    if offset!=header['NAXIS1']:
+        raise ValueError('Binary table columns do not add up to NAXIS1')
+    return np.dtype({'names':names,'formats':formats,'offsets':offsets,
+                     'itemsize':header['NAXIS1']})
+
+def binTable(path,ext=1):
+    '''
+    The binary table of extension ext of the FITS file path, as a read-only
+    record array memory-mapped on the file (nothing is read until used).
+    '''
+    with open(path,'rb') as f:
+        header=readHeader(f)
+        for e in range(ext):
+            f.seek(dataSize(header),1)
+            header=readHeader(f)
+        offset=f.tell()
+    if header.get('XTENSION')!='BINTABLE':
+        raise ValueError('Extension '+str(ext)+' of '+path+' is not a binary table')
+    return np.memmap(path,dtype=tableDtype(header),mode='r',offset=offset,
+                     shape=(header['NAXIS2'],))
+
+def toSpectrum(table,start=0,stop=None):
+    '''
+    rows start:stop of a spec-lite table (see binTable()) as an N x 3
+    (lambda,flux,flux_err) float array, without the pixels of ivar<=0
+    '''
+    rows=table[start:stop]
+    ivar=rows['ivar'].astype(float)
+    good=ivar>0
+    out=np.empty((np.count_nonzero(good),3))
+    out[:,0]=10**rows['loglam'][good].astype(float)
+    out[:,1]=rows['flux'][good]
+    out[:,2]=1./np.sqrt(ivar[good])
+    return out
+
+def readSpecLite(path):
+    '''
+    The (lambda,flux,flux_err) spectrum of the spec-lite file path
+    '''
+    return toSpectrum(binTable(path))
+
+def specLiteChunks(path,chunk=100000):
+    '''
+    readSpecLite() chunk table rows at a time, a generator of (at most)
+    chunk x 3 arrays
+    '''
+    table=binTable(path)
+    for start in range(0,len(table),chunk):
+        yield toSpectrum(table,start,start+chunk)
+
+if __name__=='__main__':
+    import sys
+    table=binTable(sys.argv[1])
+    print 'columns:',' '.join(table.dtype.names)
+    spectrum=toSpectrum(table)
+    print '%d of %d pixels with ivar>0, lambda %.2f-%.2f' % (len(spectrum),len(table),
+                                                             spectrum[0,0],spectrum[-1,0])
+    print spectrum[:5]
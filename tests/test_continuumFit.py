@@ -0,0 +1,104 @@
+'''
+Tests of continuumFit.py, run from the top directory with
+$> python -m unittest discover tests
+'''
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+import continuumFit
+
+def dataSets(rng,npixs=[300,57,1000]):
+    '''noisy power laws of different lengths over 1250-1800 Angstroms'''
+    xs,ys,es=[],[],[]
+    for npix in npixs:
+        x=np.sort(rng.uniform(1250,1800,npix))
+        a=10**rng.uniform(0,2)
+        b=rng.uniform(-2.5,-0.5)
+        e=0.05*a*x**b*rng.uniform(0.5,2,npix)
+        xs.append(x)
+        ys.append(a*x**b+e*rng.standard_normal(npix))
+        es.append(e)
+    return xs,ys,es
+
+def weightedCov(x,e,order):
+    '''(A^T W A)^-1 of a weighted polynomial fit, highest power first'''
+    A=np.vander(x,order+1)
+    return np.linalg.inv(np.dot(A.T/e**2,A))
+
+class TestLinfit(unittest.TestCase):
+    def setUp(self):
+        self.xs,self.ys,self.es=dataSets(np.random.RandomState(1))
+
+    def testUnweighted(self):
+        '''without errs the coefficients are np.polyfit's'''
+        for order in [0,1,3]:
+            coeffs,cov=continuumFit.linfitBatch(self.xs,self.ys,order=order)
+            self.assertEqual(coeffs.shape,(3,order+1))
+            for x,y,c in zip(self.xs,self.ys,coeffs):
+                np.testing.assert_allclose(np.polyval(c,x),np.polyval(np.polyfit(x,y,order),x),rtol=1e-9)
+            #scaled by chi^2/dof
+            x,y=self.xs[0],self.ys[0]
+            chi2=np.sum((y-np.polyval(coeffs[0],x))**2)
+            np.testing.assert_allclose(cov[0],weightedCov(x,np.ones(len(x)),order)*chi2/(len(x)-order-1),rtol=1e-6)
+
+    def testWeighted(self):
+        '''with errs, np.polyfit(w=1/errs) and the covariance (A^T W A)^-1'''
+        coeffs,cov=continuumFit.linfitBatch(self.xs,self.ys,self.es,order=1)
+        for x,y,e,c,C in zip(self.xs,self.ys,self.es,coeffs,cov):
+            np.testing.assert_allclose(c,np.polyfit(x,y,1,w=1/e),rtol=1e-8)
+            np.testing.assert_allclose(C,weightedCov(x,e,1),rtol=1e-6)
+
+    def testBadSets(self):
+        '''empty, too short or single-x data sets are NaN, the others are still fit'''
+        xs=[np.zeros(0),np.array([1500.]),np.ones(5)*1500,self.xs[0]]
+        ys=[np.zeros(0),np.array([1.]),np.arange(5.),self.ys[0]]
+        coeffs,cov=continuumFit.linfitBatch(xs,ys,order=1)
+        self.assertTrue(np.all(np.isnan(coeffs[:3])))
+        self.assertTrue(np.all(np.isnan(cov[:3])))
+        np.testing.assert_allclose(coeffs[3],np.polyfit(xs[3],ys[3],1),rtol=1e-8)
+
+class TestPowerfit(unittest.TestCase):
+    def setUp(self):
+        self.xs,self.ys,self.es=dataSets(np.random.RandomState(2))
+
+    def testLogSpace(self):
+        '''[b,a] and their covariance from a weighted np.polyfit in log10-space'''
+        params,cov=continuumFit.powerfitBatch(self.xs,self.ys,self.es)
+        for x,y,e,p,C in zip(self.xs,self.ys,self.es,params,cov):
+            good=y>0
+            lx,ly=np.log10(x[good]),np.log10(y[good])
+            le=e[good]/(y[good]*np.log(10.))
+            b,loga=np.polyfit(lx,ly,1,w=1/le)
+            np.testing.assert_allclose(p,[b,10**loga],rtol=1e-8)
+            J=np.diag([1.,10**loga*np.log(10.)])
+            np.testing.assert_allclose(C,np.dot(J,np.dot(weightedCov(lx,le,1),J.T)),rtol=1e-6)
+
+    def testUnweighted(self):
+        '''without errs, np.polyfit in log10-space'''
+        params,cov=continuumFit.powerfitBatch(self.xs,self.ys)
+        for x,y,p in zip(self.xs,self.ys,params):
+            good=y>0
+            b,loga=np.polyfit(np.log10(x[good]),np.log10(y[good]),1)
+            np.testing.assert_allclose(p,[b,10**loga],rtol=1e-8)
+
+    def testExact(self):
+        '''a noiseless power law is recovered'''
+        x=np.linspace(1250,1800,100)
+        params,cov=continuumFit.powerfit(x,3e4*x**-1.5,np.ones(100))
+        np.testing.assert_allclose(params,[-1.5,3e4],rtol=1e-8)
+
+    def testMaxDrop(self):
+        '''data sets losing more than maxDrop of their pixels to y<=0 are NaN'''
+        ys=[y.copy() for y in self.ys]
+        ys[0][:10]=-1    #10 of 300
+        ys[1][:10]=0     #10 of 57
+        params,cov=continuumFit.powerfitBatch(self.xs,ys,self.es,maxDrop=0.05)
+        self.assertTrue(np.all(np.isfinite(params[[0,2]])))
+        self.assertTrue(np.all(np.isnan(params[1])))
+        self.assertTrue(np.all(np.isnan(cov[1])))
+
+if __name__=='__main__':
+    unittest.main()
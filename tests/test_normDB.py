@@ -0,0 +1,153 @@
+'''
+Tests of normDB.py, run from the top directory with
+$> python -m unittest discover tests
+'''
+import os
+import sys
+import math
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import StringIO
+import warnings
+import numpy as np
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+import normDB
+import normalizeSpectra as ns
+import benchmark
+
+class TestSNR(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.mkdtemp(prefix='normDB_test')
+        self.db=normDB.NormDB(os.path.join(self.dir,'test.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir,ignore_errors=True)
+
+    def testUncoveredSNRreg(self):
+        '''an SNRreg outside the spectra gives nan SNRs that survive the db'''
+        rng=np.random.RandomState(1)
+        zem=2.
+        spectra={'SDSS':benchmark.makeSpectrum(2000,zem,rng),
+                 'BOSS':benchmark.makeSpectrum(2000,zem,rng)}
+        ns.toRestFrame(spectra,zem)
+        objInfo={'shortObjName':'J000001','objName':'SDSS J000001.00+000000.0',
+                 'zem':zem,'SDSS':52000.,'BOSS':52300.}
+        parms=dict(ns.normDefaults,SNRreg=[5000,5100])
+        normFileList=dict((spec,os.path.join(self.dir,'normJ000001.'+spec.lower()))
+                          for spec in spectra)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore',RuntimeWarning) #median of nothing
+            normalized,SNRs=ns.normalizeObject(objInfo,spectra,normFileList,parms,self.db)
+        self.assertTrue(all(math.isnan(SNRs[spec]) for spec in spectra))
+
+        rows=self.db.querySNR()
+        self.assertEqual(len(rows),2)
+        self.assertTrue(all(math.isnan(r['snr']) for r in rows))
+        self.assertEqual(self.db.querySNR(maxSNR=6),[])
+
+        stdout=sys.stdout
+        sys.stdout=StringIO.StringIO()
+        try:
+            normDB.printSNR(self.db)
+            printed=sys.stdout.getvalue()
+        finally:
+            sys.stdout=stdout
+        self.assertEqual([line.split()[4] for line in printed.splitlines()],['nan','nan'])
+        outFile=os.path.join(self.dir,'SNR_outfile.dat')
+        normDB.exportSNR(self.db,outFile)
+        with open(outFile) as f:
+            self.assertEqual(f.read(),'000001.00+000000.0 5000.0 5100.0 BOSS nan SDSS nan\n')
+
+class TestJobs(unittest.TestCase):
+    def setUp(self):
+        self.cwd=os.getcwd()
+        self.dir=os.path.realpath(tempfile.mkdtemp(prefix='normDB_test'))
+        os.mkdir(os.path.join(self.dir,'sub'))
+        self.db=normDB.NormDB(os.path.join(self.dir,'test.db'))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir,ignore_errors=True)
+
+    def testAbsolutePaths(self):
+        '''jobs are keyed on absolute card paths, whatever the working directory'''
+        card=os.path.join(self.dir,'J000001.card')
+        os.chdir(self.dir)
+        self.assertEqual(self.db.addJobs(['J000001.card']),1)
+        os.chdir(os.path.join(self.dir,'sub'))
+        self.assertEqual(self.db.addJobs([os.path.join('..','J000001.card')]),0)
+        self.assertEqual(self.db.claimJob(),(card,self.dir))
+        self.db.finishJob(card,False,1.,'error')
+        self.assertEqual(self.db.requeueJobs(failed=True),1)
+        self.assertEqual(self.db.jobCounts()['pending'],1)
+
+    def testStale(self):
+        '''running jobs of other hosts are only re-queued once stale'''
+        card=os.path.join(self.dir,'J000001.card')
+        self.db.addJobs([card])
+        self.db.claimJob('otherhost:123')
+        self.assertEqual(self.db.requeueJobs(),0)
+        self.assertEqual(self.db.requeueJobs(stale=3600.),0)
+        conn=self.db.connect()
+        with conn:
+            conn.execute('UPDATE jobs SET claimed=claimed-7200')
+        conn.close()
+        self.assertEqual(self.db.requeueJobs(),0)
+        self.assertEqual(self.db.requeueJobs(stale=3600.),1)
+        #claimed again here, the stale worker can no longer finish it
+        self.assertEqual(self.db.claimJob()[0],card)
+        self.assertFalse(self.db.finishJob(card,False,1.,'error','otherhost:123'))
+        self.assertTrue(self.db.finishJob(card,True,1.))
+        self.assertEqual(self.db.jobCounts()['done'],1)
+
+    def testOldTable(self):
+        '''a jobs table without dir and claimed gets them'''
+        path=os.path.join(self.dir,'old.db')
+        conn=sqlite3.connect(path)
+        with conn:
+            conn.execute('''CREATE TABLE jobs (card TEXT PRIMARY KEY, status TEXT,
+                            worker TEXT, attempts INTEGER, started TEXT,
+                            finished TEXT, seconds REAL, error TEXT)''')
+            conn.execute("INSERT INTO jobs VALUES ('/a/J000001.card','pending',NULL,0,NULL,NULL,NULL,NULL)")
+        conn.close()
+        db=normDB.NormDB(path)
+        self.assertEqual(db.claimJob(),('/a/J000001.card',None))
+        self.assertEqual(db.requeueJobs(stale=3600.),0)
+
+class TestQueue(unittest.TestCase):
+    def setUp(self):
+        self.cwd=os.getcwd()
+        self.dir=os.path.realpath(tempfile.mkdtemp(prefix='normDB_test'))
+        os.mkdir(os.path.join(self.dir,'sub'))
+        os.chdir(self.dir)
+        self.cards=benchmark.makeCards('.',nobj=2,nepoch=2,npix=500)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir,ignore_errors=True)
+
+    def testResumeElsewhere(self):
+        '''a queue resumed from another directory reads and writes where it was queued'''
+        dbPath=os.path.join(self.dir,'test.db')
+        db=normDB.NormDB(dbPath)
+        db.addJobs(self.cards)
+        os.chdir(os.path.join(self.dir,'sub'))
+        stdout=sys.stdout
+        sys.stdout=StringIO.StringIO()
+        try:
+            nfail=ns.runQueue([],nproc=1,dbPath=dbPath,cacheDir=None)
+        finally:
+            sys.stdout=stdout
+        self.assertEqual(nfail,0)
+        self.assertEqual(db.jobCounts()['done'],2)
+        self.assertEqual(os.listdir(os.path.join(self.dir,'sub')),[])
+        for card in self.cards:
+            objInfo,paths,normFileList=ns.parseCard(os.path.join(self.dir,card),self.dir)
+            for spec in normFileList:
+                self.assertTrue(os.path.isfile(normFileList[spec]))
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,269 @@
+'''
+Tests of normalizeSpectra.py, run from the top directory with
+$> python -m unittest discover tests
+'''
+import os
+import sys
+import shutil
+import tempfile
+import time
+import unittest
+import numpy as np
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+import normalizeSpectra as ns
+import benchmark
+
+class TestSpectraView(unittest.TestCase):
+    def testCallerArraysWriteable(self):
+        '''SpectraView is read-only but leaves the caller's arrays alone'''
+        rng=np.random.RandomState(1)
+        spectra={'SDSS':benchmark.makeSpectrum(500,2.,rng)}
+        view=ns.SpectraView(spectra)
+        self.assertFalse(view['SDSS'].flags.writeable)
+        self.assertTrue(spectra['SDSS'].flags.writeable)
+        ns.toRestFrame(spectra,2.) #in place
+        self.assertTrue(np.shares_memory(view['SDSS'],spectra['SDSS']))
+
+class TestWavelengthIndex(unittest.TestCase):
+    def setUp(self):
+        '''pixels exactly on the window edges, each of them twice'''
+        lam=np.concatenate((np.arange(1500,1800,2.5),[1590.,1650.,1600.,1700.]))
+        self.lams={'sorted':np.sort(lam),
+                   'shuffled':np.random.RandomState(1).permutation(lam)}
+
+    def pixels(self,w):
+        if isinstance(w,slice):
+            w=np.arange(w.start,w.stop)
+        return np.sort(w)
+
+    def testOpen(self):
+        '''RLF and yScale windows: x1 < lambda < x2, as the old masks'''
+        for name,lam in self.lams.items():
+            index=ns.WavelengthIndex(lam)
+            for x1,x2 in [[1590,1650],[1590.1,1649.9],[1400,1510],[1700,1700],[1650,1590]]:
+                np.testing.assert_array_equal(self.pixels(index.window(x1,x2)),
+                                              np.flatnonzero((lam>x1)&(lam<x2)),name)
+            RLF=[[1600,1650],[1520,1540]]
+            np.testing.assert_array_equal(index.indices(RLF),
+                                          np.concatenate([np.flatnonzero((lam>x1)&(lam<x2)) for x1,x2 in RLF]))
+
+    def testClosed(self):
+        '''SNR regions: x1 <= lambda <= x2, as the old masks'''
+        for name,lam in self.lams.items():
+            index=ns.WavelengthIndex(lam)
+            for x1,x2 in [[1600,1700],[1590,1590],[1600.1,1699.9],[1790,1900]]:
+                np.testing.assert_array_equal(self.pixels(index.window(x1,x2,closed=True)),
+                                              np.flatnonzero((lam>=x1)&(lam<=x2)),name)
+
+    def testYScaleSNR(self):
+        '''yScale() over [1590,1650] and calcSNR() over [1600,1700] with the old masks'''
+        rng=np.random.RandomState(2)
+        spectra={}
+        for name,lam in self.lams.items():
+            spectra[name]=np.column_stack((lam,rng.uniform(1,2,len(lam)),rng.uniform(0.1,0.2,len(lam))))
+        yscale=ns.yScale(spectra,'sorted')
+        means={}
+        for name,spec in spectra.items():
+            inOpen=(spec[:,0]>1590)&(spec[:,0]<1650)
+            closed=(spec[:,0]>=1600)&(spec[:,0]<=1700)
+            self.assertEqual(ns.calcSNR(spec,[1600,1700]),np.median(spec[closed,1]/spec[closed,2]))
+            means[name]=np.mean(spec[inOpen,1])
+        for name in spectra:
+            self.assertAlmostEqual(yscale[name],means['sorted']/means[name],places=12)
+
+class TestSmooth(unittest.TestCase):
+    def testBoxcar(self):
+        '''the boxcar is the old mode='same' convolution away from the ends'''
+        flux=np.random.RandomState(1).uniform(1,2,50)
+        for width in [3,4,5,8]:
+            old=np.convolve(flux,np.ones(width)/float(width),mode='same')
+            new=ns.smoothSpec(flux,width,'boxcar')
+            np.testing.assert_allclose(new[width:-width],old[width:-width],rtol=1e-12)
+
+    def testEdges(self):
+        '''at the ends the boxcar averages only the pixels that exist'''
+        flux=np.random.RandomState(1).uniform(1,2,50)
+        new=ns.smoothSpec(flux,3,'boxcar')
+        np.testing.assert_allclose(new[[0,-1]],[flux[:2].mean(),flux[-2:].mean()])
+        #even width: the kernel covers i-2..i+1
+        new=ns.smoothSpec(flux,4,'boxcar')
+        np.testing.assert_allclose(new[[0,1,-1]],[flux[:2].mean(),flux[:3].mean(),flux[-3:].mean()])
+        #a flat spectrum stays flat, for either kernel
+        for kernel in ['boxcar','gaussian']:
+            np.testing.assert_allclose(ns.smoothSpec(np.ones(20),5,kernel),1.)
+
+class TestAutoRLF(unittest.TestCase):
+    def setUp(self):
+        '''a power law with CIV, SiIV and OI emission and a trough at 1470-1500'''
+        rng=np.random.RandomState(1)
+        self.lam=np.linspace(1250,1850,3000)
+        self.cont=10*(self.lam/1500.)**-1.5
+        def line(centre,sigma,amp):
+            return amp*np.exp(-0.5*((self.lam-centre)/sigma)**2)
+        self.model=self.cont*(1+line(1549,15,1.)+line(1400,12,0.4)+line(1305,6,0.3))
+        self.model[(self.lam>1470)&(self.lam<1500)]*=0.4
+        err=0.02*self.cont
+        flux=self.model+err*rng.standard_normal(len(self.lam))
+        self.spectra={'SDSS':np.column_stack((self.lam,flux,err)),
+                      'BOSS':np.column_stack((self.lam,self.model+err*rng.standard_normal(len(self.lam)),err))}
+        self.fitContinua=ns.fitContinua
+        self.calls=0
+        def counted(*args,**kwargs):
+            self.calls+=1
+            return self.fitContinua(*args,**kwargs)
+        ns.fitContinua=counted
+
+    def tearDown(self):
+        ns.fitContinua=self.fitContinua
+
+    def testWindows(self):
+        '''the windows avoid the lines and give back the power law'''
+        RLF=ns.autoRLF(self.spectra,['BOSS','SDSS'])
+        inRLF=np.zeros(len(self.lam),dtype=bool)
+        for x1,x2 in RLF:
+            self.assertTrue(x2-x1>=10)
+            inRLF|=(self.lam>x1)&(self.lam<x2)
+        #no line pixel 5 sigma (10%) off the continuum is in a window (a bin
+        #keeps up to 1-minFrac of clipped pixels, so the far wings may be)
+        self.assertFalse(np.any(inRLF&(np.abs(self.model/self.cont-1)>0.1)))
+        self.assertFalse(np.any(inRLF&(self.lam>1470)&(self.lam<1500)))
+        #but most of the continuum is
+        line=np.abs(self.model/self.cont-1)>0.001
+        region=(self.lam>1280)&(self.lam<1800)
+        self.assertGreater(np.count_nonzero(inRLF),0.6*np.count_nonzero(region&~line))
+        spec=self.spectra['SDSS']
+        fit=ns.fitContinua([spec[inRLF,0]],[spec[inRLF,1]],[spec[inRLF,2]])[0][0]
+        #within the 2% noise (the far wings pull it up a little)
+        np.testing.assert_allclose(ns.continuum(fit,self.lam[region],'plaw'),self.cont[region],rtol=0.02)
+
+    def testConverges(self):
+        '''the clipping stops changing before maxIter, more iterations change nothing'''
+        RLF=ns.autoRLF(self.spectra,['BOSS','SDSS'],maxIter=50)
+        self.assertLess(self.calls,50)
+        self.assertEqual(ns.autoRLF(self.spectra,['BOSS','SDSS'],maxIter=self.calls),RLF)
+
+class TestAscii(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.mkdtemp(prefix='normSpectra_test')
+        self.rows=benchmark.makeSpectrum(50,2.,np.random.RandomState(1))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir,ignore_errors=True)
+
+    def write(self,header):
+        path=os.path.join(self.dir,'spec.txt')
+        with open(path,'w') as f:
+            f.write(header+ns.formatRows(self.rows))
+        return path
+
+    def testComments(self):
+        '''loaded and streamed spectra skip '#' and blank lines the same'''
+        path=self.write('# lambda flux err\n\n')
+        np.testing.assert_array_equal(ns.loadSpectrum(path,None),self.rows)
+        np.testing.assert_array_equal(np.vstack(list(ns.spectrumChunks(path,7))),self.rows)
+
+    def testHeader(self):
+        '''a header line without '#' is an error naming the file, loaded or streamed'''
+        path=self.write('lambda flux err\n')
+        for read in [lambda: ns.loadSpectrum(path,None),
+                     lambda: list(ns.spectrumChunks(path,7))]:
+            with self.assertRaises(ValueError) as e:
+                read()
+            self.assertIn(path,str(e.exception))
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.mkdtemp(prefix='normSpectra_test')
+        self.cacheDir=os.path.join(self.dir,'cache')
+        self.rows=benchmark.makeSpectrum(1000,2.,np.random.RandomState(1))
+        self.path=os.path.join(self.dir,'spec.txt')
+        with open(self.path,'w') as f:
+            f.write(ns.formatRows(self.rows))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir,ignore_errors=True)
+
+    def testColumns(self):
+        '''cached copies are mapped column by column, toRestFrame leaves the file alone'''
+        ns.loadSpectrum(self.path,self.cacheDir)
+        cached=ns.loadSpectrum(self.path,self.cacheDir)
+        self.assertIsInstance(cached,np.memmap)
+        self.assertTrue(cached.flags.f_contiguous)
+        np.testing.assert_array_equal(cached,self.rows)
+        spectra={'SDSS':cached}
+        ns.toRestFrame(spectra,2.)
+        np.testing.assert_allclose(spectra['SDSS'][:,0],self.rows[:,0]/3.)
+        np.testing.assert_array_equal(ns.loadSpectrum(self.path,self.cacheDir),self.rows)
+
+    def testVersion(self):
+        '''a new cacheVersion makes a new copy and removes the old one'''
+        ns.loadSpectrum(self.path,self.cacheDir)
+        old=ns.cacheFileName(self.path,self.cacheDir)
+        ns.cacheVersion+=1
+        try:
+            new=ns.cacheFileName(self.path,self.cacheDir)
+            self.assertNotEqual(old,new)
+            self.assertFalse(isinstance(ns.loadSpectrum(self.path,self.cacheDir),np.memmap))
+        finally:
+            ns.cacheVersion-=1
+        self.assertEqual(os.listdir(self.cacheDir),[os.path.basename(new)])
+
+    def testPrune(self):
+        '''pruneCache removes the copies not used for maxAge days'''
+        ns.loadSpectrum(self.path,self.cacheDir)
+        cacheFile=ns.cacheFileName(self.path,self.cacheDir)
+        self.assertEqual(ns.pruneCache(self.cacheDir,30)[0],0)
+        old=time.time()-40*86400
+        os.utime(cacheFile,(old,old))
+        self.assertEqual(ns.pruneCache(self.cacheDir,30)[0],1)
+        self.assertEqual(os.listdir(self.cacheDir),[])
+
+class TestMC(unittest.TestCase):
+    def testLowSNR(self):
+        '''power-law realizations that lose many pixels to flux<=0 are not fit'''
+        lam=np.linspace(1300,1750,200)
+        flux=10*(lam/1500.)**-1.5
+        rng=np.random.RandomState(2)
+        for snr,expectLost in [(50,False),(1,True)]:
+            fits=ns.fitContinuaMC([lam],[flux],[flux/snr],'plaw',nreal=100,seed=1)[0]
+            lost=~np.all(np.isfinite(fits),axis=1)
+            self.assertEqual(lost.all(),expectLost)
+        #without maxDrop the log-space fit keeps only the upward fluctuations
+        y=flux+flux*rng.standard_normal(len(flux))
+        params,cov=ns.continuumFit.powerfitBatch([lam],[y],[flux])
+        self.assertGreater(params[0,1]*1500**params[0,0],10)
+        params,cov=ns.continuumFit.powerfitBatch([lam],[y],[flux],maxDrop=0.05)
+        self.assertTrue(np.all(np.isnan(params)))
+
+class TestStream(unittest.TestCase):
+    def setUp(self):
+        self.cwd=os.getcwd()
+        self.dir=tempfile.mkdtemp(prefix='normSpectra_test')
+        os.chdir(self.dir) #the normalized spectra are written here
+        self.card=benchmark.makeCards('.',nobj=1,nepoch=3,npix=3000)[0]
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir,ignore_errors=True)
+
+    def normalized(self,stream):
+        ns.normalizeCard(self.card,cacheDir=None,binary='npy',dbPath='test.db',
+                         stream=stream,nreal=50,seed=3)
+        objInfo,paths,normFileList=ns.parseCard(self.card)
+        return dict((spec,np.load(normFileList[spec]+'.npy')) for spec in normFileList)
+
+    def testStreamMC(self):
+        '''--stream gives the same --mc columns as the in-memory path'''
+        loaded=self.normalized(False)
+        streamed=self.normalized(True)
+        self.assertEqual(sorted(loaded),sorted(streamed))
+        for spec in loaded:
+            self.assertEqual(loaded[spec].shape[1],4)
+            np.testing.assert_array_equal(loaded[spec],streamed[spec])
+        #every epoch gets its own realizations
+        specs=sorted(loaded)
+        self.assertFalse(np.allclose(loaded[specs[0]][:,3],loaded[specs[1]][:,3]))
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+'''
+Tests of resample.py, run from the top directory with
+$> python -m unittest discover tests
+'''
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+import resample
+
+def irregular(rng,npix,lo=1200,hi=1800):
+    '''a spectrum on an irregular wavelength grid'''
+    lam=np.sort(rng.uniform(lo,hi,npix))
+    return lam,1+0.1*rng.standard_normal(npix),rng.uniform(0.05,0.2,npix)
+
+class TestRebin(unittest.TestCase):
+    def setUp(self):
+        self.rng=np.random.RandomState(42)
+
+    def testLoop(self):
+        '''one spectrum, the same as rebinLoop()'''
+        lam,flux,err=irregular(self.rng,500)
+        grid=np.linspace(1250,1750,311)
+        f,e,m=resample.rebin(lam,flux,err,grid)
+        fRef,eRef=resample.rebinLoop(lam,flux,err,grid)
+        self.assertTrue(m.all())
+        np.testing.assert_allclose(f,fRef,rtol=1e-10)
+        np.testing.assert_allclose(e,eRef,rtol=1e-10)
+
+    def testRagged(self):
+        '''spectra of different lengths and coverage, each the same as rebinLoop()'''
+        spectra=[irregular(self.rng,500),
+                 irregular(self.rng,37,1400,1500),     #inside the grid
+                 irregular(self.rng,2000,1000,1300),   #covers its blue end
+                 irregular(self.rng,2,1600,1601),      #two pixels
+                 irregular(self.rng,300,1900,2000)]    #misses it
+        lams,fluxes,errs=zip(*spectra)
+        grid=np.linspace(1250,1750,311)
+        f,e,m=resample.rebinBatch(lams,fluxes,errs,grid)
+        self.assertEqual(f.shape,(5,311))
+        for i,(lam,flux,err) in enumerate(spectra):
+            fRef,eRef=resample.rebinLoop(lam,flux,err,grid)
+            #the mask is the output pixels rebinLoop() could fill
+            np.testing.assert_array_equal(m[i],np.isfinite(fRef))
+            np.testing.assert_array_equal(np.isnan(f[i]),~m[i])
+            np.testing.assert_allclose(f[i][m[i]],fRef[m[i]],rtol=1e-10)
+            np.testing.assert_allclose(e[i][m[i]],eRef[m[i]],rtol=1e-10)
+        #partly covered: only the pixels entirely within the spectrum
+        E=resample.pixelEdges(grid)
+        edges=resample.pixelEdges(lams[1])
+        np.testing.assert_array_equal(m[1],(E[:-1]>=edges[0])&(E[1:]<=edges[-1]))
+        self.assertTrue(m[1].any() and not m[1].all())
+        self.assertFalse(m[4].any())
+
+    def testUnsorted(self):
+        '''an unsorted spectrum is sorted first, errs=None gives no errors'''
+        lam,flux,err=irregular(self.rng,500)
+        order=self.rng.permutation(500)
+        grid=np.linspace(1250,1750,311)
+        f,e,m=resample.rebinBatch([lam[order],lam],[flux[order],flux],None,grid)
+        self.assertIsNone(e)
+        np.testing.assert_allclose(f[0],f[1],rtol=1e-12)
+        np.testing.assert_allclose(f[0],resample.rebinLoop(lam,flux,err,grid)[0],rtol=1e-10)
+
+    def testBadPixels(self):
+        '''output pixels overlapping a bad input pixel are masked, no others'''
+        lam,flux,err=irregular(self.rng,500)
+        flux[100]=np.nan
+        err[300]=0
+        grid=np.linspace(1250,1750,311)
+        f,e,m=resample.rebin(lam,flux,err,grid)
+        edges=resample.pixelEdges(lam)
+        E=resample.pixelEdges(grid)
+        overlaps=np.zeros(len(grid),dtype=bool)
+        for i in [100,300]:
+            overlaps|=(E[1:]>edges[i])&(E[:-1]<edges[i+1])
+        np.testing.assert_array_equal(m,~overlaps)
+        #(the bad pixels do not overlap the unmasked output pixels, but
+        #nan*0 is nan)
+        fRef,eRef=resample.rebinLoop(lam,np.nan_to_num(flux),err,grid)
+        np.testing.assert_allclose(f[m],fRef[m],rtol=1e-10)
+        np.testing.assert_allclose(e[m],eRef[m],rtol=1e-10)
+
+    def testFluxConservation(self):
+        '''the integral over whole output pixels is unchanged'''
+        #input pixels 0.1 wide, output 0.37 wide, both have an edge at 1300
+        #and 1699.6
+        fine=1200.05+0.1*np.arange(6000)
+        flux=np.sin(fine/7.)+2
+        f,e,m=resample.rebin(fine,flux,None,1300.185+0.37*np.arange(1080))
+        self.assertTrue(m.all())
+        self.assertAlmostEqual(np.sum(f*0.37)/np.sum(flux[(fine>1300)&(fine<1699.6)]*0.1),1.,places=10)
+
+    def testTooShort(self):
+        '''a one pixel spectrum can not be rebinned'''
+        self.assertRaises(ValueError,resample.rebinBatch,[np.array([1500.])],[np.ones(1)],None,
+                          np.linspace(1400,1600,10))
+
+if __name__=='__main__':
+    unittest.main()
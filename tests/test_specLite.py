@@ -0,0 +1,119 @@
+'''
+Tests of specLite.py, run from the top directory with
+$> python -m unittest discover tests
+'''
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+import specLite
+
+def card(key,value,comment=None):
+    '''one 80 character header card'''
+    if isinstance(value,bool):
+        value='T' if value else 'F'
+    elif isinstance(value,str):
+        value="'%-8s'" % value
+    text='%-8s= %20s' % (key,value)
+    if comment:
+        text+=' / '+comment
+    return text.ljust(80)
+
+def header(cards):
+    text=''.join(card(*c) for c in cards)+'END'.ljust(80)
+    return text+' '*(-len(text)%specLite.block)
+
+def writeSpecLite(path,table):
+    '''a primary HDU with no data and table (a big-endian record array) as
+    the BINTABLE of extension 1'''
+    tforms={'>f4':'E','>f8':'D','>i4':'J','>i2':'I'}
+    cols=[]
+    for i,name in enumerate(table.dtype.names):
+        cols+=[('TTYPE%d' % (i+1),name),
+               ('TFORM%d' % (i+1),tforms[table.dtype[name].str])]
+    data=table.tobytes()
+    with open(path,'wb') as f:
+        f.write(header([('SIMPLE',True),('BITPIX',8),('NAXIS',0),('EXTEND',True)]))
+        f.write(header([('XTENSION','BINTABLE'),('BITPIX',8),('NAXIS',2),
+                        ('NAXIS1',table.dtype.itemsize,'bytes per row'),
+                        ('NAXIS2',len(table)),('PCOUNT',0),('GCOUNT',1),
+                        ('TFIELDS',len(table.dtype.names)),('EXPTIME',900.5)]+cols))
+        f.write(data+b'\0'*(-len(data)%specLite.block))
+
+class TestSpecLite(unittest.TestCase):
+    def setUp(self):
+        self.dir=tempfile.mkdtemp(prefix='specLite_test')
+        self.path=os.path.join(self.dir,'spec-1234-56789-0012.fits')
+        n=1000
+        rng=np.random.RandomState(1)
+        self.table=np.zeros(n,dtype=[('flux','>f4'),('loglam','>f4'),('ivar','>f4'),
+                                     ('and_mask','>i4'),('wdisp','>f4')])
+        self.table['loglam']=np.linspace(3.5563,4.0170,n)
+        self.table['flux']=rng.uniform(1,10,n)
+        self.table['ivar']=rng.uniform(0.5,4,n)
+        self.table['ivar'][[0,10,500,999]]=0
+        self.table['ivar'][20]=-1
+        self.table['and_mask']=rng.randint(0,2**20,n)
+        writeSpecLite(self.path,self.table)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir,ignore_errors=True)
+
+    def testHeader(self):
+        '''header cards are parsed to str, int, float and bool'''
+        with open(self.path,'rb') as f:
+            primary=specLite.readHeader(f)
+            self.assertEqual(f.tell(),specLite.block)
+            f.seek(specLite.dataSize(primary),1)
+            ext=specLite.readHeader(f)
+        self.assertIs(primary['SIMPLE'],True)
+        self.assertEqual(primary['NAXIS'],0)
+        self.assertEqual(specLite.dataSize(primary),0)
+        self.assertEqual(ext['XTENSION'],'BINTABLE')
+        self.assertEqual(ext['NAXIS1'],20)
+        self.assertEqual(ext['EXPTIME'],900.5)
+        self.assertEqual(ext['TTYPE4'],'and_mask')
+        self.assertEqual(specLite.dataSize(ext),-(-20*1000//2880)*2880)
+
+    def testTable(self):
+        '''the table is a big-endian memory-mapped record array of every row'''
+        table=specLite.binTable(self.path)
+        self.assertIsInstance(table,np.memmap)
+        self.assertEqual(len(table),len(self.table))
+        self.assertEqual(table.dtype.names,self.table.dtype.names)
+        self.assertEqual(table.dtype['flux'].str,'>f4')
+        self.assertEqual(table.dtype['and_mask'].str,'>i4')
+        for name in self.table.dtype.names:
+            np.testing.assert_array_equal(table[name],self.table[name])
+
+    def testSpectrum(self):
+        '''lambda=10^loglam, flux, 1/sqrt(ivar), without the ivar<=0 pixels'''
+        spectrum=specLite.readSpecLite(self.path)
+        good=self.table['ivar']>0
+        self.assertEqual(len(spectrum),len(self.table)-5)
+        np.testing.assert_allclose(spectrum[:,0],10**self.table['loglam'][good].astype(float))
+        np.testing.assert_array_equal(spectrum[:,1],self.table['flux'][good])
+        np.testing.assert_allclose(spectrum[:,2],1/np.sqrt(self.table['ivar'][good].astype(float)))
+        self.assertEqual(spectrum.dtype,np.float64)
+
+    def testChunks(self):
+        '''specLiteChunks() gives readSpecLite(), chunk rows at a time'''
+        chunks=list(specLite.specLiteChunks(self.path,333))
+        self.assertEqual(len(chunks),4)
+        np.testing.assert_array_equal(np.vstack(chunks),specLite.readSpecLite(self.path))
+
+    def testNotFits(self):
+        '''a file without a FITS header is an error'''
+        path=os.path.join(self.dir,'spec.fits')
+        with open(path,'w') as f:
+            f.write('3600 1 0.1\n')
+        self.assertRaises(ValueError,specLite.binTable,path)
+        self.assertTrue(specLite.isFits('a/SPEC.FIT'))
+        self.assertFalse(specLite.isFits('spec.txt'))
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+'''
+Tests of troughs.py, run from the top directory with
+$> python -m unittest discover tests
+'''
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+import normalizeSpectra as ns
+import troughs
+
+def spectrum(troughList,dv=10.,vrange=[-1000,35000]):
+    '''
+    A normalized rest-frame spectrum on a grid of exactly dv km/s pixels
+    (centres at vrange[0], vrange[0]+dv, ...), flux 1 except flux f at the
+    pixel centres v1<=v<v2 of each (v1,v2,f) in troughList
+    '''
+    v=np.arange(vrange[0],vrange[1],dv)
+    flux=np.ones(len(v))
+    for v1,v2,f in troughList:
+        flux[(v>=v1-1e-6)&(v<v2-1e-6)]=f
+    lam=ns.civ_0b*(1-v/troughs.lightspeed)
+    return lam[::-1],flux[::-1] #increasing lambda
+
+class TestTroughs(unittest.TestCase):
+    #(v1,v2,flux), with 10 km/s pixels:
+    troughList=[(1000,4500,0.7),   #BI: only 3000-4490, 1500<2000 km/s -> 0
+                                   #AI: 350 pixels, 0.3*3500=1050
+                (5000,9000,0.5),   #BI: 400 pixels, the 200 past 2000 km/s
+                                   #    count, (1-0.5/0.9)*2000=888.89
+                                   #AI: 0.5*4000=2000
+                (12000,12400,0.2), #400 km/s, too narrow for AI and BI
+                (22000,27000,0.6), #BI: 22000-25000 (edge pixel included),
+                                   #    301 pixels, (1-0.6/0.9)*1010=336.67
+                                   #AI: 0.4*5000=2000
+                (28500,30000,0.8)] #AI: 28500-29000, 51 pixels, 0.2*510=102
+
+    def testBI(self):
+        '''BALnicity index against the hand-computed value'''
+        lam,flux=spectrum(self.troughList)
+        BI=troughs.balnicity([lam],[flux])
+        self.assertAlmostEqual(BI[0],2000*(1-0.5/0.9)+1010*(1-0.6/0.9),places=3)
+
+    def testBIMinWidth(self):
+        '''a trough exactly 2000 km/s wide adds nothing, one pixel wider adds a pixel'''
+        lam,flux=spectrum([(5000,7000,0.45)])
+        self.assertAlmostEqual(troughs.balnicity([lam],[flux])[0],0.,places=6)
+        lam,flux=spectrum([(5000,7010,0.45)])
+        self.assertAlmostEqual(troughs.balnicity([lam],[flux])[0],10*0.5,places=3)
+
+    def testAI(self):
+        '''absorption index and the troughs against the hand-computed values'''
+        lam,flux=spectrum(self.troughList)
+        found=troughs.findTroughs([lam],[flux])
+        self.assertEqual(len(found['spec']),4)
+        self.assertAlmostEqual(found['integral'].sum(),1050+2000+2000+102,places=3)
+        #ordered by wavelength, i.e. from high to low velocity
+        np.testing.assert_allclose(found['width'],[510,5000,4000,3500],rtol=1e-8)
+        np.testing.assert_allclose(found['depth'],[0.2,0.4,0.5,0.3],rtol=1e-8)
+        #the 5000-9000 km/s trough: pixel edges at +-5 km/s
+        np.testing.assert_allclose([found['vmin'][2],found['vmax'][2]],[4995,8995],rtol=1e-8)
+        np.testing.assert_allclose(found['civb'],found['lam'])
+
+    def testMeasureSpectra(self):
+        '''BI/AI per spectrum, a spectrum without troughs gets 0'''
+        lam,flux=spectrum(self.troughList)
+        spectra={'SDSS':np.column_stack((lam,flux)),
+                 'BOSS':np.column_stack(spectrum([])),
+                 'GEM1':np.column_stack(spectrum([(5000,9000,0.5)]))}
+        summary,found=troughs.measureSpectra(spectra,smoothWidth=0)
+        self.assertAlmostEqual(summary['SDSS']['AI'],5152,places=3)
+        self.assertAlmostEqual(summary['SDSS']['BI'],2000*(1-0.5/0.9)+1010*(1-0.6/0.9),places=3)
+        self.assertEqual(summary['SDSS']['ntrough'],4)
+        self.assertEqual((summary['BOSS']['BI'],summary['BOSS']['AI'],summary['BOSS']['ntrough']),(0,0,0))
+        self.assertAlmostEqual(summary['GEM1']['BI'],2000*(1-0.5/0.9),places=3)
+        self.assertAlmostEqual(summary['GEM1']['AI'],2000,places=3)
+        self.assertEqual(sorted(set(found['spec'])),['GEM1','SDSS'])
+
+if __name__=='__main__':
+    unittest.main()
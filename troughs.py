@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+'''
+--------------------------------------------------------------------------------
+Automated absorption trough finder for normalized spectra
+
+Finds the CIV absorption troughs of normalized (rest-frame) spectra, i.e.,
+the contiguous runs of pixels below the 0.9 line drawn on the plots of
+normalizeSpectra.py, and measures for each spectrum:
+
+BI : the BALnicity index (Weymann et al. 1991), the integral of
+     (1-f/0.9) dv from 3000 to 25000 km/s, counting a trough only once it
+     has been below 0.9 for 2000 km/s.
+AI : the absorption index (Hall et al. 2002), the integral of (1-f) dv from
+     0 to 29000 km/s over the troughs at least 450 km/s wide.
+
+Velocities are the outflow velocities (positive blueward) relative to
+civ_0b, the same line ionLocations() takes the absorber location to be.
+For each trough the extent, width, maximum depth, equivalent width and the
+absorption weighted centroid are measured, and the expected SiIV, NV and
+Lya locations of every trough come from one (array) call to
+normalizeSpectra.ionLocations().
+
+All spectra given are concatenated and every quantity is a handful of array
+passes (cumulative sums and reduceat over the runs), so many spectra cost
+about the same as one.
+
+To Run:
+----------
+The normalized spectra (normJHHMMSS.suffix, see normalizeSpectra.py) of the
+objects in the *.card files, one line per spectrum to --summary and one line
+per trough to --out:
+
+$> ./troughs.py J*.card [--smoothwidth 3] [--summary BAL_outfile.dat]
+                        [--out troughs_outfile.dat]
+
+HISTORY
+--------------------------------------------------------------------------------
+2026-10-17 - created
+--------------------------------------------------------------------------------
+'''
+#Libraries used
+import numpy as np
+import argparse
+import os.path
+import normalizeSpectra as ns
+import resample
+
+lightspeed=299792.458 #km/s
+
+def velocity(lam):
+    '''
+    outflow velocity (km/s, positive blueward) of rest-frame lam, from civ_0b
+    '''
+    return lightspeed*(ns.civ_0b-np.asarray(lam,dtype=float))/ns.civ_0b
+
+def stackSpectra(lams,fluxes):
+    '''
+    Concatenates many spectra (sorted in lambda each), returns lam, flux,
+    the width of each pixel in lambda, and the spectrum (group) each pixel
+    belongs to.
+    '''
+    lam,flux,dlam,group=[],[],[],[]
+    for i in range(len(lams)):
+        l=np.asarray(lams[i],dtype=float)
+        order=np.argsort(l,kind='mergesort')
+        lam.append(l[order])
+        flux.append(np.asarray(fluxes[i],dtype=float)[order])
+        dlam.append(np.diff(resample.pixelEdges(lam[-1])) if len(l)>1 else np.zeros(len(l)))
+        group.append(np.zeros(len(l),dtype=int)+i)
+    return (np.concatenate(lam+[np.zeros(0)]),np.concatenate(flux+[np.zeros(0)]),
+            np.concatenate(dlam+[np.zeros(0)]),np.concatenate(group+[np.zeros(0,dtype=int)]))
+
+def runs(mask,group):
+    '''
+    start and end (exclusive) indices of the runs of True in mask, a run
+    never crosses from one spectrum (group) to the next
+    '''
+    same=group[1:]==group[:-1]
+    prev=np.concatenate(([False],mask[:-1]&same))
+    nxt=np.concatenate((mask[1:]&same,[False]))
+    return np.flatnonzero(mask&~prev),np.flatnonzero(mask&~nxt)+1
+
+def cumulative(v):
+    '''
+    cumulative sum with a leading 0, the sum over [a,b) is c[b]-c[a]
+    '''
+    return np.concatenate(([0.],np.cumsum(v)))
+
+def runMax(v,starts,ends):
+    '''
+    maximum of v over each run [start,end)
+    '''
+    if len(starts)==0:
+        return np.zeros(0)
+    idx=np.column_stack((starts,ends)).ravel()
+    return np.maximum.reduceat(np.append(v,0.),idx)[::2]
+
+def findTroughs(lams,fluxes,level=0.9,vrange=[0,29000],minWidth=450):
+    '''
+    The troughs of normalized rest-frame spectra (lists of lambda and flux
+    arrays): runs of pixels with flux<level, at vrange[0]<=v<=vrange[1]
+    km/s, at least minWidth km/s wide (the defaults are those of AI).
+    Returns a dictionary of arrays, one entry per trough, ordered by
+    spectrum and wavelength:
+    spec          : index of the spectrum in lams
+    lam1,lam2     : rest-frame extent (Angstroms)
+    vmin,vmax     : extent in velocity (km/s)
+    width         : width (km/s)
+    depth         : maximum of 1-flux
+    EW            : rest-frame equivalent width, integral of (1-f) dlambda
+    integral      : integral of (1-f) dv (km/s), summed per spectrum this is AI
+    lam           : centroid, weighted by 1-flux (Angstroms), taken as the
+                    CIV (civ_0b) absorber location
+    civa,civb,siva,sivb,nva,nvb,lya : ionLocations() of lam
+    '''
+    lam,flux,dlam,group=stackSpectra(lams,fluxes)
+    v=velocity(lam)
+    dv=lightspeed*dlam/ns.civ_0b
+    with np.errstate(invalid='ignore'):
+        mask=(flux<level)&(v>=vrange[0])&(v<=vrange[1])
+    starts,ends=runs(mask,group)
+    cumDv=cumulative(dv)
+    width=cumDv[ends]-cumDv[starts]
+    keep=width>=minWidth
+    starts,ends,width=starts[keep],ends[keep],width[keep]
+    absorbed=np.where(mask,1.-flux,0.)
+    cumEW=cumulative(absorbed*dlam)
+    cumLam=cumulative(absorbed*dlam*lam)
+    cumInt=cumulative(absorbed*dv)
+    EW=cumEW[ends]-cumEW[starts]
+    troughs={'spec':group[starts],
+             'lam1':lam[starts]-0.5*dlam[starts],
+             'lam2':lam[ends-1]+0.5*dlam[ends-1],
+             'width':width,
+             'depth':runMax(absorbed,starts,ends),
+             'EW':EW,
+             'integral':cumInt[ends]-cumInt[starts]}
+    troughs['vmin']=velocity(troughs['lam2'])
+    troughs['vmax']=velocity(troughs['lam1'])
+    with np.errstate(invalid='ignore',divide='ignore'):
+        troughs['lam']=(cumLam[ends]-cumLam[starts])/EW
+    troughs.update(ns.ionLocations(troughs['lam']))
+    return troughs
+
+def balnicity(lams,fluxes,level=0.9,vrange=[3000,25000],minWidth=2000):
+    '''
+    BALnicity index (km/s) of each normalized rest-frame spectrum: the
+    integral of (1-flux/level) dv over vrange, where a trough only counts
+    once it has been below level continuously for minWidth km/s (from its
+    low velocity, red, end).
+    '''
+    lam,flux,dlam,group=stackSpectra(lams,fluxes)
+    v=velocity(lam)
+    dv=lightspeed*dlam/ns.civ_0b
+    with np.errstate(invalid='ignore'):
+        mask=(flux<level)&(v>=vrange[0])&(v<=vrange[1])
+    starts,ends=runs(mask,group)
+    if len(starts)==0:
+        return np.zeros(len(lams))
+    #velocity covered from the red end of its trough to the blue edge of
+    #each pixel, the part of a pixel beyond minWidth counts
+    cumDv=cumulative(dv)
+    first=np.zeros(len(lam),dtype=int)
+    first[starts]=1
+    runEnd=ends[np.maximum(np.cumsum(first)-1,0)]
+    covered=cumDv[runEnd]-cumDv[:-1]
+    counted=np.where(mask,np.clip(covered-minWidth,0,dv),0.)
+    return np.bincount(group,(1.-np.where(mask,flux,level)/level)*counted,
+                       minlength=len(lams))
+
+def measureSpectra(spectra,specList=None,smoothWidth=3,smoothKernel='boxcar'):
+    '''
+    findTroughs() and balnicity() of the normalized rest-frame
+    spectra{label:(lambda,flux,...) array} in specList (default: all,
+    sorted), smoothed first by normalizeSpectra.smoothSpec() (smoothWidth=0
+    for none), so single noisy pixels neither break nor make troughs.
+    Returns summary{spec:{'BI','AI','ntrough'}} and the troughs, with
+    troughs['spec'] the labels.
+    '''
+    if specList is None:
+        specList=sorted(spectra)
+    lams=[spectra[spec][:,0] for spec in specList]
+    fluxes=[spectra[spec][:,1] for spec in specList]
+    if smoothWidth>0:
+        fluxes=[ns.smoothSpec(f,smoothWidth,smoothKernel) for f in fluxes]
+    troughs=findTroughs(lams,fluxes)
+    BI=balnicity(lams,fluxes)
+    AI=np.bincount(troughs['spec'],troughs['integral'],minlength=len(specList))
+    ntrough=np.bincount(troughs['spec'],minlength=len(specList))
+    summary={}
+    for i,spec in enumerate(specList):
+        summary[spec]={'BI':BI[i],'AI':AI[i],'ntrough':ntrough[i]}
+    troughs['spec']=np.array(specList+[''])[troughs['spec']]
+    return summary,troughs
+
+def measureCard(cardFile,smoothWidth=3,smoothKernel='boxcar'):
+    '''
+    measureSpectra() of the normalized spectra (normJHHMMSS.suffix files,
+    observed frame) of the object in a *.card file. Spectra that have not
+    been normalized yet are left out. Returns objInfo{}, summary{} and troughs.
+    '''
+    objInfo,paths,normFileList=ns.parseCard(cardFile)
+    spectra={}
+    for spec in sorted(normFileList):
+        if os.path.exists(normFileList[spec]):
+            data=np.loadtxt(normFileList[spec],usecols=(0,1),ndmin=2)
+            data[:,0]=data[:,0]/(1.+objInfo['zem'])
+            spectra[spec]=data
+    summary,troughs=measureSpectra(spectra,smoothWidth=smoothWidth,smoothKernel=smoothKernel)
+    return objInfo,summary,troughs
+
+troughColumns=['lam1','lam2','vmin','vmax','width','depth','EW','lam',
+               'civa','civb','siva','sivb','nva','nvb','lya']
+
+def writeTables(results,summaryFile,troughFile):
+    '''
+    Writes the (objInfo,summary,troughs) of measureCard() for many objects:
+    summaryFile gets one line per spectrum (name spec MJD BI AI ntrough),
+    troughFile one line per trough (name spec and troughColumns).
+    '''
+    with open(summaryFile,'w') as f:
+        f.write('#name spec MJD BI AI ntrough\n')
+        for objInfo,summary,troughs in results:
+            for spec in sorted(summary):
+                s=summary[spec]
+                f.write('%s %s %.2f %.1f %.1f %d\n' % (objInfo['objName'][6:],spec,objInfo[spec],
+                                                      s['BI'],s['AI'],s['ntrough']))
+    with open(troughFile,'w') as f:
+        f.write('#name spec '+' '.join(troughColumns)+'\n')
+        for objInfo,summary,troughs in results:
+            for i in range(len(troughs['spec'])):
+                f.write(objInfo['objName'][6:]+' '+troughs['spec'][i]+' '+
+                        ' '.join('%.2f' % troughs[c][i] for c in troughColumns[:5])+' '+
+                        '%.3f %.2f ' % (troughs['depth'][i],troughs['EW'][i])+
+                        ' '.join('%.2f' % troughs[c][i] for c in troughColumns[7:])+'\n')
+
+def main(argv=None):
+    '''
+    The command line program, argv defaults to sys.argv[1:]. Returns the
+    exit status.
+    '''
+    import glob
+    parser=argparse.ArgumentParser(description='Find the absorption troughs and BI/AI of normalized spectra.')
+    parser.add_argument('cards',nargs='+',help='JHHMMSS.card files (or glob patterns)')
+    parser.add_argument('--smoothwidth',type=float,default=3,
+                        help='boxcar smoothing before the search, pixels (0: none, default: %(default)s)')
+    parser.add_argument('--summary',default='BAL_outfile.dat',
+                        help='one line per spectrum (default: %(default)s)')
+    parser.add_argument('--out',default='troughs_outfile.dat',
+                        help='one line per trough (default: %(default)s)')
+    args=parser.parse_args(argv)
+    cardList=[]
+    for c in args.cards:
+        cardList.extend(sorted(glob.glob(c)) or [c])
+    results=[]
+    nfail=0
+    for card in cardList:
+        try:
+            results.append(measureCard(card,args.smoothwidth))
+        except (IOError,ValueError,IndexError) as e:
+            nfail+=1
+            print '*** FAILED',card,'--',e.__class__.__name__+': '+str(e)
+    writeTables(results,args.summary,args.out)
+    nspec=sum(len(r[1]) for r in results)
+    nbal=sum(1 for r in results for spec in r[1] if r[1][spec]['BI']>0)
+    print '***Measured',nspec,'spectra of',len(results),'objects,',nbal,'with BI>0'
+    print '***Wrote',args.summary,'and',args.out
+    return 1 if nfail>0 else 0
+
+if __name__=='__main__':
+    import sys
+    sys.exit(main())